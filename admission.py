@@ -0,0 +1,315 @@
+"""Admission control and fair scheduling for rag_chain calls.
+
+Nothing stopped one session from hammering Enter and spending the Groq
+rate limit for everyone. AdmissionController sits in front of the chain:
+
+- each session has a token bucket; a question asked faster than that is
+  rejected straight away with a retry-after hint
+- a global token bucket and a cap on concurrent chain calls keep the
+  process under the Groq limits
+- callers that can't start yet wait in a fair queue: sessions take turns
+  round-robin, so one busy session can't push everyone else back
+- waiters are told their queue position and an estimated wait, and give up
+  with a rejection when the queue is full or the wait runs too long
+
+    ADMISSION=off                  no limits
+    ADMISSION_MAX_CONCURRENT=4     chain calls running at once
+    ADMISSION_SESSION_RATE=0.2     questions per second per session (refill)
+    ADMISSION_SESSION_BURST=3      questions a session can ask back to back
+    ADMISSION_GLOBAL_RATE=0.5      chain calls per second for the process
+    ADMISSION_GLOBAL_BURST=10
+    ADMISSION_MAX_QUEUE=50         waiting callers before new ones are turned away
+    ADMISSION_MAX_WAIT=60          seconds a caller waits before giving up
+"""
+import asyncio
+import contextlib
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+
+from opentelemetry import trace
+
+RATE_LIMITED = "rate_limited"
+QUEUE_FULL = "queue_full"
+TIMED_OUT = "timed_out"
+
+MESSAGES = {
+    RATE_LIMITED: "You're asking questions faster than we can answer them. Please wait a moment.",
+    QUEUE_FULL: "We're answering a lot of questions right now. Please try again shortly.",
+    TIMED_OUT: "We're answering a lot of questions right now and couldn't get to yours in time. Please try again.",
+}
+
+
+class Rejected(Exception):
+    def __init__(self, reason, retry_after):
+        super().__init__(MESSAGES[reason])
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def try_take(self, now=None):
+        self._refill(time.monotonic() if now is None else now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def wait_time(self, now=None):
+        # Seconds until a token is available
+        self._refill(time.monotonic() if now is None else now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+
+class Waiter:
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.enqueued = time.monotonic()
+        self.granted = False
+        self.event = threading.Event()
+
+    def wake(self):
+        self.event.set()
+
+    def wait(self, timeout):
+        self.event.wait(timeout)
+        self.event.clear()
+
+
+class AsyncWaiter(Waiter):
+    def __init__(self, session_id):
+        super().__init__(session_id)
+        self.loop = asyncio.get_running_loop()
+        self.event = asyncio.Event()
+
+    def wake(self):
+        # Grants can come from any thread
+        self.loop.call_soon_threadsafe(self.event.set)
+
+    async def wait(self, timeout):
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self.event.clear()
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent=4, session_rate=0.2, session_burst=3, global_rate=0.5, global_burst=10,
+                 max_queue=50, max_wait=60.0, poll_interval=1.0, idle_session_ttl=3600):
+        self.max_concurrent = max_concurrent
+        self.session_rate = session_rate
+        self.session_burst = session_burst
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.poll_interval = poll_interval
+        self.idle_session_ttl = idle_session_ttl
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+
+        self._lock = threading.Lock()
+        self._session_buckets = {}
+        # session id -> deque of waiters, in round-robin order
+        self._queues = OrderedDict()
+        self.queue_depth = 0
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = {RATE_LIMITED: 0, QUEUE_FULL: 0, TIMED_OUT: 0}
+        self.max_queue_depth = 0
+        self.waits = deque(maxlen=500)
+        self.service_seconds = None
+
+    def check_session(self, session_id):
+        # Spends one of the session's tokens or raises Rejected
+        with self._lock:
+            now = time.monotonic()
+            bucket = self._session_buckets.get(session_id)
+            if bucket is None:
+                bucket = self._session_buckets[session_id] = TokenBucket(self.session_rate, self.session_burst)
+                self._forget_idle_sessions(now)
+            if bucket.try_take(now):
+                return
+            self.rejected[RATE_LIMITED] += 1
+            raise Rejected(RATE_LIMITED, bucket.wait_time(now))
+
+    def _forget_idle_sessions(self, now):
+        idle = [
+            session_id for session_id, bucket in self._session_buckets.items()
+            if now - bucket.updated > self.idle_session_ttl and session_id not in self._queues
+        ]
+        for session_id in idle:
+            del self._session_buckets[session_id]
+
+    def _dispatch(self):
+        # Grants free slots to waiters, one session at a time; caller holds the lock
+        while self._queues and self.in_flight < self.max_concurrent and self.global_bucket.try_take():
+            session_id, waiters = next(iter(self._queues.items()))
+            waiter = waiters.popleft()
+            if waiters:
+                self._queues.move_to_end(session_id)
+            else:
+                del self._queues[session_id]
+            self.queue_depth -= 1
+            self.in_flight += 1
+            self.admitted += 1
+            waiter.granted = True
+            self.waits.append(time.monotonic() - waiter.enqueued)
+            waiter.wake()
+
+    def _position(self, waiter):
+        # 1-based place in the round-robin order; caller holds the lock
+        waiters = self._queues.get(waiter.session_id)
+        if waiters is None or waiter not in waiters:
+            return 0
+        index = waiters.index(waiter)
+        ahead = 0
+        before = True
+        for session_id, queued in self._queues.items():
+            if session_id == waiter.session_id:
+                before = False
+                ahead += index
+            else:
+                # Sessions earlier in the rotation get one more turn before ours
+                ahead += min(len(queued), index + 1 if before else index)
+        return ahead + 1
+
+    def _estimate(self, position):
+        # Seconds until this position is served, from the recent service time and global rate
+        service = self.service_seconds if self.service_seconds is not None else 2.0
+        by_slots = math.ceil(position / self.max_concurrent) * service
+        by_rate = max(0.0, position - self.global_bucket.tokens) / self.global_bucket.rate
+        return max(by_slots, by_rate)
+
+    def _enqueue(self, waiter):
+        with self._lock:
+            if self.queue_depth >= self.max_queue:
+                self.rejected[QUEUE_FULL] += 1
+                raise Rejected(QUEUE_FULL, self._estimate(self.queue_depth))
+            self._queues.setdefault(waiter.session_id, deque()).append(waiter)
+            self.queue_depth += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+            self._dispatch()
+
+    def _poll(self, waiter):
+        # Returns (position, estimated wait); 0 once granted. Raises Rejected past max_wait
+        with self._lock:
+            self._dispatch()
+            if waiter.granted:
+                return 0, 0.0
+            if time.monotonic() - waiter.enqueued >= self.max_wait:
+                self._remove(waiter)
+                self.rejected[TIMED_OUT] += 1
+                raise Rejected(TIMED_OUT, self._estimate(self.queue_depth + 1))
+            position = self._position(waiter)
+            return position, self._estimate(position)
+
+    def _remove(self, waiter):
+        # Caller holds the lock
+        waiters = self._queues.get(waiter.session_id)
+        if waiters is not None and waiter in waiters:
+            waiters.remove(waiter)
+            self.queue_depth -= 1
+            if not waiters:
+                del self._queues[waiter.session_id]
+
+    def _next_wake(self):
+        with self._lock:
+            return min(self.poll_interval, max(0.01, self.global_bucket.wait_time()))
+
+    def _abandon(self, waiter):
+        with self._lock:
+            if waiter.granted:
+                self._release(None)
+            else:
+                self._remove(waiter)
+
+    def _release(self, started):
+        # Caller holds the lock
+        self.in_flight -= 1
+        if started is not None:
+            elapsed = time.monotonic() - started
+            self.service_seconds = elapsed if self.service_seconds is None else 0.8 * self.service_seconds + 0.2 * elapsed
+        self._dispatch()
+
+    def release(self, started=None):
+        with self._lock:
+            self._release(started)
+
+    def acquire(self, session_id, on_wait=None):
+        # Blocks until a slot is free; on_wait(position, estimated seconds) is
+        # called while queued. Pair with release(), or use admit()
+        waiter = Waiter(session_id)
+        self._enqueue(waiter)
+        try:
+            while True:
+                position, eta = self._poll(waiter)
+                if waiter.granted:
+                    break
+                if on_wait is not None:
+                    on_wait(position, eta)
+                waiter.wait(self._next_wake())
+        except BaseException:
+            self._abandon(waiter)
+            raise
+        trace.get_current_span().set_attribute("rag.queue_wait", time.monotonic() - waiter.enqueued)
+
+    async def aacquire(self, session_id, on_wait=None):
+        waiter = AsyncWaiter(session_id)
+        self._enqueue(waiter)
+        try:
+            while True:
+                position, eta = self._poll(waiter)
+                if waiter.granted:
+                    break
+                if on_wait is not None:
+                    on_wait(position, eta)
+                await waiter.wait(self._next_wake())
+        except BaseException:
+            self._abandon(waiter)
+            raise
+        trace.get_current_span().set_attribute("rag.queue_wait", time.monotonic() - waiter.enqueued)
+
+    @contextlib.contextmanager
+    def admit(self, session_id, on_wait=None):
+        self.acquire(session_id, on_wait)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(started)
+
+    @contextlib.asynccontextmanager
+    async def aadmit(self, session_id, on_wait=None):
+        await self.aacquire(session_id, on_wait)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(started)
+
+    def stats(self):
+        with self._lock:
+            waits = sorted(self.waits)
+            return {
+                "queue_depth": self.queue_depth,
+                "max_queue_depth": self.max_queue_depth,
+                "in_flight": self.in_flight,
+                "waiting_sessions": len(self._queues),
+                "admitted": self.admitted,
+                "rejected": dict(self.rejected),
+                "wait_p50": waits[len(waits) // 2] if waits else 0.0,
+                "wait_p95": waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0.0,
+                "service_seconds": self.service_seconds,
+            }
+
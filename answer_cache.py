@@ -0,0 +1,181 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize_question(question):
+    # "What are his skills?" and "what are his  skills" share one key
+    question = re.sub(r"[^\w\s]", " ", question.lower())
+    return " ".join(question.split())
+
+
+def index_fingerprint(persist_directory, template):
+    # Changes whenever the persisted vectorstore or the prompt template changes
+    digest = hashlib.sha256(template.encode("utf-8"))
+    for root, dirs, files in os.walk(persist_directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.endswith("-journal"):
+                continue
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            relpath = os.path.relpath(path, persist_directory)
+            digest.update(f"{relpath}:{stat.st_size}:{stat.st_mtime_ns}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class SemanticAnswerCache:
+    # LRU + TTL cache of final answers, keyed on the normalized question and,
+    # failing an exact match, on query-embedding cosine similarity. With a
+    # shared_cache.SharedStore, local misses fall through to the answers
+    # other worker processes on this host have stored.
+
+    def __init__(self, embed_query, fingerprint_fn, max_entries=256, ttl_seconds=3600,
+                 similarity_threshold=0.92, fingerprint_interval=30, store=None):
+        self.embed_query = embed_query
+        self.fingerprint_fn = fingerprint_fn
+        self.store = store
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.fingerprint_interval = fingerprint_interval
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (answer, unit vector, created_at)
+        self._fingerprint = fingerprint_fn()
+        self._fingerprint_checked_at = time.monotonic()
+
+        self.hits = 0
+        self.semantic_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def lookup(self, question, vector=None):
+        # Returns (answer or None, query vector); pass the vector back to put()
+        # so a miss doesn't embed the question twice. Callers that already
+        # embedded the question can pass the vector in.
+        key = normalize_question(question)
+        with self._lock:
+            self._check_fingerprint()
+            self._expire()
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0], entry[1]
+            fingerprint = self._fingerprint
+
+        if self.store is not None:
+            answer, stored_vector = self.store.get_answer(key, fingerprint)
+            if answer is not None:
+                self._remember(key, answer, stored_vector, shared=True)
+                return answer, stored_vector
+
+        if vector is None:
+            vector = self.embed_query(question)
+        vector = self._unit(vector)
+        with self._lock:
+            match = self._nearest(vector)
+            if match is not None:
+                self._entries.move_to_end(match)
+                self.hits += 1
+                self.semantic_hits += 1
+                return self._entries[match][0], vector
+
+        if self.store is not None:
+            answer = self.store.nearest_answer(vector, fingerprint, self.similarity_threshold)
+            if answer is not None:
+                with self._lock:
+                    self.semantic_hits += 1
+                self._remember(key, answer, vector, shared=True)
+                return answer, vector
+        with self._lock:
+            self.misses += 1
+        return None, vector
+
+    def get(self, question):
+        return self.lookup(question)[0]
+
+    def put(self, question, answer, vector=None):
+        if not answer or not answer.strip():
+            # An empty answer is a failed call, not something to serve again
+            return
+        vector = self._unit(self.embed_query(question) if vector is None else vector)
+        key = normalize_question(question)
+        self._remember(key, answer, vector)
+        if self.store is not None:
+            self.store.put_answer(key, self._fingerprint, answer, vector)
+
+    def _remember(self, key, answer, vector, shared=False):
+        with self._lock:
+            if shared:
+                self.hits += 1
+                self.shared_hits += 1
+            self._entries[key] = (answer, vector, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _nearest(self, vector):
+        if not self._entries:
+            return None
+        keys = list(self._entries)
+        matrix = np.stack([self._entries[key][1] for key in keys])
+        scores = matrix @ vector
+        best = int(np.argmax(scores))
+        if scores[best] >= self.similarity_threshold:
+            return keys[best]
+        return None
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.ttl_seconds
+        # Insertion order is not creation order after move_to_end, so scan everything
+        expired = [key for key, entry in self._entries.items() if entry[2] < cutoff]
+        for key in expired:
+            del self._entries[key]
+            self.evictions += 1
+
+    def _check_fingerprint(self):
+        now = time.monotonic()
+        if now - self._fingerprint_checked_at < self.fingerprint_interval:
+            return
+        self._fingerprint_checked_at = now
+        fingerprint = self.fingerprint_fn()
+        if fingerprint != self._fingerprint:
+            self._fingerprint = fingerprint
+            self._entries.clear()
+            self.invalidations += 1
+            if self.store is not None:
+                self.store.drop_fingerprints_except(fingerprint)
+
+    @staticmethod
+    def _unit(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
@@ -0,0 +1,242 @@
+"""Headless HTTP API over the same RAG chain, prompt and answer cache as app.py.
+
+Runs on a single asyncio event loop (tornado); the chain is driven with
+ainvoke/astream so one worker holds many in-flight Groq calls without a
+thread per request.
+
+    python api.py [--port 8000]
+
+    POST /v1/answer         {"question": "..."} -> {"answer": ..., "cached": ..., "degraded": ..., "route": ..., "latency": {...}}
+    POST /v1/answer/stream  same body, answered as server-sent events: a "fallback"
+                            event if the deadline passes first, "token" events,
+                            then one "done" (or "error") event
+
+Past the request deadline (DEADLINE_SECONDS, see deadline.py) /v1/answer
+returns an extractive answer with "degraded": true.
+
+An X-Session-Id header (default: the client address) selects the
+per-session rate limit; rejected questions get a 429 with Retry-After.
+    GET  /healthz           process is up
+    GET  /readyz            503 until the model, embeddings and vectorstore are warm
+    GET  /metrics           cache, router, queue and request counters
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import tornado.iostream
+import tornado.web
+
+import rag
+from admission import Rejected
+
+stats = {"requests": 0, "streams": 0, "errors": 0, "rejected": 0, "degraded": 0, "in_flight": 0}
+
+
+async def precheck(question):
+    # Routing and the cache lookup embed the question, which is CPU bound,
+    # so keep them off the event loop
+    return await asyncio.to_thread(rag.precheck, question)
+
+
+class BaseHandler(tornado.web.RequestHandler):
+    def write_json(self, payload, status=200):
+        self.set_status(status)
+        self.set_header("Content-Type", "application/json")
+        self.finish(json.dumps(payload))
+
+    def read_question(self):
+        try:
+            question = json.loads(self.request.body or b"{}").get("question", "")
+        except (ValueError, AttributeError):
+            question = ""
+        if not isinstance(question, str) or not question.strip():
+            raise tornado.web.HTTPError(400, reason='Body must be JSON with a non-empty "question"')
+        return question.strip()
+
+    def session_id(self):
+        return self.request.headers.get("X-Session-Id") or self.request.remote_ip
+
+    def write_error(self, status_code, **kwargs):
+        self.write_json({"error": self._reason}, status=status_code)
+
+
+class AnswerHandler(BaseHandler):
+    async def post(self):
+        question = self.read_question()
+        stats["requests"] += 1
+        stats["in_flight"] += 1
+        started = time.perf_counter()
+        try:
+            with rag.request_span(question, self.session_id()) as span:
+                answer, source, vector = await precheck(question)
+                cached = source in ("cache", "faq")
+                span.set_attribute("rag.route", source or "chain")
+                span.set_attribute("rag.cache_hit", cached)
+                degraded = False
+                if answer is None:
+                    # Load the chain off the event loop on first use
+                    await asyncio.to_thread(rag.get_rag_chain)
+                    # A degraded answer's full version is cached when it arrives
+                    answer, degraded, _ = await rag.ainvoke_with_deadline(question, vector, self.session_id(), started)
+                    if degraded:
+                        stats["degraded"] += 1
+                    else:
+                        rag.get_answer_cache().put(question, answer, vector)
+        except Rejected as rejected:
+            stats["rejected"] += 1
+            self.set_header("Retry-After", str(max(1, round(rejected.retry_after))))
+            self.write_json({"error": str(rejected), "reason": rejected.reason, "retry_after": rejected.retry_after}, status=429)
+            return
+        except Exception as exc:
+            stats["errors"] += 1
+            self.write_json({"error": f"{type(exc).__name__}: {exc}"}, status=502)
+            return
+        finally:
+            stats["in_flight"] -= 1
+        total = time.perf_counter() - started
+        self.write_json({
+            "answer": answer, "cached": cached, "degraded": degraded, "route": source or "chain", "latency": {"total": total},
+        })
+
+
+class StreamHandler(BaseHandler):
+    async def send_event(self, event, payload):
+        self.write(f"event: {event}\ndata: {json.dumps(payload)}\n\n")
+        await self.flush()
+
+    async def post(self):
+        question = self.read_question()
+        stats["streams"] += 1
+        stats["in_flight"] += 1
+        self.set_header("Content-Type", "text/event-stream")
+        self.set_header("Cache-Control", "no-cache")
+        started = time.perf_counter()
+        first_token = None
+        chunks = []
+        try:
+            with rag.request_span(question, self.session_id()) as span:
+                answer, source, vector = await precheck(question)
+                cached = source in ("cache", "faq")
+                span.set_attribute("rag.route", source or "chain")
+                span.set_attribute("rag.cache_hit", cached)
+                if answer is not None:
+                    first_token = time.perf_counter() - started
+                    await self.send_event("token", {"text": answer})
+                else:
+                    await asyncio.to_thread(rag.get_rag_chain)
+                    # A "fallback" event carries a degraded answer once the
+                    # deadline passes; the tokens that follow replace it
+                    async for kind, text in rag.astream_with_deadline(question, vector, self.session_id(), started):
+                        if first_token is None:
+                            first_token = time.perf_counter() - started
+                        if kind == "fallback":
+                            stats["degraded"] += 1
+                            await self.send_event("fallback", {"answer": text, "degraded": True})
+                            continue
+                        chunks.append(text)
+                        await self.send_event("token", {"text": text})
+                    answer = "".join(chunks)
+                    rag.get_answer_cache().put(question, answer, vector)
+            total = time.perf_counter() - started
+            await self.send_event("done", {
+                "answer": answer,
+                "cached": cached,
+                "route": source or "chain",
+                "latency": {"first_token": first_token if first_token is not None else total, "total": total},
+            })
+        except tornado.iostream.StreamClosedError:
+            # Client went away; abandoning the generator cancels the upstream call
+            pass
+        except Rejected as rejected:
+            stats["rejected"] += 1
+            try:
+                await self.send_event("error", {"error": str(rejected), "reason": rejected.reason, "retry_after": rejected.retry_after})
+            except tornado.iostream.StreamClosedError:
+                pass
+        except Exception as exc:
+            stats["errors"] += 1
+            try:
+                await self.send_event("error", {"error": f"{type(exc).__name__}: {exc}"})
+            except tornado.iostream.StreamClosedError:
+                pass
+        finally:
+            stats["in_flight"] -= 1
+        if not self._finished:
+            self.finish()
+
+
+class HealthHandler(BaseHandler):
+    def get(self):
+        self.write_json({"status": "ok"})
+
+
+class ReadyHandler(BaseHandler):
+    def get(self):
+        components = {
+            "llm": rag.llm.ready,
+            "embeddings": rag.embeddings.ready,
+            "vectorstore": rag.vectorstore.ready,
+            "rag_chain": rag.rag_chain.ready,
+            "first_query": rag.first_query.ready,
+        }
+        ready = rag.is_ready()
+        self.write_json({"ready": ready, "components": components}, status=200 if ready else 503)
+
+
+class MetricsHandler(BaseHandler):
+    def get(self):
+        payload = {"api": dict(stats), "startup": rag.startup_report()}
+        if rag.answer_cache.ready:
+            payload["answer_cache"] = rag.get_answer_cache().stats()
+        if rag.faq.ready and rag.faq.get() is not None:
+            payload["faq"] = rag.faq.get().stats()
+        if rag.router.ready and rag.router.get() is not None:
+            payload["router"] = rag.router.get().stats()
+        if rag.llm.ready and hasattr(rag.llm.get(), "stats"):
+            payload["llm"] = rag.llm.get().stats()
+        if rag.shared_store.ready and rag.shared_store.get() is not None:
+            payload["shared_cache"] = rag.shared_store.get().stats()
+        if rag.query_log.ready and rag.query_log.get() is not None:
+            payload["query_log"] = rag.query_log.get().stats()
+        if rag.deadlines.ready and rag.deadlines.get() is not None:
+            payload["deadline"] = rag.deadlines.get().stats()
+        if rag.admission.ready and rag.admission.get() is not None:
+            payload["admission"] = rag.admission.get().stats()
+        if rag.single_flight.ready and rag.single_flight.get() is not None:
+            payload["single_flight"] = rag.single_flight.get().stats()
+        if rag.context_budgeter.ready:
+            payload["context_budget"] = rag.context_budgeter.get().stats()
+        self.write_json(payload)
+
+
+def make_app():
+    return tornado.web.Application([
+        (r"/v1/answer", AnswerHandler),
+        (r"/v1/answer/stream", StreamHandler),
+        (r"/healthz", HealthHandler),
+        (r"/readyz", ReadyHandler),
+        (r"/metrics", MetricsHandler),
+    ])
+
+
+async def serve(port, address):
+    rag.configure_environment()
+    make_app().listen(port, address=address)
+    # /readyz flips to 200 once the warmup thread has loaded everything
+    rag.start_warmup()
+    print(f"Serving RAG API on http://{address}:{port}")
+    await asyncio.Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the resume RAG chain over HTTP.")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--address", default="127.0.0.1")
+    args = parser.parse_args()
+    asyncio.run(serve(args.port, args.address))
+
+
+if __name__ == "__main__":
+    main()
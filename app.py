@@ -1,76 +1,130 @@
 import streamlit as st
-from langchain_groq import ChatGroq
-from langchain_community.vectorstores import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_core.prompts import PromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
+import streamlit.components.v1 as components
 import os
-from dotenv import load_dotenv
+import time
+import uuid
+import rag
+from admission import Rejected
+from chat_history import ChatHistory, get_store, render_stats
+from ui_stats import CLIENT_PROBE, run_stats
 
 # Set the page configuration at the very top
 st.set_page_config(page_title="Utsav Soni Resume Q&A", page_icon=":books:", layout="wide")
 
-load_dotenv()
-
-# Setting API keys
-os.environ["GROQ_API_KEY"] = os.getenv("GROQ_API_KEY")
-os.environ["LANGCHAIN_API_KEY"] = os.getenv("LANGSMITH_API_KEY")
-os.environ["LANGCHAIN_TRACING_V2"] = "true"
-os.environ["LANGCHAIN_PROJECT"] = "CHATBOT1"
-
-llm = ChatGroq(model="llama3-8b-8192")
-
-# Load vectorstore
+# Runs once per process rather than on every rerun: API keys, the
+# background load of ChatGroq, the embeddings and Chroma (see rag.py for
+# the startup profile), and the answer cache shared by all sessions.
 @st.cache_resource
-def load_vectorstore():
-    return Chroma(persist_directory="./chroma_db", embedding_function=HuggingFaceEmbeddings())
-
-vectorstore = load_vectorstore()
-retriever = vectorstore.as_retriever(search_type="similarity", search_kwargs={"k": 4})
-
-# Define the RAG prompt template
-# template = """Use the following pieces of context to answer..."""  # Keep your existing prompt here
-template = """Use the following pieces of context to answer.
-You are directly answering to recruiter so don't say anything negative about Utsav Soni and his professional career.
-If question asked you something about Utsav Soni your response must be of 5 line atleast.
-If question is generalised not asking any information about Utsav Soni at that time only, say Thank you for bringing that up! I understand your concern, for more information contact Utsav Soni.
-Read question carefully and answer based on the question asked. Your answer must be related and properly aligned to question.
-If you don't know the answer or negative question asked, just say that Thank you for bringing that up! I understand your concern, for more information contact Utsav Soni.
-Don't make up an answer and lighten up the user about excellent things from Utsav Soni's Professional Career.
-Do not reply to rephrase the question asked, if question is greeting do reply greeting only that's it.
-Keep the answer as concise, positive, polite, professional as possible.
-convince the user.
-If user or recruiter asks a negative question about Utsav Soni, please answer that in a positive way by embracing Utsav Soni's skills according to the question asked.
-Never ever say negative things and negative thoughts about Utsav Soni in your completions.
-Utsav Soni is a very good candidate to hire, keep that in mind. It's very important to hire him. So give smart answers only.
-You are not supposed to rate Utsav Soni for any of his skills or experience for any job role instead answer showcasing Utsav's profile and skill.
-You are not supposed to give reasons and facts why Utsav Soni is not selected for the next round or why he is not the best fit for any of the posts the recruiter will mention.
-If you find the question completely irrelevant like the question is not asking something about Utsav Soni or his resume, please reply I am not trained for this. Thanks!
-Always say "Thanks for asking..!" at the end of the answer.
-Do not repeat greetings in your completion.
-you are not supposed to answer generalised question, you have to answer question related to Utsav Soni only.
-
-{context}
-
-Question: {question}
-
-Smart Answer:"""
-
-custom_rag_prompt = PromptTemplate.from_template(template)
-
-def format_docs(docs):
-    return "\n\n".join(doc.page_content for doc in docs)
-
-rag_chain = (
-    {"context": retriever | format_docs, "question": RunnablePassthrough()}
-    | custom_rag_prompt
-    | llm
-    | StrOutputParser()
-)
-
-def main():
-    st.markdown("""
+def setup():
+    rag.configure_environment()
+    rag.start_warmup()
+    return rag.get_answer_cache()
+
+answer_cache = setup()
+
+STREAM_ANSWERS = os.getenv("STREAM_ANSWERS", "true").lower() == "true"
+HISTORY_PAGE = int(os.getenv("CHAT_HISTORY_PAGE", "10"))
+SHOW_RENDER_STATS = os.getenv("CHAT_RENDER_STATS", "false").lower() == "true"
+
+# A question submit reruns only the chat panel, and "Load more" only the
+# history, instead of the whole script; CHAT_FRAGMENTS=off for full reruns
+fragment = st.fragment if os.getenv("CHAT_FRAGMENTS", "on").lower() != "off" else (lambda fn: fn)
+
+# Shown while the question waits for a free slot in the fair queue
+def queue_notice(placeholder):
+    def on_wait(position, eta):
+        placeholder.info(f"You're number {position} in line, about {eta:.0f}s to go...")
+    return on_wait
+
+# Past the request deadline the user gets an extractive answer from the
+# retrieved chunks, and the full answer replaces it if it turns up within
+# REPLACE_WAIT seconds
+DEGRADED_NOTE = "Quick answer taken straight from the resume, the full answer took too long."
+REPLACE_WAIT = float(os.getenv("DEADLINE_REPLACE_WAIT", "30"))
+
+def show_degraded(placeholder, answer):
+    placeholder.markdown(f"**Answer:** {answer}\n\n_{DEGRADED_NOTE} Still working on it..._")
+
+# Returns (answer, latency, pending); pending is the chain call still
+# working on a full answer to replace a degraded one, else None
+def answer_question(question, session_id):
+    started = time.perf_counter()
+    pending = None
+    with rag.request_span(question, session_id) as span:
+        answer, source, vector = rag.precheck(question)
+        span.set_attribute("rag.route", source or "chain")
+        span.set_attribute("rag.cache_hit", source in ("cache", "faq"))
+        if answer is None:
+            placeholder = st.empty()
+            answer, degraded, pending = rag.invoke_with_deadline(question, vector, session_id, queue_notice(placeholder), started)
+            placeholder.empty()
+            # A late full answer is cached by rag when it arrives
+            if not degraded:
+                answer_cache.put(question, answer, vector)
+    total = time.perf_counter() - started
+    return answer, {"first_token": total, "total": total}, pending
+
+# Render tokens as ChatGroq produces them; the completed answer is returned
+# for chat history once the stream is exhausted
+def stream_answer(question, session_id):
+    started = time.perf_counter()
+    with rag.request_span(question, session_id) as span:
+        answer, source, vector = rag.precheck(question)
+        span.set_attribute("rag.route", source or "chain")
+        span.set_attribute("rag.cache_hit", source in ("cache", "faq"))
+        if answer is not None:
+            total = time.perf_counter() - started
+            return answer, {"first_token": total, "total": total}, None
+
+        placeholder = st.empty()
+        first_token = None
+        fallback = None
+        chunks = []
+        try:
+            for kind, text in rag.stream_with_deadline(question, vector, session_id, queue_notice(placeholder), started):
+                if first_token is None:
+                    first_token = time.perf_counter() - started
+                if kind == "fallback":
+                    fallback = text
+                    show_degraded(placeholder, fallback)
+                    continue
+                chunks.append(text)
+                placeholder.markdown(f"**Answer:** {''.join(chunks)}▌")
+        except Exception:
+            # The chain failed after the fallback was shown; keep the fallback
+            if fallback is None:
+                raise
+            placeholder.empty()
+            total = time.perf_counter() - started
+            return fallback, {"first_token": first_token, "total": total, "degraded": True}, None
+        total = time.perf_counter() - started
+        # The finished answer is drawn by the chat history loop below
+        placeholder.empty()
+
+        answer = "".join(chunks)
+        answer_cache.put(question, answer, vector)
+    return answer, {"first_token": first_token if first_token is not None else total, "total": total}, None
+
+# Swaps the full answer into a degraded turn when the chain finishes; shown
+# on the next rerun. Goes through the history by seq, since the turn may
+# have been spilled to SQLite by then
+def replace_when_done(history, seq, latency, pending):
+    started = time.monotonic()
+
+    def done(future):
+        if future.cancelled() or future.exception() is not None or time.monotonic() - started > REPLACE_WAIT:
+            return
+        history.update(seq, future.result(), {key: value for key, value in latency.items() if key != "degraded"})
+    pending.add_done_callback(done)
+
+def load_more():
+    st.session_state.history_shown += HISTORY_PAGE
+
+def format_latency(latency):
+    text = f"First token in {latency['first_token']:.2f}s · total {latency['total']:.2f}s"
+    return f"{text} · {DEGRADED_NOTE}" if latency.get("degraded") else text
+
+PAGE_CSS = """
         <style>
         .main {
             background-color: #ffffff;
@@ -194,55 +248,104 @@ def main():
                 
 
         </style>
-        """, unsafe_allow_html=True)
-    
-    
-    # Static buttons on the sidebar
-    chatbot_button = st.sidebar.button("Chatbot")
-    social_media_button = st.sidebar.button("Social Media")
-
-    # Handle button clicks
-    if chatbot_button:
-        choice = "Chatbot"
-    elif social_media_button:
-        choice = "Social Media"
-    else:
-        choice = "Chatbot"  # Default option
-
-    if choice == "Chatbot":
-        st.title("Utsav Soni Resume Q&A")
+        """
 
-        # Initialize session state for chat history
-        if 'chat_history' not in st.session_state:
-            st.session_state.chat_history = []
+def show_page(page):
+    st.session_state.page = page
 
+@fragment
+def chat_panel():
+    with run_stats.measure("chat"):
         # Form for user input
         with st.form(key="user_input_form"):
             user_question = st.text_input("Ask a question about Utsav Soni's resume:")
             submit_button = st.form_submit_button(label="Enter")
 
         if submit_button and user_question:
-            with st.spinner("Generating answer..."):
-                response = rag_chain.invoke(user_question)
-            # Update chat history
-            st.session_state.chat_history.append({"question": user_question, "answer": response})
-
-        # Display chat history in reverse order
-        for chat in reversed(st.session_state.chat_history):
-            st.write(f"**Question:** {chat['question']}")
-            st.write(f"**Answer:** {chat['answer']}")
+            # A new question goes back to the first page, so the extra pages
+            # from "Load more" aren't redrawn on every later rerun
+            st.session_state.history_shown = HISTORY_PAGE
+            if not rag.is_ready():
+                with st.spinner("Loading the model, this only happens once..."):
+                    rag.warmup()
+            try:
+                if STREAM_ANSWERS:
+                    response, latency, pending = stream_answer(user_question, st.session_state.session_id)
+                else:
+                    with st.spinner("Generating answer..."):
+                        response, latency, pending = answer_question(user_question, st.session_state.session_id)
+            except Rejected as rejected:
+                st.warning(f"{rejected} You can try again in about {max(1, round(rejected.retry_after))}s.")
+            else:
+                # Update chat history
+                if pending is not None:
+                    latency["degraded"] = True
+                history = st.session_state.chat_history
+                seq = history.append({"question": user_question, "answer": response, "latency": latency})
+                if pending is not None:
+                    replace_when_done(history, seq, latency, pending)
+
+        history_panel()
+
+@fragment
+def history_panel():
+    with run_stats.measure("history"):
+        # Display chat history in reverse order, one page at a time
+        render_started = time.perf_counter()
+        history = st.session_state.chat_history
+        shown = history.latest(st.session_state.history_shown)
+        for chat in shown:
+            st.markdown(f"**Question:** {chat['question']}\n\n**Answer:** {chat['answer']}")
+            if "latency" in chat:
+                st.caption(format_latency(chat["latency"]))
             st.write("---")
+        if len(history) > len(shown):
+            st.button(f"Load more ({len(history) - len(shown)} earlier)", on_click=load_more)
+        render_stats.record(time.perf_counter() - render_started, len(shown), len(history))
+        if SHOW_RENDER_STATS:
+            stats = render_stats.stats()
+            st.caption(f"History render p50 {stats['render_ms_p50']:.1f} ms, p95 {stats['render_ms_p95']:.1f} ms "
+                       f"({stats['last_rendered']} of {stats['last_total']} turns drawn)")
+            for kind, run in run_stats.stats().items():
+                st.caption(f"{kind} reruns: {run['runs']}, server CPU p50 {run['cpu_ms_p50']:.1f} ms, "
+                           f"p95 {run['cpu_ms_p95']:.1f} ms, wall p50 {run['wall_ms_p50']:.1f} ms")
 
-
-    elif choice == "Social Media":
-        st.title("Connect with Utsav Soni")
-        st.write("Follow Utsav Soni on social media:")
-        linkedin_button = """
-            <a href="https://www.linkedin.com/in/utsav-soni-9067b31b3" target="_blank" class="custom-button" color="black">
-                LinkedIn
-            </a>
-            """
-        st.markdown(linkedin_button, unsafe_allow_html=True)
+def main():
+    with run_stats.measure("page"):
+        st.markdown(PAGE_CSS, unsafe_allow_html=True)
+
+        # Static buttons on the sidebar; the page shown is kept across reruns
+        st.sidebar.button("Chatbot", on_click=show_page, args=("Chatbot",))
+        st.sidebar.button("Social Media", on_click=show_page, args=("Social Media",))
+        choice = st.session_state.get("page", "Chatbot")
+
+        if choice == "Chatbot":
+            st.title("Utsav Soni Resume Q&A")
+
+            # Identifies this browser session to the per-session rate limit
+            if 'session_id' not in st.session_state:
+                st.session_state.session_id = uuid.uuid4().hex
+            # Initialize session state for chat history; older turns spill to SQLite
+            if 'chat_history' not in st.session_state:
+                st.session_state.chat_history = ChatHistory(st.session_state.session_id, get_store())
+            if 'history_shown' not in st.session_state:
+                st.session_state.history_shown = HISTORY_PAGE
+
+            chat_panel()
+            if SHOW_RENDER_STATS:
+                # st.iframe replaces components.html in newer Streamlit releases
+                embed = getattr(st, "iframe", None) or components.html
+                embed(CLIENT_PROBE, height=24)
+
+        elif choice == "Social Media":
+            st.title("Connect with Utsav Soni")
+            st.write("Follow Utsav Soni on social media:")
+            linkedin_button = """
+                <a href="https://www.linkedin.com/in/utsav-soni-9067b31b3" target="_blank" class="custom-button" color="black">
+                    LinkedIn
+                </a>
+                """
+            st.markdown(linkedin_button, unsafe_allow_html=True)
 
        
 if __name__ == "__main__":
@@ -0,0 +1,196 @@
+"""Run a file of questions through rag_chain and write JSONL results.
+
+Questions come from a text file (one per line) or a JSONL file with
+"question" and optional "id" fields. Items run through rag_chain's
+abatch machinery with a concurrency cap and an optional LLM rate limit;
+each result is appended as soon as it completes, so an interrupted run
+picks up where it stopped and only retries unfinished or failed items.
+
+    python batch.py questions.txt results.jsonl --concurrency 8 --rate 2
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+import rag
+
+
+class StageTimer(BaseCallbackHandler):
+    # Collects per-stage wall time for one question from LangChain callbacks
+
+    def __init__(self):
+        self._started = {}
+        self.stages = {}
+        self.tokens = {}
+        self.first_token = None
+        self.chunks = 0
+        self._llm_started = None
+
+    def _start(self, run_id):
+        self._started[run_id] = time.perf_counter()
+
+    def _end(self, run_id, stage):
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            self.stages[stage] = self.stages.get(stage, 0.0) + time.perf_counter() - started
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        if parent_run_id is None:
+            self._start(run_id)
+
+    def on_chain_end(self, outputs, *, run_id, parent_run_id=None, **kwargs):
+        if parent_run_id is None:
+            self._end(run_id, "total")
+
+    def on_chain_error(self, error, *, run_id, parent_run_id=None, **kwargs):
+        if parent_run_id is None:
+            self._end(run_id, "total")
+
+    def on_retriever_start(self, serialized, query, *, run_id, **kwargs):
+        self._start(run_id)
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        self.chunks = len(documents)
+        self._end(run_id, "retrieval")
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id)
+        self._llm_started = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id)
+        self._llm_started = time.perf_counter()
+
+    def on_llm_new_token(self, token, **kwargs):
+        if self.first_token is None and self._llm_started is not None:
+            self.first_token = time.perf_counter() - self._llm_started
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._end(run_id, "llm")
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        if not usage:
+            # Streaming responses carry usage on the message instead
+            for generations in response.generations:
+                for generation in generations:
+                    metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                    usage = {
+                        name: metadata[key]
+                        for name, key in (("prompt_tokens", "input_tokens"), ("completion_tokens", "output_tokens"),
+                                          ("total_tokens", "total_tokens"))
+                        if key in metadata
+                    }
+        self.tokens = {key: usage[key] for key in ("prompt_tokens", "completion_tokens", "total_tokens") if key in usage}
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, "llm")
+
+    def latency(self):
+        latency = {stage: round(seconds, 4) for stage, seconds in self.stages.items()}
+        if "total" in latency:
+            latency["other"] = round(latency["total"] - latency.get("retrieval", 0.0) - latency.get("llm", 0.0), 4)
+        return latency
+
+
+def question_id(question):
+    return hashlib.sha1(question.strip().encode("utf-8")).hexdigest()[:12]
+
+
+def read_questions(path):
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if path.endswith(".jsonl"):
+                record = json.loads(line)
+                question = record["question"]
+                items.append((str(record.get("id") or question_id(question)), question))
+            else:
+                items.append((question_id(line), line))
+    # Duplicate questions only need answering once
+    return list(dict(items).items())
+
+
+def completed_ids(path):
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A run killed mid-write can leave a partial last line
+                continue
+            if record.get("error") is None:
+                done.add(record["id"])
+    return done
+
+
+async def run_batch(items, output_path, concurrency=4, rate=None):
+    chain = rag.get_rag_chain()
+    if rate:
+        from langchain_core.rate_limiters import InMemoryRateLimiter
+        rag.get_llm().rate_limiter = InMemoryRateLimiter(
+            requests_per_second=rate, check_every_n_seconds=0.05, max_bucket_size=max(1, concurrency)
+        )
+
+    timers = [StageTimer() for _ in items]
+    configs = [{"callbacks": [timer], "max_concurrency": concurrency, "run_name": "batch_question"} for timer in timers]
+    summary = {"ok": 0, "failed": 0}
+    with open(output_path, "a", encoding="utf-8") as out:
+        async for index, result in chain.abatch_as_completed(
+            [question for _, question in items], config=configs, return_exceptions=True
+        ):
+            item_id, question = items[index]
+            timer = timers[index]
+            record = {
+                "id": item_id,
+                "question": question,
+                "answer": None if isinstance(result, Exception) else result,
+                "error": f"{type(result).__name__}: {result}" if isinstance(result, Exception) else None,
+                "latency": timer.latency(),
+                "first_token": timer.first_token,
+                "retrieved_chunks": timer.chunks,
+                "tokens": timer.tokens,
+                "finished_at": time.time(),
+            }
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+            summary["failed" if record["error"] else "ok"] += 1
+            print(f"[{summary['ok'] + summary['failed']}/{len(items)}] {item_id} "
+                  f"{'ERROR' if record['error'] else 'ok'} {record['latency'].get('total', 0):.2f}s", flush=True)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a file of questions with the RAG chain.")
+    parser.add_argument("questions", help="questions file (.txt, one per line, or .jsonl with a question field)")
+    parser.add_argument("output", help="JSONL results file; existing successful results are skipped")
+    parser.add_argument("--concurrency", type=int, default=4, help="max questions in flight")
+    parser.add_argument("--rate", type=float, default=None, help="max LLM requests per second")
+    args = parser.parse_args()
+
+    rag.configure_environment()
+    items = read_questions(args.questions)
+    done = completed_ids(args.output)
+    todo = [item for item in items if item[0] not in done]
+    print(f"{len(items)} questions, {len(items) - len(todo)} already answered, {len(todo)} to run")
+    if not todo:
+        return
+
+    started = time.perf_counter()
+    summary = asyncio.run(run_batch(todo, args.output, concurrency=args.concurrency, rate=args.rate))
+    elapsed = time.perf_counter() - started
+    print(f"Done: {summary['ok']} ok, {summary['failed']} failed in {elapsed:.1f}s "
+          f"({len(todo) / elapsed:.2f} questions/s)")
+
+
+if __name__ == "__main__":
+    main()
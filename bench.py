@@ -0,0 +1,250 @@
+"""Offline latency benchmark for the RAG pipeline.
+
+Runs the real embeddings and ./chroma_db with a deterministic fake chat
+model in place of ChatGroq, so results are repeatable and cost nothing.
+Reports p50/p95/p99 per stage (embedding, search, format_docs, prompt,
+LLM, output parsing), end-to-end throughput at several concurrency
+levels, startup load times and peak memory, and saves everything as JSON.
+Peak Python heap is traced in a pass of its own after the timed runs,
+while answering each query once. The shared cache is turned off so that
+repeated queries reach the encoder, and the search stage goes through
+whichever RETRIEVER_BACKEND is configured.
+
+    python bench.py [--repeats 20] [--concurrency 1 2 4 8] [--llm-latency 0.05]
+    python bench.py --compare bench_results/baseline.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import PromptTemplate
+
+import rag
+from numpy_index import DEFAULT_QUERIES
+
+RESULTS_DIR = "bench_results"
+
+# Roughly the length of a real answer, which the prompt asks to be 5+ lines
+FAKE_ANSWER = "\n".join([
+    "Utsav Soni brings strong hands-on experience in Python and machine learning.",
+    "He has built retrieval-augmented chatbots with LangChain, Chroma and Groq.",
+    "His projects show end-to-end ownership from data ingestion to deployment.",
+    "He communicates clearly and works well with cross-functional teams.",
+    "He is quick to learn new tools and focuses on measurable results.",
+    "Thanks for asking..!",
+])
+
+STAGES = ["embedding", "search", "format_docs", "prompt", "llm", "parse", "total"]
+
+
+def fake_llm(latency=0.0):
+    return FakeListChatModel(responses=[FAKE_ANSWER], sleep=latency or None)
+
+
+def percentiles(samples):
+    values = np.asarray(samples) * 1000
+    return {
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+        "p99": float(np.percentile(values, 99)),
+        "mean": float(values.mean()),
+        "n": int(values.size),
+    }
+
+
+def retriever_search(retriever, k=4):
+    # The configured retriever's own search path, as search(query, vector)
+    from langchain_core.vectorstores import VectorStoreRetriever
+
+    from hybrid_retriever import HybridRetriever
+    from tracing import TracedRetriever
+
+    if isinstance(retriever, HybridRetriever):
+        return retriever.search
+    if isinstance(retriever, TracedRetriever):
+        return lambda query, vector: retriever.search(vector)
+    if hasattr(retriever, "index"):
+        # RETRIEVER_BACKEND=numpy or mmap
+        return lambda query, vector: retriever.index.search_documents(vector, k)
+    if isinstance(retriever, VectorStoreRetriever):
+        return lambda query, vector: retriever.vectorstore.similarity_search_by_vector(vector, k=k)
+    raise SystemExit(f"Don't know how to time the search stage of {type(retriever).__name__}")
+
+
+def bench_stages(queries, llm, repeats, k=4):
+    # Runs each stage by hand, in chain order, so every stage gets its own clock
+    # The encoder itself, even if the shared cache was already loaded
+    embeddings = getattr(rag.get_embeddings(), "inner", rag.get_embeddings())
+    search = retriever_search(rag.get_retriever(), k)
+    context_formatter = rag.get_context_formatter()
+    prompt = PromptTemplate.from_template(rag.template)
+    parser = StrOutputParser()
+    samples = {stage: [] for stage in STAGES}
+
+    for _ in range(repeats):
+        for query in queries:
+            marks = [time.perf_counter()]
+            vector = embeddings.embed_query(query)
+            marks.append(time.perf_counter())
+            docs = search(query, vector)
+            marks.append(time.perf_counter())
+            context = context_formatter.invoke(docs) if hasattr(context_formatter, "invoke") else context_formatter(docs)
+            marks.append(time.perf_counter())
+            prompt_value = prompt.invoke({"context": context, "question": query})
+            marks.append(time.perf_counter())
+            message = llm.invoke(prompt_value)
+            marks.append(time.perf_counter())
+            parser.invoke(message)
+            marks.append(time.perf_counter())
+            for stage, start, end in zip(STAGES, marks, marks[1:]):
+                samples[stage].append(end - start)
+            samples["total"].append(marks[-1] - marks[0])
+
+    return {stage: percentiles(values) for stage, values in samples.items()}
+
+
+def bench_throughput(queries, llm, levels, repeats):
+    chain = rag.build_rag_chain(rag.get_retriever(), llm, context=rag.get_context_formatter())
+    inputs = list(queries) * repeats
+    results = {}
+    for level in levels:
+        # FakeListChatModel overrides batch() and runs it serially, so drive
+        # concurrent invokes the way concurrent sessions would
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=level) as pool:
+            list(pool.map(chain.invoke, inputs))
+        elapsed = time.perf_counter() - started
+        results[str(level)] = {"questions": len(inputs), "seconds": elapsed, "qps": len(inputs) / elapsed}
+    return results
+
+
+def bench_memory(queries, llm):
+    # A separate pass, since tracing allocations slows down everything it watches
+    tracemalloc.start()
+    try:
+        bench_stages(queries, llm, 1)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(queries, repeats, levels, llm_latency):
+    # Repeated queries would otherwise time SQLite cache hits, not the encoder
+    os.environ["SHARED_CACHE"] = "off"
+    llm = fake_llm(llm_latency)
+    # Everything but ChatGroq, which the benchmark never touches
+    rag.get_retriever()
+    rag.first_query.get()
+    startup = rag.startup_report()
+
+    stages = bench_stages(queries, llm, repeats)
+    throughput = bench_throughput(queries, llm, levels, max(1, repeats // 4))
+    traced_peak = bench_memory(queries, llm)
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "queries": len(queries),
+            "repeats": repeats,
+            "llm_latency": llm_latency,
+            "retriever_backend": os.getenv("RETRIEVER_BACKEND", "chroma"),
+            "embedding_backend": os.getenv("EMBEDDING_BACKEND", "hf"),
+        },
+        "startup": startup["loads"],
+        "stages_ms": stages,
+        "throughput": throughput,
+        "memory": {"peak_rss_mb": peak_rss_mb(), "peak_python_heap_mb": traced_peak / (1024 * 1024)},
+    }
+
+
+def print_report(result):
+    print(f"{'stage':<12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for stage, stats in result["stages_ms"].items():
+        print(f"{stage:<12}{stats['p50']:>10.3f}{stats['p95']:>10.3f}{stats['p99']:>10.3f}")
+    for level, stats in result["throughput"].items():
+        print(f"concurrency {level:>3}: {stats['qps']:.1f} questions/s")
+    memory = result["memory"]
+    rss = f"{memory['peak_rss_mb']:.0f} MB" if memory["peak_rss_mb"] is not None else "n/a"
+    print(f"peak RSS {rss}, peak Python heap {memory['peak_python_heap_mb']:.1f} MB")
+
+
+def print_comparison(baseline, result):
+    print(f"{'stage':<12}{'base p50':>10}{'new p50':>10}{'change':>9}{'base p95':>10}{'new p95':>10}{'change':>9}")
+    for stage, stats in result["stages_ms"].items():
+        base = baseline["stages_ms"].get(stage)
+        if base is None:
+            continue
+        row = f"{stage:<12}"
+        for key in ("p50", "p95"):
+            change = (stats[key] - base[key]) / base[key] * 100 if base[key] else 0.0
+            row += f"{base[key]:>10.3f}{stats[key]:>10.3f}{change:>+8.1f}%"
+        print(row)
+    for level, stats in result["throughput"].items():
+        base = baseline["throughput"].get(level)
+        if base:
+            print(f"concurrency {level:>3}: {base['qps']:.1f} -> {stats['qps']:.1f} questions/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the RAG pipeline with a fake LLM.")
+    parser.add_argument("--queries", help="file with one question per line")
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds the fake LLM sleeps per call")
+    parser.add_argument("--output", help=f"results file (default: {RESULTS_DIR}/<timestamp>.json)")
+    parser.add_argument("--compare", help="previous results file to diff against")
+    args = parser.parse_args()
+
+    queries = DEFAULT_QUERIES
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+
+    result = run(queries, args.repeats, args.concurrency, args.llm_latency)
+    print_report(result)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print_comparison(json.load(f), result)
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"Saved {output}")
+
+
+if __name__ == "__main__":
+    main()
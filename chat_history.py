@@ -0,0 +1,161 @@
+"""Bounded chat history for the Streamlit app.
+
+st.session_state.chat_history used to be a list that grew for the life of
+the session and was redrawn in full on every rerun. ChatHistory keeps
+only the most recent turns in memory. Older turns are spilled to a
+host-local SQLite file and read back a page at a time when the user asks
+for them, so memory per session and the per-rerun render work stay flat
+however long the conversation gets.
+
+    CHAT_HISTORY_PATH=chat_history.sqlite3
+    CHAT_HISTORY_MEMORY=20          turns kept in memory per session
+    CHAT_HISTORY_PAGE=10            turns rendered per page
+    CHAT_HISTORY_RETENTION_DAYS=7   spilled turns older than this are deleted
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS turns (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    latency TEXT,
+    created REAL NOT NULL,
+    PRIMARY KEY (session_id, seq)
+);
+CREATE INDEX IF NOT EXISTS turns_created ON turns (created);
+"""
+
+
+class HistoryStore:
+    # Spilled turns for every session in this process; one connection behind a lock
+
+    def __init__(self, path="chat_history.sqlite3", retention_days=7):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._db.execute("DELETE FROM turns WHERE created < ?", (time.time() - retention_days * 86400,))
+
+    def spill(self, session_id, seq, turn):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO turns (session_id, seq, question, answer, latency, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (session_id, seq, turn["question"], turn["answer"], json.dumps(turn.get("latency")), time.time()),
+            )
+
+    def update(self, session_id, seq, answer, latency):
+        with self._lock:
+            self._db.execute(
+                "UPDATE turns SET answer = ?, latency = ? WHERE session_id = ? AND seq = ?",
+                (answer, json.dumps(latency), session_id, seq),
+            )
+
+    def read(self, session_id, before_seq, limit):
+        # Up to `limit` turns with seq < before_seq, newest first
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT question, answer, latency FROM turns WHERE session_id = ? AND seq < ? ORDER BY seq DESC LIMIT ?",
+                (session_id, before_seq, limit),
+            ).fetchall()
+        return [
+            {"question": question, "answer": answer, **({"latency": json.loads(latency)} if latency and latency != "null" else {})}
+            for question, answer, latency in rows
+        ]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = HistoryStore(
+                os.getenv("CHAT_HISTORY_PATH", "chat_history.sqlite3"),
+                retention_days=float(os.getenv("CHAT_HISTORY_RETENTION_DAYS", "7")),
+            )
+        return _store
+
+
+class ChatHistory:
+    def __init__(self, session_id, store=None, max_in_memory=None):
+        self.session_id = session_id
+        self.store = store
+        self.max_in_memory = max_in_memory or int(os.getenv("CHAT_HISTORY_MEMORY", "20"))
+        self.recent = deque()
+        self.total = 0
+        # update() comes from worker threads while the script appends
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.total
+
+    def append(self, turn):
+        # Returns the turn's seq, for update()
+        with self._lock:
+            self.recent.append(turn)
+            self.total += 1
+            while len(self.recent) > self.max_in_memory:
+                oldest = self.recent.popleft()
+                # seq of the oldest turn still in memory before it was dropped
+                seq = self.total - len(self.recent) - 1
+                if self.store is not None:
+                    self.store.spill(self.session_id, seq, oldest)
+            return self.total - 1
+
+    def update(self, seq, answer, latency):
+        # Replaces a turn's answer wherever it is now, in memory or spilled
+        with self._lock:
+            first_in_memory = self.total - len(self.recent)
+            if seq >= first_in_memory:
+                self.recent[seq - first_in_memory].update(answer=answer, latency=latency)
+                return
+        if self.store is not None:
+            self.store.update(self.session_id, seq, answer, latency)
+
+    def latest(self, limit):
+        # The newest `limit` turns, newest first, reading spilled turns if needed
+        with self._lock:
+            turns = list(reversed(self.recent))[:limit]
+            spilled = self.total - len(self.recent)
+        if len(turns) < limit and spilled and self.store is not None:
+            turns.extend(self.store.read(self.session_id, spilled, limit - len(turns)))
+        return turns
+
+
+class RenderStats:
+    # Wall time of the history block per rerun, to check it stays flat as sessions grow
+
+    def __init__(self, window=200):
+        self._lock = threading.Lock()
+        self.samples = deque(maxlen=window)
+
+    def record(self, seconds, rendered, total):
+        with self._lock:
+            self.samples.append((seconds, rendered, total))
+
+    def stats(self):
+        with self._lock:
+            samples = list(self.samples)
+        if not samples:
+            return {"reruns": 0}
+        times = sorted(seconds for seconds, _, _ in samples)
+        return {
+            "reruns": len(samples),
+            "render_ms_p50": times[len(times) // 2] * 1000,
+            "render_ms_p95": times[min(len(times) - 1, int(len(times) * 0.95))] * 1000,
+            "last_rendered": samples[-1][1],
+            "last_total": samples[-1][2],
+        }
+
+
+render_stats = RenderStats()
@@ -0,0 +1,140 @@
+"""Context assembly between the retriever and the prompt.
+
+Ingestion splits the resume into 1000-character chunks with 200 characters
+of overlap, so the four retrieved chunks repeat text. ContextBudgeter keeps
+the chunks in relevance order. It drops sentences that are already in the
+context, whether as exact repeats, overlap fragments or near-duplicates,
+and stops adding sentences at a token budget. Per-request savings are put
+on the current trace span and totals are kept for stats().
+
+    CONTEXT_BUDGET=off          fall back to format_docs
+    CONTEXT_TOKEN_BUDGET=800    approximate prompt tokens for the context
+"""
+import re
+import threading
+from collections import deque
+
+from opentelemetry import trace
+
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\n+")
+WORD = re.compile(r"\w+")
+# Shorter lines ("Java", "SQL") only count as repeats when they match exactly
+MIN_FRAGMENT_WORDS = 4
+
+
+def estimate_tokens(text):
+    # ~4 characters per token for English with the Llama 3 tokenizer
+    return (len(text) + 3) // 4
+
+
+def split_sentences(text):
+    return [sentence.strip() for sentence in SENTENCE_BOUNDARY.split(text) if sentence.strip()]
+
+
+def _normalize(text):
+    return " ".join(WORD.findall(text.lower()))
+
+
+def _contained(short, long):
+    # Whole-word containment of one normalized sentence in another
+    if short == long:
+        return True
+    return len(short.split()) >= MIN_FRAGMENT_WORDS and f" {short} " in f" {long} "
+
+
+class ContextBudgeter:
+    def __init__(self, token_budget=800, similarity_threshold=0.85):
+        self.token_budget = token_budget
+        self.similarity_threshold = similarity_threshold
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self.sentences_dropped = 0
+        self.recent = deque(maxlen=100)
+
+    def _is_duplicate(self, normalized, words, kept):
+        # Overlap fragments are word runs of what we already have
+        if any(_contained(normalized, entry["normalized"]) for entry in kept):
+            return True
+        for entry in kept:
+            union = len(words | entry["words"])
+            if union and len(words & entry["words"]) / union >= self.similarity_threshold:
+                return True
+        return False
+
+    def assemble(self, docs):
+        # Returns (context string, per-request report)
+        tokens_in = estimate_tokens("\n\n".join(doc.page_content for doc in docs))
+        kept = []
+        used = 0
+        dropped = 0
+        exhausted = False
+
+        for position, doc in enumerate(docs):
+            for sentence in split_sentences(doc.page_content):
+                normalized = _normalize(sentence)
+                words = set(normalized.split())
+                if not normalized or self._is_duplicate(normalized, words, kept):
+                    dropped += 1
+                    continue
+                # A chunk cut mid-sentence leaves a fragment that the next
+                # chunk repeats in full; keep only the full sentence
+                fragments = [entry for entry in kept if _contained(entry["normalized"], normalized)]
+                for entry in fragments:
+                    kept.remove(entry)
+                    used -= entry["cost"]
+                    dropped += 1
+                cost = estimate_tokens(sentence) + 1
+                # The most relevant sentence always goes in, even if it alone is over budget
+                if used and used + cost > self.token_budget:
+                    exhausted = True
+                    break
+                used += cost
+                kept.append({"doc": position, "sentence": sentence, "normalized": normalized, "words": words, "cost": cost})
+            if exhausted:
+                break
+
+        blocks = []
+        for position in range(len(docs)):
+            sentences = [entry["sentence"] for entry in kept if entry["doc"] == position]
+            if sentences:
+                blocks.append(" ".join(sentences))
+        context = "\n\n".join(blocks)
+        report = {
+            "chunks_in": len(docs),
+            "chunks_out": len(blocks),
+            "tokens_in": tokens_in,
+            "tokens_out": estimate_tokens(context),
+            "sentences_dropped": dropped,
+            "budget_exhausted": exhausted,
+        }
+        report["tokens_saved"] = report["tokens_in"] - report["tokens_out"]
+        self._record(report)
+        return context, report
+
+    def __call__(self, docs):
+        return self.assemble(docs)[0]
+
+    def _record(self, report):
+        span = trace.get_current_span()
+        for key in ("tokens_in", "tokens_out", "tokens_saved", "chunks_out"):
+            span.set_attribute(f"rag.context_{key}", report[key])
+        with self._lock:
+            self.requests += 1
+            self.tokens_in += report["tokens_in"]
+            self.tokens_out += report["tokens_out"]
+            self.sentences_dropped += report["sentences_dropped"]
+            self.recent.append(report)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "tokens_in": self.tokens_in,
+                "tokens_out": self.tokens_out,
+                "tokens_saved": self.tokens_in - self.tokens_out,
+                "saved_ratio": (self.tokens_in - self.tokens_out) / self.tokens_in if self.tokens_in else 0.0,
+                "sentences_dropped": self.sentences_dropped,
+                "last": self.recent[-1] if self.recent else None,
+            }
@@ -0,0 +1,162 @@
+"""Per-request deadlines with a local extractive fallback.
+
+Nothing bounded how long a user waited on rag_chain: if Groq was slow or
+down, the spinner just kept spinning. Each request now gets a deadline
+that starts when the question comes in. Precheck, the admission queue and
+retrieval all spend from it, and whatever is left, minus a reserve for the
+fallback, is the LLM stage's budget.
+
+If the chain hasn't answered (or, when streaming, produced its first
+token) by then, the caller gets an extractive answer instead. It is built
+locally from the retrieved chunks by scoring their sentences against the
+question embedding, and is marked degraded. The chain keeps running, and
+its full answer replaces the degraded one if it arrives. It also goes
+into the answer cache either way. The fallback reuses the chunks the chain
+already retrieved for the request, when retrieval finished in time.
+
+    DEADLINE=off                    wait for the chain however long it takes
+    DEADLINE_SECONDS=8              budget per request, from the moment it arrives
+    DEADLINE_FALLBACK_RESERVE=1     seconds kept back to build the extractive answer
+    DEADLINE_REPLACE_WAIT=30        seconds a late full answer may take to replace the one in the app
+    DEADLINE_SENTENCES=3            sentences in an extractive answer
+"""
+import contextlib
+import contextvars
+import threading
+import time
+from collections import deque
+
+import numpy as np
+from langchain_core.callbacks import BaseCallbackHandler
+
+from context_budget import _normalize, split_sentences
+
+# The list collecting this request's retrieved documents, if any
+_retrieved = contextvars.ContextVar("deadline_retrieved", default=None)
+
+
+class Deadline:
+    def __init__(self, seconds, reserve=0.0, started=None):
+        self.started = time.perf_counter() if started is None else started
+        self.expires = self.started + seconds
+        self.reserve = reserve
+
+    def remaining(self):
+        return max(0.0, self.expires - time.perf_counter())
+
+    def llm_budget(self):
+        # What the chain may use before the fallback has to start
+        return max(0.0, self.remaining() - self.reserve)
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+def extractive_answer(question_vector, docs, embed_documents, max_sentences=3):
+    # The sentences from the retrieved chunks closest to the question, in
+    # document order; None when there is nothing to extract
+    sentences = []
+    seen = set()
+    for doc in docs:
+        for sentence in split_sentences(doc.page_content):
+            key = _normalize(sentence)
+            # Overlapping chunks repeat sentences; very short ones are headings
+            if len(key.split()) < 4 or key in seen:
+                continue
+            seen.add(key)
+            sentences.append(sentence)
+    if not sentences:
+        return None
+    vectors = np.asarray(embed_documents(sentences), dtype=np.float32)
+    vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+    query = np.asarray(question_vector, dtype=np.float32)
+    scores = vectors @ (query / (np.linalg.norm(query) or 1.0))
+    best = sorted(np.argsort(-scores)[:max_sentences])
+    return " ".join(sentences[index] for index in best)
+
+
+class RetrievedDocsHandler(BaseCallbackHandler):
+    # Attached to rag_chain; hands the retriever's output to the request
+    # that is collecting it
+    run_inline = True
+
+    def on_retriever_end(self, documents, **kwargs):
+        docs = _retrieved.get()
+        if docs is not None:
+            docs.extend(documents)
+
+
+callback_handler = RetrievedDocsHandler()
+
+
+def capture_retrieved(docs, fn, *args):
+    # For a copied context: runs fn(*args), collecting what it retrieves into docs
+    _retrieved.set(docs)
+    return fn(*args)
+
+
+@contextlib.contextmanager
+def collecting_retrieved(docs):
+    # Tasks created inside inherit the collector
+    token = _retrieved.set(docs)
+    try:
+        yield
+    finally:
+        _retrieved.reset(token)
+
+
+class DeadlinePolicy:
+    def __init__(self, seconds=8.0, reserve=1.0, max_sentences=3, window=500):
+        self.seconds = seconds
+        self.reserve = reserve
+        self.max_sentences = max_sentences
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.misses = 0
+        self.fallbacks = 0
+        self.fallback_failures = 0
+        self.replaced = 0
+        self.late_failures = 0
+        # Seconds past the deadline that full answers arrived
+        self.lateness = deque(maxlen=window)
+
+    def start(self, started=None):
+        with self._lock:
+            self.requests += 1
+        return Deadline(self.seconds, self.reserve, started)
+
+    def record_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def record_fallback(self, served):
+        with self._lock:
+            if served:
+                self.fallbacks += 1
+            else:
+                self.fallback_failures += 1
+
+    def record_late(self, deadline, failed):
+        with self._lock:
+            if failed:
+                self.late_failures += 1
+            else:
+                self.replaced += 1
+                self.lateness.append(max(0.0, time.perf_counter() - deadline.expires))
+
+    def stats(self):
+        with self._lock:
+            lateness = sorted(self.lateness)
+            return {
+                "deadline_seconds": self.seconds,
+                "requests": self.requests,
+                "deadline_misses": self.misses,
+                "miss_rate": self.misses / self.requests if self.requests else 0.0,
+                "fallbacks": self.fallbacks,
+                "fallback_rate": self.fallbacks / self.requests if self.requests else 0.0,
+                "fallback_failures": self.fallback_failures,
+                "replaced": self.replaced,
+                "late_failures": self.late_failures,
+                "late_p50": lateness[len(lateness) // 2] if lateness else 0.0,
+                "late_p95": lateness[min(len(lateness) - 1, int(len(lateness) * 0.95))] if lateness else 0.0,
+            }
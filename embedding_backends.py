@@ -0,0 +1,209 @@
+"""Embedding backends for the vectorstore and query encoding.
+
+EMBEDDING_BACKEND=hf (the default) uses HuggingFaceEmbeddings in PyTorch.
+EMBEDDING_BACKEND=onnx runs an ONNX export of the same sentence-transformers
+model with int8 dynamic quantization on onnxruntime, which encodes faster
+and needs far less memory per worker. It requires
+`pip install optimum[onnxruntime]` and a one-off export:
+
+    python embedding_backends.py --export [--model-dir ./onnx_model]
+    python embedding_backends.py --compare [--k 4]
+
+--compare checks top-k recall of ONNX query vectors against the vectors
+already stored in ./chroma_db and measures per-query encode latency and
+peak RSS of each backend in a fresh process.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# HuggingFaceEmbeddings() default, which built the vectors in ./chroma_db
+DEFAULT_MODEL_NAME = "sentence-transformers/all-mpnet-base-v2"
+DEFAULT_ONNX_DIR = "./onnx_model"
+QUANTIZED_FILE = "model_int8.onnx"
+
+
+def _require_onnxruntime():
+    try:
+        import onnxruntime
+        import transformers
+    except ImportError as exc:
+        raise ImportError(
+            "The onnx embedding backend needs onnxruntime and transformers; "
+            "install them with `pip install optimum[onnxruntime]`."
+        ) from exc
+    return onnxruntime, transformers
+
+
+class OnnxEmbeddings(Embeddings):
+    # Mean pooling + L2 normalisation, matching the sentence-transformers
+    # pipeline of the exported model
+
+    def __init__(self, model_dir=DEFAULT_ONNX_DIR, batch_size=32, max_length=384, threads=None):
+        onnxruntime, transformers = _require_onnxruntime()
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.tokenizer = transformers.AutoTokenizer.from_pretrained(model_dir)
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, QUANTIZED_FILE), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {node.name for node in self.session.get_inputs()}
+
+    def _encode(self, texts):
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = self.tokenizer(
+                texts[start:start + self.batch_size],
+                padding=True, truncation=True, max_length=self.max_length, return_tensors="np",
+            )
+            inputs = {name: value.astype(np.int64) for name, value in batch.items() if name in self.input_names}
+            token_embeddings = self.session.run(None, inputs)[0]
+            mask = batch["attention_mask"][..., None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            vectors.append(pooled)
+        return np.concatenate(vectors) if vectors else np.empty((0, 0), dtype=np.float32)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._encode(list(texts)).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0].tolist()
+
+
+def load_embeddings(backend=None):
+    backend = (backend or os.getenv("EMBEDDING_BACKEND", "hf")).lower()
+    if backend == "onnx":
+        return OnnxEmbeddings(os.getenv("ONNX_MODEL_DIR", DEFAULT_ONNX_DIR))
+    if backend == "hf":
+        from langchain_huggingface import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings()
+    raise ValueError(f"Unknown EMBEDDING_BACKEND {backend!r}; expected 'hf' or 'onnx'")
+
+
+def export_onnx(model_name=DEFAULT_MODEL_NAME, model_dir=DEFAULT_ONNX_DIR):
+    _require_onnxruntime()
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from optimum.onnxruntime import ORTModelForFeatureExtraction
+    from transformers import AutoTokenizer
+
+    ORTModelForFeatureExtraction.from_pretrained(model_name, export=True).save_pretrained(model_dir)
+    AutoTokenizer.from_pretrained(model_name).save_pretrained(model_dir)
+    quantize_dynamic(
+        os.path.join(model_dir, "model.onnx"),
+        os.path.join(model_dir, QUANTIZED_FILE),
+        weight_type=QuantType.QInt8,
+    )
+    return os.path.join(model_dir, QUANTIZED_FILE)
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def measure_backend(backend, queries, repeats=5):
+    # Runs in a fresh process (see compare_backends) so peak RSS is the backend's own
+    started = time.perf_counter()
+    embeddings = load_embeddings(backend)
+    load_seconds = time.perf_counter() - started
+    embeddings.embed_query("warmup")
+
+    timings = []
+    vectors = []
+    for query in queries:
+        for _ in range(repeats):
+            started = time.perf_counter()
+            vector = embeddings.embed_query(query)
+            timings.append(time.perf_counter() - started)
+        vectors.append(vector)
+    return {
+        "backend": backend,
+        "load_seconds": load_seconds,
+        "encode_ms": {
+            "p50": float(np.percentile(timings, 50)) * 1000,
+            "p95": float(np.percentile(timings, 95)) * 1000,
+        },
+        "peak_rss_mb": _peak_rss_mb(),
+        "vectors": vectors,
+    }
+
+
+def compare_backends(queries, k=4, backends=("hf", "onnx")):
+    import rag
+    from numpy_index import NumpyIndex
+
+    results = {}
+    for backend in backends:
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--measure", backend],
+            input=json.dumps(queries), capture_output=True, text=True, check=True,
+        ).stdout
+        results[backend] = json.loads(output)
+
+    # Recall is judged against the stored document vectors: the top-k found
+    # with each backend's query vector vs the top-k found with the reference
+    index = NumpyIndex.from_chroma(rag.get_vectorstore())
+    reference = results[backends[0]]["vectors"]
+    for backend in backends:
+        recalls = []
+        for expected_vector, vector in zip(reference, results[backend]["vectors"]):
+            expected = set(index.search(expected_vector, k)[0].tolist())
+            got = set(index.search(vector, k)[0].tolist())
+            recalls.append(len(expected & got) / max(len(expected), 1))
+        results[backend]["recall_at_k"] = float(np.mean(recalls)) if recalls else 0.0
+        del results[backend]["vectors"]
+    return results
+
+
+def main():
+    from numpy_index import DEFAULT_QUERIES
+
+    parser = argparse.ArgumentParser(description="Export and compare embedding backends.")
+    parser.add_argument("--export", action="store_true", help="export and int8-quantize the model to --model-dir")
+    parser.add_argument("--compare", action="store_true", help="compare recall, latency and memory of hf and onnx")
+    parser.add_argument("--measure", help=argparse.SUPPRESS)
+    parser.add_argument("--model-dir", default=DEFAULT_ONNX_DIR)
+    parser.add_argument("--queries", help="file with one question per line")
+    parser.add_argument("--k", type=int, default=4)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure_backend(args.measure, json.loads(sys.stdin.read()))))
+    elif args.export:
+        print(f"Wrote {export_onnx(model_dir=args.model_dir)}")
+    elif args.compare:
+        queries = DEFAULT_QUERIES
+        if args.queries:
+            with open(args.queries, encoding="utf-8") as f:
+                queries = [line.strip() for line in f if line.strip()]
+        os.environ["ONNX_MODEL_DIR"] = args.model_dir
+        for backend, result in compare_backends(queries, k=args.k).items():
+            rss = f"{result['peak_rss_mb']:.0f} MB" if result["peak_rss_mb"] is not None else "n/a"
+            print(
+                f"{backend:<5} recall@{args.k} {result['recall_at_k']:.3f}  "
+                f"encode p50 {result['encode_ms']['p50']:.2f} ms p95 {result['encode_ms']['p95']:.2f} ms  "
+                f"load {result['load_seconds']:.1f}s  peak RSS {rss}"
+            )
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
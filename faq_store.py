@@ -0,0 +1,278 @@
+"""Precomputed answers for the questions recruiters ask most.
+
+Most traffic is a handful of predictable questions, but every worker starts
+with an empty answer cache and pays a Groq call for each of them. A build
+step runs a curated list (or the most frequent questions in the query log,
+which records every request) through rag_chain once. It saves the answers together
+with the ./chroma_db version and the prompt template hash they came from.
+
+Workers load the file at startup and answer exact or near-duplicate
+matches straight away. Entries whose index or template version no longer
+matches are never served. When that happens, one worker on the host
+regenerates the file in the background while the others wait for it to
+reappear on disk.
+
+    FAQ=off                       don't load or serve precomputed answers
+    FAQ_PATH=faq_answers.json
+    FAQ_SIMILARITY=0.92           min cosine similarity for a near match
+    FAQ_REGENERATE=background     or off: leave stale files for the build step
+
+    python faq_store.py --build [--questions faq_questions.txt] [--from-query-log [query_log.jsonl] --top 50 --since 168]
+    python faq_store.py --status
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+import numpy as np
+
+from answer_cache import normalize_question
+
+DEFAULT_PATH = "faq_answers.json"
+# A regeneration lock older than this is assumed to belong to a dead worker
+LOCK_TIMEOUT = 3600
+
+
+def questions_from_query_log(path, top=50, since_hours=None):
+    # Most frequent questions in the query log, by normalized text. Questions
+    # the router answers with a canned reply never reach the FAQ
+    from query_log import read_records
+    from router import CANNED_RESPONSES
+
+    counts = Counter()
+    originals = {}
+    for record in read_records(path, since_hours):
+        if record["attributes"].get("route") in CANNED_RESPONSES:
+            continue
+        question = record["question"]
+        key = normalize_question(question)
+        counts[key] += 1
+        originals.setdefault(key, question.strip())
+    return [originals[key] for key, _ in counts.most_common(top)]
+
+
+def build(path, questions, answer_fn, embed_documents, versions, namespace):
+    # Answers every question and atomically replaces the file at path
+    questions = list(dict.fromkeys(question.strip() for question in questions if question.strip()))
+    answers = [answer_fn(question) for question in questions]
+    vectors = embed_documents(questions) if questions else []
+    payload = {
+        **versions,
+        "embedding_namespace": namespace,
+        "generated": datetime.now(timezone.utc).isoformat(),
+        "entries": [
+            {"question": question, "answer": answer, "vector": [round(float(value), 6) for value in vector]}
+            for question, answer, vector in zip(questions, answers, vectors)
+        ],
+    }
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(payload, f)
+    os.replace(tmp_path, path)
+    return payload
+
+
+class FaqStore:
+    def __init__(self, path, embed_documents, versions_fn, namespace, similarity_threshold=0.92,
+                 regenerate_fn=None, check_interval=30):
+        self.path = path
+        self.embed_documents = embed_documents
+        self.versions_fn = versions_fn
+        self.namespace = namespace
+        self.similarity_threshold = similarity_threshold
+        # regenerate_fn(question) -> answer; None leaves stale files alone
+        self.regenerate_fn = regenerate_fn
+        self.check_interval = check_interval
+
+        self._lock = threading.Lock()
+        self._answers = {}
+        self._keys = []
+        self._matrix = None
+        self._questions = []
+        self._loaded_mtime = None
+        self._checked_at = 0.0
+        self._regenerating = False
+        self.stale = False
+        self.hits = 0
+        self.semantic_hits = 0
+        self.regenerations = 0
+        self.versions = versions_fn()
+        self._load()
+
+    def _load(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            with open(self.path, encoding="utf-8") as f:
+                payload = json.load(f)
+        except FileNotFoundError:
+            payload, mtime = None, None
+        entries = (payload or {}).get("entries", [])
+        current = payload is not None and all(payload.get(key) == value for key, value in self.versions.items())
+        vectors = None
+        if current and entries:
+            if payload.get("embedding_namespace") == self.namespace:
+                vectors = np.asarray([entry["vector"] for entry in entries], dtype=np.float32)
+            else:
+                # Built with a different encoder; the answers are still good
+                vectors = np.asarray(self.embed_documents([entry["question"] for entry in entries]), dtype=np.float32)
+            vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+
+        with self._lock:
+            self._loaded_mtime = mtime
+            self._questions = [entry["question"] for entry in entries]
+            self.stale = payload is not None and not current
+            if current:
+                self._keys = [normalize_question(entry["question"]) for entry in entries]
+                self._answers = {key: entry["answer"] for key, entry in zip(self._keys, entries)}
+                self._matrix = vectors
+            else:
+                self._keys, self._answers, self._matrix = [], {}, None
+        if self.stale:
+            self._start_regeneration()
+
+    def maybe_refresh(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        versions = self.versions_fn()
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if versions != self.versions or mtime != self._loaded_mtime:
+            self.versions = versions
+            self._load()
+
+    def lookup(self, question, vector=None):
+        # Returns (answer or None, query vector or None); only embeds when
+        # there are entries to compare against
+        self.maybe_refresh()
+        key = normalize_question(question)
+        with self._lock:
+            answer = self._answers.get(key)
+            if answer is not None:
+                self.hits += 1
+                return answer, vector
+            if self._matrix is None:
+                return None, vector
+        if vector is None:
+            vector = self.embed_documents([question])[0]
+        query = np.asarray(vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        with self._lock:
+            if self._matrix is None:
+                return None, vector
+            scores = self._matrix @ query
+            best = int(np.argmax(scores))
+            if scores[best] >= self.similarity_threshold:
+                self.hits += 1
+                self.semantic_hits += 1
+                return self._answers[self._keys[best]], vector
+        return None, vector
+
+    def _start_regeneration(self):
+        if self.regenerate_fn is None or not self._questions:
+            return
+        with self._lock:
+            if self._regenerating:
+                return
+            self._regenerating = True
+        threading.Thread(target=self._regenerate, name="faq-regenerate", daemon=True).start()
+
+    def _regenerate(self):
+        # One worker per host rebuilds; the rest pick the file up via maybe_refresh()
+        lock_path = self.path + ".lock"
+        try:
+            try:
+                if time.time() - os.stat(lock_path).st_mtime > LOCK_TIMEOUT:
+                    os.remove(lock_path)
+            except FileNotFoundError:
+                pass
+            try:
+                os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            except FileExistsError:
+                return
+            try:
+                build(self.path, self._questions, self.regenerate_fn, self.embed_documents, self.versions, self.namespace)
+                with self._lock:
+                    self.regenerations += 1
+            finally:
+                os.remove(lock_path)
+            self._load()
+        except Exception as exc:
+            print(f"FAQ regeneration failed: {type(exc).__name__}: {exc}", file=sys.stderr, flush=True)
+        finally:
+            with self._lock:
+                self._regenerating = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._answers),
+                "stale": self.stale,
+                "regenerating": self._regenerating,
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "regenerations": self.regenerations,
+                **self.versions,
+            }
+
+
+def main():
+    import rag
+    from numpy_index import DEFAULT_QUERIES
+
+    parser = argparse.ArgumentParser(description="Build or inspect the precomputed FAQ answers.")
+    parser.add_argument("--build", action="store_true")
+    parser.add_argument("--status", action="store_true")
+    parser.add_argument("--questions", help="file with one question per line")
+    parser.add_argument("--from-query-log", nargs="?", const=os.getenv("QUERY_LOG_PATH", "query_log.jsonl"),
+                        help="query log to take the most frequent questions from")
+    parser.add_argument("--top", type=int, default=50)
+    parser.add_argument("--since", type=float, help="only count the query log's last N hours")
+    parser.add_argument("--output", default=os.getenv("FAQ_PATH", DEFAULT_PATH))
+    args = parser.parse_args()
+
+    if args.status:
+        rag.configure_environment()
+        try:
+            with open(args.output, encoding="utf-8") as f:
+                payload = json.load(f)
+        except FileNotFoundError:
+            print(f"{args.output} does not exist")
+            return
+        versions = rag.faq_versions()
+        print(json.dumps({
+            "entries": len(payload.get("entries", [])),
+            "generated": payload.get("generated"),
+            "current": all(payload.get(key) == value for key, value in versions.items()),
+            "file": {key: payload.get(key) for key in versions},
+            "now": versions,
+        }, indent=2))
+    elif args.build:
+        questions = list(DEFAULT_QUERIES)
+        if args.questions:
+            with open(args.questions, encoding="utf-8") as f:
+                questions = [line.strip() for line in f if line.strip()]
+        if args.from_query_log:
+            questions += questions_from_query_log(args.from_query_log, args.top, args.since)
+        rag.configure_environment()
+        chain = rag.get_rag_chain()
+        started = time.perf_counter()
+        payload = build(
+            args.output, questions, chain.invoke, rag.get_embeddings().embed_documents,
+            rag.faq_versions(), rag.embedding_namespace(),
+        )
+        print(f"Wrote {len(payload['entries'])} answers to {args.output} in {time.perf_counter() - started:.1f}s")
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
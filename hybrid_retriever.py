@@ -0,0 +1,284 @@
+"""Hybrid BM25 + vector retrieval over the chunks in ./chroma_db.
+
+Pure similarity search misses questions that hinge on an exact term (a
+technology, company or certification name). HybridRetriever ranks chunks
+with BM25 over an in-memory inverted index and with the vector store, then
+fuses both rankings with reciprocal rank fusion. The index is built once
+from the collection and updated incrementally when ./chroma_db changes.
+Enable it with RETRIEVER_BACKEND=hybrid.
+
+    python hybrid_retriever.py --compare [--queries labeled.jsonl] [--k 4]
+
+Labeled queries are JSONL lines like
+{"question": "Is he AWS certified?", "expected": ["AWS Certified"]}; a hit
+is any of the top-k chunks containing one of the expected strings.
+"""
+import argparse
+import json
+import math
+import re
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, List
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+# Keeps tokens like c++, c#, node.js and ci/cd intact
+TOKEN = re.compile(r"[a-z0-9][a-z0-9+#./-]*[a-z0-9+#]|[a-z0-9]")
+
+
+def tokenize(text):
+    return TOKEN.findall(text.lower())
+
+
+class BM25Index:
+    # term -> {docno: term frequency}; docnos are dense ints so postings stay small.
+    # Searches and updates share one lock, so a search sees a sync's changes
+    # all or not at all
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = {}
+        self.lengths = {}
+        self.ids = {}
+        self.documents = {}
+        self._docno_by_id = {}
+        self._next_docno = 0
+        self._total_length = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._docno_by_id
+
+    def doc_ids(self):
+        with self._lock:
+            return set(self._docno_by_id)
+
+    def update(self, removed=(), added=()):
+        # added is [(doc_id, text, metadata)]
+        with self._lock:
+            for doc_id in removed:
+                self._remove(doc_id)
+            for doc_id, text, metadata in added:
+                self._add(doc_id, text, metadata)
+
+    def add(self, doc_id, text, metadata=None):
+        with self._lock:
+            self._add(doc_id, text, metadata)
+
+    def _add(self, doc_id, text, metadata):
+        if doc_id in self._docno_by_id:
+            self._remove(doc_id)
+        docno = self._next_docno
+        self._next_docno += 1
+        counts = Counter(tokenize(text))
+        for term, tf in counts.items():
+            self.postings.setdefault(term, {})[docno] = tf
+        length = sum(counts.values())
+        self.lengths[docno] = length
+        self._total_length += length
+        self.ids[docno] = doc_id
+        self.documents[docno] = Document(page_content=text, metadata=metadata or {})
+        self._docno_by_id[doc_id] = docno
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id):
+        docno = self._docno_by_id.pop(doc_id, None)
+        if docno is None:
+            return
+        for term in set(tokenize(self.documents[docno].page_content)):
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(docno, None)
+                if not postings:
+                    del self.postings[term]
+        self._total_length -= self.lengths.pop(docno)
+        del self.ids[docno]
+        del self.documents[docno]
+
+    def search(self, query, n=20):
+        # Returns [(doc_id, score)] best first
+        with self._lock:
+            return self._search(query, n)
+
+    def _search(self, query, n):
+        if not self.ids:
+            return []
+        doc_count = len(self.ids)
+        average_length = self._total_length / doc_count
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for docno, tf in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[docno] / average_length)
+                scores[docno] = scores.get(docno, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:n]
+        return [(self.ids[docno], score) for docno, score in best]
+
+    def document(self, doc_id):
+        # None once a sync has removed the chunk
+        with self._lock:
+            docno = self._docno_by_id.get(doc_id)
+            return None if docno is None else self.documents[docno]
+
+
+class ChromaSync:
+    # Keeps a BM25Index in step with a Chroma collection, fetching only the
+    # chunks that were added since the last sync
+
+    def __init__(self, vectorstore, index, fingerprint_fn=None, check_interval=30):
+        self.collection = vectorstore._collection
+        self.index = index
+        self.fingerprint_fn = fingerprint_fn
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._fingerprint = None
+        self._checked_at = 0.0
+        self.syncs = 0
+
+    def sync(self):
+        with self._lock:
+            current = set(self.collection.get(include=[])["ids"])
+            known = self.index.doc_ids()
+            added = sorted(current - known)
+            data = {"ids": [], "documents": [], "metadatas": []}
+            if added:
+                data = self.collection.get(ids=added, include=["documents", "metadatas"])
+            # Chroma is read before touching the index, which only blocks
+            # searches while the changes are applied
+            self.index.update(known - current, zip(data["ids"], data["documents"], data["metadatas"]))
+            self.syncs += 1
+            if self.fingerprint_fn is not None:
+                self._fingerprint = self.fingerprint_fn()
+            self._checked_at = time.monotonic()
+
+    def maybe_sync(self):
+        if self.fingerprint_fn is None or time.monotonic() - self._checked_at < self.check_interval:
+            return
+        self._checked_at = time.monotonic()
+        if self.fingerprint_fn() != self._fingerprint:
+            self.sync()
+
+
+def reciprocal_rank_fusion(rankings, rrf_k=60):
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (rrf_k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def chroma_vector_search(vectorstore):
+    collection = vectorstore._collection
+
+    def search(vector, n):
+        result = collection.query(query_embeddings=[vector], n_results=n, include=["documents", "metadatas"])
+        return [
+            (doc_id, Document(page_content=text, metadata=metadata or {}))
+            for doc_id, text, metadata in zip(result["ids"][0], result["documents"][0], result["metadatas"][0])
+        ]
+
+    return search
+
+
+class HybridRetriever(BaseRetriever):
+    index: Any
+    sync: Any = None
+    embeddings: Any
+    vector_search: Callable[[List[float], int], list]
+    k: int = 4
+    candidates: int = 20
+    rrf_k: int = 60
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        if self.sync is not None:
+            self.sync.maybe_sync()
+        return self.search(query, self.embeddings.embed_query(query))
+
+    def search(self, query, vector):
+        # Both rankings and the fusion, given the query's embedding
+        vector_hits = self.vector_search(vector, self.candidates)
+        keyword_hits = self.index.search(query, self.candidates)
+        documents = dict(vector_hits)
+        fused = reciprocal_rank_fusion([[doc_id for doc_id, _ in vector_hits], [doc_id for doc_id, _ in keyword_hits]], self.rrf_k)
+        results = []
+        for doc_id in fused[:self.k]:
+            document = documents.get(doc_id)
+            if document is None:
+                document = self.index.document(doc_id)
+            if document is not None:
+                results.append(document)
+        return results
+
+
+def build_hybrid_retriever(vectorstore, embeddings, fingerprint_fn=None, k=4):
+    index = BM25Index()
+    sync = ChromaSync(vectorstore, index, fingerprint_fn=fingerprint_fn)
+    sync.sync()
+    return HybridRetriever(
+        index=index, sync=sync, embeddings=embeddings, vector_search=chroma_vector_search(vectorstore), k=k
+    )
+
+
+def compare(vectorstore, embeddings, queries, k=4):
+    hybrid = build_hybrid_retriever(vectorstore, embeddings, k=k)
+    vector = vectorstore.as_retriever(search_type="similarity", search_kwargs={"k": k})
+    results = {}
+    for name, retriever in (("vector", vector), ("hybrid", hybrid)):
+        hits = []
+        timings = []
+        for query in queries:
+            started = time.perf_counter()
+            docs = retriever.invoke(query["question"])
+            timings.append(time.perf_counter() - started)
+            expected = [text.lower() for text in query.get("expected", [])]
+            if expected:
+                hits.append(any(text in doc.page_content.lower() for doc in docs for text in expected))
+        results[name] = {
+            "recall_at_k": float(np.mean(hits)) if hits else None,
+            "p50_ms": float(np.percentile(timings, 50)) * 1000,
+            "p95_ms": float(np.percentile(timings, 95)) * 1000,
+        }
+    return results
+
+
+def main():
+    import rag
+    from numpy_index import DEFAULT_QUERIES
+
+    parser = argparse.ArgumentParser(description="Compare hybrid BM25 + vector retrieval against vector-only.")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument("--queries", help="JSONL with question and optional expected substrings")
+    parser.add_argument("--k", type=int, default=4)
+    args = parser.parse_args()
+    if not args.compare:
+        parser.print_help()
+        return
+
+    queries = [{"question": question} for question in DEFAULT_QUERIES]
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            queries = [json.loads(line) for line in f if line.strip()]
+
+    rag.configure_environment()
+    for name, result in compare(rag.get_vectorstore(), rag.get_embeddings(), queries, k=args.k).items():
+        recall = f"{result['recall_at_k']:.3f}" if result["recall_at_k"] is not None else "n/a (no labels)"
+        print(f"{name:<7} recall@{args.k} {recall}  p50 {result['p50_ms']:.2f} ms  p95 {result['p95_ms']:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
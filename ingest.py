@@ -0,0 +1,311 @@
+"""Build or update the persisted ./chroma_db that app.py reads.
+
+Every chunk is stored under the hash of its source and text, and a manifest
+next to the index records which chunks each PDF produced. Re-running only
+parses PDFs whose bytes changed and only embeds chunks that are new, so
+updating the resume costs time proportional to the diff.
+
+Changed PDFs are parsed in a process pool; their chunks stream through a
+bounded queue into the embedding model in fixed-size batches and are written
+to Chroma in bulk, so memory stays flat however many PDFs are ingested.
+
+    python ingest.py Utsav-Soni-Resume.pdf
+    python ingest.py docs/ --prune --workers 8 --batch-size 128
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_community.vectorstores import Chroma
+from langchain_huggingface import HuggingFaceEmbeddings
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+MANIFEST_VERSION = 1
+MANIFEST_NAME = "ingest_manifest.json"
+
+
+def find_pdfs(paths):
+    pdfs = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                pdfs.extend(os.path.join(root, name) for name in sorted(files) if name.lower().endswith(".pdf"))
+        else:
+            pdfs.append(path)
+    return [os.path.abspath(pdf) for pdf in pdfs]
+
+
+def source_key(path, base):
+    # Sources are stored relative to the directory holding the index, so the
+    # manifest means the same thing whichever directory ingest runs from
+    try:
+        return os.path.relpath(path, base).replace(os.sep, "/")
+    except ValueError:  # another drive on Windows
+        return path.replace(os.sep, "/")
+
+
+def source_path(source, base):
+    return os.path.join(base, *source.split("/"))
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_id(source, text):
+    return hashlib.sha256(f"{source}\0{text}".encode("utf-8")).hexdigest()
+
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {"version": MANIFEST_VERSION, "settings": None, "sources": {}}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(path, manifest):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def split_pdf(path, source, chunk_size, chunk_overlap):
+    # Runs in a worker process. Chunk ids double as content hashes; identical
+    # chunks within one file collapse.
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size, chunk_overlap=chunk_overlap, add_start_index=True
+    )
+    pages = PyPDFLoader(path).load()
+    chunks = {}
+    for doc in splitter.split_documents(pages):
+        doc.metadata["source"] = source
+        doc_id = chunk_id(source, doc.page_content)
+        doc.metadata["content_hash"] = doc_id
+        chunks.setdefault(doc_id, (doc.page_content, doc.metadata))
+    return source, len(pages), chunks
+
+
+class Progress:
+    def __init__(self, total_files, interval=2.0):
+        self.total_files = total_files
+        self.interval = interval
+        self.files = 0
+        self.pages = 0
+        self.chunks = 0
+        self.started = time.perf_counter()
+        self._reported = self.started
+        # Updated from both the parser thread and the embedding loop
+        self._lock = threading.Lock()
+
+    def update(self, files=0, pages=0, chunks=0, force=False):
+        with self._lock:
+            self.files += files
+            self.pages += pages
+            self.chunks += chunks
+            now = time.perf_counter()
+            if not force and now - self._reported < self.interval:
+                return
+            self._reported = now
+        print(self.line(), file=sys.stderr, flush=True)
+
+    def line(self):
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        return (
+            f"[{self.files}/{self.total_files} files] {self.pages} pages ({self.pages / elapsed:.1f} pages/s), "
+            f"{self.chunks} chunks embedded ({self.chunks / elapsed:.1f} chunks/s)"
+        )
+
+
+def _parse_changed(changed, old_ids, chunk_queue, progress, workers, chunk_size, chunk_overlap, errors):
+    # Producer thread: keeps at most 2 * workers PDFs in flight and feeds the
+    # queue a file's new chunks followed by a marker for that file
+    context = multiprocessing.get_context("spawn")
+    pending_hashes = {}
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            pending = set()
+            todo = iter(changed)
+            while True:
+                for source, path, sha256 in todo:
+                    pending.add(pool.submit(split_pdf, path, source, chunk_size, chunk_overlap))
+                    pending_hashes[source] = sha256
+                    if len(pending) >= 2 * workers:
+                        break
+                if not pending:
+                    break
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    source, pages, chunks = future.result()
+                    known = old_ids.get(source, set())
+                    for doc_id, (text, metadata) in chunks.items():
+                        if doc_id not in known:
+                            chunk_queue.put(("chunk", doc_id, text, metadata))
+                    entry = {"sha256": pending_hashes.pop(source), "chunk_ids": sorted(chunks), "ingested_at": time.time()}
+                    chunk_queue.put(("file", source, entry, sorted(known - chunks.keys())))
+                    progress.update(files=1, pages=pages)
+    except BaseException as exc:
+        errors.append(exc)
+    finally:
+        chunk_queue.put(None)
+
+
+def ingest(paths, persist_directory="./chroma_db", prune=False, chunk_size=1000, chunk_overlap=200,
+           workers=None, batch_size=64, queue_size=1024):
+    manifest_path = os.path.join(persist_directory, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+    settings = {"chunk_size": chunk_size, "chunk_overlap": chunk_overlap}
+    # Different split settings produce different chunks, so nothing can be reused
+    rechunk_all = manifest["settings"] != settings
+
+    embeddings = HuggingFaceEmbeddings()
+    vectorstore = Chroma(persist_directory=persist_directory, embedding_function=embeddings)
+    collection = vectorstore._collection
+    stats = {"files_scanned": 0, "files_changed": 0, "chunks_added": 0, "chunks_deleted": 0, "sources_removed": 0}
+    sources = manifest["sources"]
+    base = os.path.dirname(os.path.abspath(persist_directory))
+
+    pdfs = {source_key(pdf, base): pdf for pdf in find_pdfs(paths)}
+    changed = []
+    for source, pdf in pdfs.items():
+        stats["files_scanned"] += 1
+        sha256 = file_sha256(pdf)
+        entry = sources.get(source)
+        if entry is None or entry["sha256"] != sha256 or rechunk_all:
+            changed.append((source, pdf, sha256))
+    stats["files_changed"] = len(changed)
+
+    old_ids = {source: set(entry["chunk_ids"]) for source, entry in sources.items()}
+    chunk_queue = queue.Queue(maxsize=queue_size)
+    progress = Progress(len(changed))
+    errors = []
+    producer = threading.Thread(
+        target=_parse_changed,
+        args=(changed, old_ids, chunk_queue, progress, workers or os.cpu_count() or 1,
+              chunk_size, chunk_overlap, errors),
+        daemon=True,
+    )
+    producer.start()
+
+    batch = []
+    finished_files = []
+
+    def flush():
+        if batch:
+            vectors = embeddings.embed_documents([text for _, text, _ in batch])
+            collection.upsert(
+                ids=[doc_id for doc_id, _, _ in batch],
+                embeddings=vectors,
+                documents=[text for _, text, _ in batch],
+                metadatas=[metadata for _, _, metadata in batch],
+            )
+            stats["chunks_added"] += len(batch)
+            progress.update(chunks=len(batch))
+            batch.clear()
+        # A file's manifest entry is committed only once all of its chunks are
+        # in the store, so an interrupted run never skips half-written files
+        for path, entry, stale_ids in finished_files:
+            if stale_ids:
+                collection.delete(ids=stale_ids)
+            stats["chunks_deleted"] += len(stale_ids)
+            sources[path] = entry
+        if finished_files:
+            finished_files.clear()
+            manifest["settings"] = None if rechunk_all else settings
+            save_manifest(manifest_path, manifest)
+
+    while True:
+        item = chunk_queue.get()
+        if item is None:
+            break
+        if item[0] == "chunk":
+            batch.append(item[1:])
+            if len(batch) >= batch_size:
+                flush()
+        else:
+            finished_files.append(item[1:])
+    producer.join()
+    if errors:
+        raise errors[0]
+    flush()
+    progress.update(force=True)
+
+    # A source is gone when its file was deleted, or with --prune when it
+    # wasn't part of this run's input
+    wanted = set(pdfs)
+    for source in sorted(sources):
+        if os.path.exists(source_path(source, base)) and (source in wanted or not prune):
+            continue
+        stale_ids = sources.pop(source)["chunk_ids"]
+        if stale_ids:
+            collection.delete(ids=stale_ids)
+        stats["chunks_deleted"] += len(stale_ids)
+        stats["sources_removed"] += 1
+
+    # Chunks the manifest doesn't know about (e.g. from before the manifest
+    # existed) are only removed with --prune; an incremental run never
+    # deletes data it didn't write
+    tracked = {doc_id for entry in sources.values() for doc_id in entry["chunk_ids"]}
+    orphans = [doc_id for doc_id in collection.get(include=[])["ids"] if doc_id not in tracked]
+    if orphans and prune:
+        collection.delete(ids=orphans)
+        stats["chunks_deleted"] += len(orphans)
+    stats["chunks_untracked"] = 0 if prune else len(orphans)
+
+    manifest["settings"] = settings
+    save_manifest(manifest_path, manifest)
+    stats["pages_per_second"] = progress.pages / max(time.perf_counter() - progress.started, 1e-9)
+    stats["chunks_per_second"] = progress.chunks / max(time.perf_counter() - progress.started, 1e-9)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incrementally ingest PDFs into the Chroma store used by app.py.")
+    parser.add_argument("paths", nargs="+", help="PDF files or directories containing PDFs")
+    parser.add_argument("--persist-directory", default="./chroma_db")
+    parser.add_argument("--prune", action="store_true",
+                        help="also remove sources that are not in this run's paths and chunks the manifest doesn't track")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=None, help="PDF parser processes (default: CPU count)")
+    parser.add_argument("--batch-size", type=int, default=64, help="chunks per embedding call and Chroma write")
+    parser.add_argument("--queue-size", type=int, default=1024, help="max chunks buffered between parsing and embedding")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    stats = ingest(
+        args.paths,
+        persist_directory=args.persist_directory,
+        prune=args.prune,
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        queue_size=args.queue_size,
+    )
+    print(
+        f"Scanned {stats['files_scanned']} files ({stats['files_changed']} changed): "
+        f"+{stats['chunks_added']} / -{stats['chunks_deleted']} chunks, "
+        f"{stats['sources_removed']} sources removed in {time.perf_counter() - started:.1f}s "
+        f"({stats['pages_per_second']:.1f} pages/s, {stats['chunks_per_second']:.1f} chunks/s)"
+    )
+    if stats["chunks_untracked"]:
+        print(f"{stats['chunks_untracked']} chunks in the collection aren't in the manifest; "
+              f"run with --prune to remove them")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,455 @@
+"""Resilient Groq client for the LLM step of rag_chain.
+
+A bare ChatGroq has no deadline of its own, so one slow upstream response
+leaves the user behind the spinner indefinitely. ResilientChatModel wraps
+the chat model(s) and gives every request:
+
+- a shared, pooled httpx connection to Groq (keep-alive, bounded size)
+- a per-attempt timeout on the first response and an overall deadline
+- retries on timeouts, connection errors, 429 and 5xx with jittered
+  exponential backoff (honouring Retry-After)
+- an optional hedged duplicate request once an attempt has been waiting
+  longer than a percentile of recent latencies; the first to answer wins
+- an optional fallback model once the primary has used up its retries
+
+Streams are only retried or hedged before the first token arrives; after
+that the chunks come from whichever attempt won.
+
+    LLM_RESILIENCE=off          plain ChatGroq, as before
+    LLM_TIMEOUT=10              seconds to the first response per attempt
+    LLM_DEADLINE=30             seconds for the whole request, retries included
+    LLM_MAX_RETRIES=2           retries per model after the first attempt
+    LLM_BACKOFF_BASE=0.25       first backoff ceiling in seconds, doubled per retry
+    LLM_BACKOFF_MAX=4           backoff ceiling
+    LLM_HEDGE_PERCENTILE=95     hedge after this latency percentile (off by default)
+    LLM_HEDGE_MIN_SAMPLES=20    latencies needed before hedging starts
+    LLM_FALLBACK_MODEL=name     secondary Groq model
+    LLM_MAX_CONNECTIONS=20      HTTP connection pool size
+    GROQ_BASE_URL=url           point at another endpoint, e.g. mock_groq.py
+"""
+import asyncio
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Optional
+
+import groq
+import httpx
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from opentelemetry import trace
+from pydantic import PrivateAttr
+
+RETRYABLE = (groq.APIConnectionError, groq.APITimeoutError, groq.RateLimitError, groq.InternalServerError)
+
+
+class LLMTimeout(TimeoutError):
+    pass
+
+
+def is_retryable(error):
+    if isinstance(error, (LLMTimeout, httpx.TransportError) + RETRYABLE):
+        return True
+    return isinstance(error, groq.APIStatusError) and (error.status_code == 429 or error.status_code >= 500)
+
+
+def retry_after(error):
+    # Seconds from a 429's Retry-After header, if it sent one
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class LLMStats:
+    def __init__(self, window=200):
+        self._lock = threading.Lock()
+        self.latencies = deque(maxlen=window)
+        self.counts = {
+            "requests": 0, "retries": 0, "timeouts": 0, "hedges": 0, "hedge_wins": 0,
+            "fallbacks": 0, "failures": 0,
+        }
+
+    def add(self, name, amount=1):
+        with self._lock:
+            self.counts[name] += amount
+
+    def observe(self, seconds):
+        with self._lock:
+            self.latencies.append(seconds)
+
+    def percentile(self, q, min_samples):
+        with self._lock:
+            if len(self.latencies) < min_samples:
+                return None
+            samples = sorted(self.latencies)
+        return samples[min(len(samples) - 1, int(len(samples) * q / 100))]
+
+    def snapshot(self):
+        return {
+            **dict(self.counts),
+            "first_response_p50": self.percentile(50, 1),
+            "first_response_p95": self.percentile(95, 1),
+        }
+
+
+class ResilientChatModel(BaseChatModel):
+    primary: BaseChatModel
+    fallback: Optional[BaseChatModel] = None
+    attempt_timeout: float = 10.0
+    deadline: float = 30.0
+    max_retries: int = 2
+    backoff_base: float = 0.25
+    backoff_max: float = 4.0
+    hedge_percentile: Optional[float] = None
+    hedge_min_samples: int = 20
+
+    _stats: Any = PrivateAttr(default_factory=LLMStats)
+
+    @property
+    def _llm_type(self):
+        return "resilient-" + self.primary._llm_type
+
+    @property
+    def _identifying_params(self):
+        return {
+            "model": getattr(self.primary, "model_name", None),
+            "fallback": getattr(self.fallback, "model_name", None),
+        }
+
+    def stats(self):
+        return self._stats.snapshot()
+
+    def _models(self):
+        yield self.primary
+        if self.fallback is not None:
+            yield self.fallback
+
+    def _hedge_delay(self):
+        if self.hedge_percentile is None:
+            return None
+        return self._stats.percentile(self.hedge_percentile, self.hedge_min_samples)
+
+    def _backoff(self, retry, error, deadline):
+        # Full jitter, but never sooner than Retry-After; None if it would pass the deadline
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** retry))
+        delay = max(delay, retry_after(error) or 0.0)
+        return delay if time.monotonic() + delay < deadline else None
+
+    def _record(self, model, retries, hedge_won):
+        span = trace.get_current_span()
+        span.set_attribute("llm.retries", retries)
+        span.set_attribute("llm.hedge_won", hedge_won)
+        span.set_attribute("llm.fallback", model is not self.primary)
+        if model is not self.primary:
+            self._stats.add("fallbacks")
+        if hedge_won:
+            self._stats.add("hedge_wins")
+
+    # Sync path: each attempt runs on its own daemon thread and reports
+    # through a queue, so a stalled HTTP call can be abandoned
+
+    def _start(self, call, model, attempt_id, events, cancelled):
+        def run():
+            iterator = None
+            try:
+                iterator = call(model)
+                for item in iterator:
+                    if cancelled.is_set():
+                        return
+                    events.put(("item", attempt_id, item))
+                events.put(("done", attempt_id, None))
+            except Exception as exc:
+                events.put(("error", attempt_id, exc))
+            finally:
+                close = getattr(iterator, "close", None)
+                if close is not None:
+                    close()
+
+        threading.Thread(target=run, name=f"llm-attempt-{attempt_id}", daemon=True).start()
+
+    def _attempt(self, call, model, deadline):
+        # Yields (hedge_won, first item) and then the remaining items of the winning attempt
+        events = queue.Queue()
+        cancelled = {0: threading.Event()}
+        self._start(call, model, 0, events, cancelled[0])
+        started = time.monotonic()
+        first_deadline = min(deadline, started + self.attempt_timeout)
+        hedge_delay = self._hedge_delay()
+        hedge_at = started + hedge_delay if hedge_delay is not None else None
+        try:
+            while True:
+                now = time.monotonic()
+                if hedge_at is not None and now >= hedge_at:
+                    hedge_at = None
+                    self._stats.add("hedges")
+                    cancelled[1] = threading.Event()
+                    self._start(call, model, 1, events, cancelled[1])
+                    continue
+                wait = first_deadline - now
+                if hedge_at is not None:
+                    wait = min(wait, hedge_at - now)
+                if wait <= 0:
+                    raise LLMTimeout(f"No response from {getattr(model, 'model_name', model)} after {self.attempt_timeout:g}s")
+                try:
+                    kind, attempt_id, payload = events.get(timeout=wait)
+                except queue.Empty:
+                    continue
+                if kind == "error":
+                    cancelled.pop(attempt_id)
+                    if not cancelled:
+                        raise payload
+                    continue
+                winner = attempt_id
+                break
+
+            self._stats.observe(time.monotonic() - started)
+            for attempt_id, flag in cancelled.items():
+                if attempt_id != winner:
+                    flag.set()
+            if kind == "done":
+                return
+            yield winner == 1, payload
+            while True:
+                wait = deadline - time.monotonic()
+                if wait <= 0:
+                    raise LLMTimeout(f"Response did not finish within the {self.deadline:g}s deadline")
+                try:
+                    kind, attempt_id, payload = events.get(timeout=wait)
+                except queue.Empty:
+                    continue
+                if attempt_id != winner:
+                    continue
+                if kind == "error":
+                    raise payload
+                if kind == "done":
+                    return
+                yield winner == 1, payload
+        finally:
+            for flag in cancelled.values():
+                flag.set()
+
+    def _call(self, call):
+        self._stats.add("requests")
+        deadline = time.monotonic() + self.deadline
+        error = None
+        for model in self._models():
+            for retry in range(self.max_retries + 1):
+                if retry:
+                    delay = self._backoff(retry - 1, error, deadline)
+                    if delay is None:
+                        break
+                    self._stats.add("retries")
+                    time.sleep(delay)
+                attempt = self._attempt(call, model, deadline)
+                try:
+                    hedge_won, first = next(attempt)
+                except StopIteration:
+                    return
+                except Exception as exc:
+                    error = exc
+                    if isinstance(exc, LLMTimeout):
+                        self._stats.add("timeouts")
+                    if not is_retryable(exc):
+                        break
+                    continue
+                self._record(model, retry, hedge_won)
+                yield first
+                for _, item in attempt:
+                    yield item
+                return
+        self._stats.add("failures")
+        raise error or LLMTimeout(f"No response within the {self.deadline:g}s deadline")
+
+    @staticmethod
+    def _result(results):
+        # invoke() leaves token usage in the message's response_metadata;
+        # put it back in llm_output for callbacks that read it there
+        message = results[0] if results else AIMessage(content="")
+        metadata = getattr(message, "response_metadata", None) or {}
+        llm_output = {key: metadata[key] for key in ("token_usage", "model_name") if key in metadata}
+        return ChatResult(generations=[ChatGeneration(message=message)], llm_output=llm_output or None)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return self._result(list(self._call(lambda model: iter([model.invoke(messages, stop=stop, **kwargs)]))))
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        for chunk in self._call(lambda model: model.stream(messages, stop=stop, **kwargs)):
+            generation = ChatGenerationChunk(message=chunk)
+            if run_manager is not None:
+                run_manager.on_llm_new_token(chunk.text, chunk=generation)
+            yield generation
+
+    # Async path: the same logic with tasks instead of threads
+
+    async def _aattempt(self, call, model, deadline):
+        events = asyncio.Queue()
+        tasks = {}
+
+        async def run(attempt_id):
+            try:
+                async for item in call(model):
+                    await events.put(("item", attempt_id, item))
+                await events.put(("done", attempt_id, None))
+            except Exception as exc:
+                await events.put(("error", attempt_id, exc))
+
+        tasks[0] = asyncio.ensure_future(run(0))
+        started = time.monotonic()
+        first_deadline = min(deadline, started + self.attempt_timeout)
+        hedge_delay = self._hedge_delay()
+        hedge_at = started + hedge_delay if hedge_delay is not None else None
+        try:
+            while True:
+                now = time.monotonic()
+                if hedge_at is not None and now >= hedge_at:
+                    hedge_at = None
+                    self._stats.add("hedges")
+                    tasks[1] = asyncio.ensure_future(run(1))
+                    continue
+                wait = first_deadline - now
+                if hedge_at is not None:
+                    wait = min(wait, hedge_at - now)
+                if wait <= 0:
+                    raise LLMTimeout(f"No response from {getattr(model, 'model_name', model)} after {self.attempt_timeout:g}s")
+                try:
+                    kind, attempt_id, payload = await asyncio.wait_for(events.get(), wait)
+                except asyncio.TimeoutError:
+                    continue
+                if kind == "error":
+                    tasks.pop(attempt_id)
+                    if not tasks:
+                        raise payload
+                    continue
+                winner = attempt_id
+                break
+
+            self._stats.observe(time.monotonic() - started)
+            for attempt_id, task in tasks.items():
+                if attempt_id != winner:
+                    task.cancel()
+            if kind == "done":
+                return
+            yield winner == 1, payload
+            while True:
+                wait = deadline - time.monotonic()
+                if wait <= 0:
+                    raise LLMTimeout(f"Response did not finish within the {self.deadline:g}s deadline")
+                try:
+                    kind, attempt_id, payload = await asyncio.wait_for(events.get(), wait)
+                except asyncio.TimeoutError:
+                    continue
+                if attempt_id != winner:
+                    continue
+                if kind == "error":
+                    raise payload
+                if kind == "done":
+                    return
+                yield winner == 1, payload
+        finally:
+            for task in tasks.values():
+                task.cancel()
+
+    async def _acall(self, call):
+        self._stats.add("requests")
+        deadline = time.monotonic() + self.deadline
+        error = None
+        for model in self._models():
+            for retry in range(self.max_retries + 1):
+                if retry:
+                    delay = self._backoff(retry - 1, error, deadline)
+                    if delay is None:
+                        break
+                    self._stats.add("retries")
+                    await asyncio.sleep(delay)
+                attempt = self._aattempt(call, model, deadline)
+                try:
+                    hedge_won, first = await attempt.__anext__()
+                except StopAsyncIteration:
+                    return
+                except Exception as exc:
+                    error = exc
+                    if isinstance(exc, LLMTimeout):
+                        self._stats.add("timeouts")
+                    if not is_retryable(exc):
+                        break
+                    continue
+                self._record(model, retry, hedge_won)
+                yield first
+                async for _, item in attempt:
+                    yield item
+                return
+        self._stats.add("failures")
+        raise error or LLMTimeout(f"No response within the {self.deadline:g}s deadline")
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        async def call(model):
+            yield await model.ainvoke(messages, stop=stop, **kwargs)
+
+        return self._result([message async for message in self._acall(call)])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        async for chunk in self._acall(lambda model: model.astream(messages, stop=stop, **kwargs)):
+            generation = ChatGenerationChunk(message=chunk)
+            if run_manager is not None:
+                await run_manager.on_llm_new_token(chunk.text, chunk=generation)
+            yield generation
+
+
+_http_clients = None
+_http_lock = threading.Lock()
+
+
+def http_clients():
+    # One sync and one async pool shared by every model in the process
+    global _http_clients
+    with _http_lock:
+        if _http_clients is None:
+            limits = httpx.Limits(
+                max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "20")),
+                max_keepalive_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "20")),
+                keepalive_expiry=60,
+            )
+            timeout = httpx.Timeout(float(os.getenv("LLM_TIMEOUT", "10")), connect=5.0)
+            _http_clients = (httpx.Client(limits=limits, timeout=timeout), httpx.AsyncClient(limits=limits, timeout=timeout))
+        return _http_clients
+
+
+def chat_groq(model_name):
+    from langchain_groq import ChatGroq
+
+    client, async_client = http_clients()
+    return ChatGroq(
+        model=model_name,
+        groq_api_base=os.getenv("GROQ_BASE_URL") or None,
+        http_client=client,
+        http_async_client=async_client,
+        # ResilientChatModel owns retries; the read timeout bounds stalled streams
+        max_retries=0,
+        request_timeout=float(os.getenv("LLM_DEADLINE", "30")),
+    )
+
+
+def load_llm(model_name):
+    if os.getenv("LLM_RESILIENCE", "on").lower() == "off":
+        from langchain_groq import ChatGroq
+        return ChatGroq(model=model_name)
+
+    fallback_name = os.getenv("LLM_FALLBACK_MODEL")
+    hedge_percentile = os.getenv("LLM_HEDGE_PERCENTILE")
+    return ResilientChatModel(
+        primary=chat_groq(model_name),
+        fallback=chat_groq(fallback_name) if fallback_name else None,
+        attempt_timeout=float(os.getenv("LLM_TIMEOUT", "10")),
+        deadline=float(os.getenv("LLM_DEADLINE", "30")),
+        max_retries=int(os.getenv("LLM_MAX_RETRIES", "2")),
+        backoff_base=float(os.getenv("LLM_BACKOFF_BASE", "0.25")),
+        backoff_max=float(os.getenv("LLM_BACKOFF_MAX", "4")),
+        hedge_percentile=float(hedge_percentile) if hedge_percentile else None,
+        hedge_min_samples=int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20")),
+    )
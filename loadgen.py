@@ -0,0 +1,254 @@
+"""Load generator for the real rag_chain.
+
+Simulates many concurrent users. Each session asks questions one after
+another with a random think time in between, through the same entry
+points the API uses (rag.astream_chain / rag.ainvoke_chain with a session
+id). Admission control, coalescing, the resilient LLM client, retrieval
+and the prompt are all exercised as they are in production. Run with
+ADMISSION=off to measure the pipeline without the production rate limits.
+
+Point it at mock_groq.py with --mock to test without Groq quota. The mock
+is started on a free port, with --mock-args passed through, for example
+to add a heavy latency tail or a rate limit.
+
+Reports throughput, time-to-first-token and total latency percentiles,
+failures by kind, and the LLM, admission, coalescing and mock server
+stats, and saves everything as JSON.
+
+    python loadgen.py --mock [--sessions 20] [--duration 60] [--think-time 1.0]
+                      [--mode stream|invoke] [--precheck] [--unique]
+                      [--mock-args "--latency-dist lognormal --latency 0.4 --rpm 600"]
+    python loadgen.py --sessions 5 --questions-per-session 3     # real Groq
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shlex
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from datetime import datetime, timezone
+
+import numpy as np
+
+import rag
+from admission import Rejected
+from numpy_index import DEFAULT_QUERIES
+
+RESULTS_DIR = "bench_results"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_mock(port, extra_args):
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "mock_groq.py"),
+         "--port", str(port), *shlex.split(extra_args)],
+        # Injected errors would otherwise fill the terminal with access log lines
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/stats", timeout=1).read()
+            return process
+        except OSError:
+            if process.poll() is not None:
+                raise SystemExit(f"mock_groq.py exited with status {process.returncode}")
+            time.sleep(0.1)
+    process.terminate()
+    raise SystemExit("mock_groq.py did not start")
+
+
+def mock_stats(base_url):
+    try:
+        with urllib.request.urlopen(f"{base_url}/stats", timeout=2) as response:
+            return json.loads(response.read())
+    except OSError:
+        return None
+
+
+def percentiles(samples):
+    if not samples:
+        return None
+    values = np.asarray(samples) * 1000
+    return {
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+        "p99": float(np.percentile(values, 99)),
+        "max": float(values.max()),
+        "n": int(values.size),
+    }
+
+
+async def ask(question, session_id, mode, precheck):
+    # Returns (seconds to the first token, route); raises on failure
+    started = time.perf_counter()
+    if precheck:
+        answer, source, _ = await asyncio.to_thread(rag.precheck, question)
+        if answer is not None:
+            return time.perf_counter() - started, source
+    if mode == "invoke":
+        await rag.ainvoke_chain(question, session_id)
+        return time.perf_counter() - started, "chain"
+    first_token = None
+    async for _ in rag.astream_chain(question, session_id):
+        if first_token is None:
+            first_token = time.perf_counter() - started
+    return first_token if first_token is not None else time.perf_counter() - started, "chain"
+
+
+async def session(index, args, questions, stop_at, results):
+    rng = random.Random(args.seed * 1000 + index)
+    session_id = f"loadgen-{index}"
+    # Stagger the start so sessions don't arrive in lockstep
+    await asyncio.sleep(rng.uniform(0, args.think_time))
+    asked = 0
+    while time.monotonic() < stop_at and (not args.questions_per_session or asked < args.questions_per_session):
+        question = rng.choice(questions)
+        if args.unique:
+            question = f"{question} ({session_id}/{asked})"
+        asked += 1
+        started = time.perf_counter()
+        try:
+            first_token, route = await ask(question, session_id, args.mode, args.precheck)
+            results.append({"ok": True, "first_token": first_token, "total": time.perf_counter() - started, "route": route})
+        except Rejected as rejected:
+            results.append({"ok": False, "error": f"rejected:{rejected.reason}", "total": time.perf_counter() - started})
+        except Exception as exc:
+            results.append({"ok": False, "error": type(exc).__name__, "total": time.perf_counter() - started})
+        if args.think_time:
+            await asyncio.sleep(rng.expovariate(1.0 / args.think_time))
+
+
+async def drive(args, questions):
+    results = []
+    stop_at = time.monotonic() + args.duration
+    started = time.perf_counter()
+    await asyncio.gather(*(session(index, args, questions, stop_at, results) for index in range(args.sessions)))
+    return results, time.perf_counter() - started
+
+
+def summarize(results, elapsed):
+    ok = [result for result in results if result["ok"]]
+    errors = {}
+    for result in results:
+        if not result["ok"]:
+            errors[result["error"]] = errors.get(result["error"], 0) + 1
+    routes = {}
+    for result in ok:
+        routes[result["route"]] = routes.get(result["route"], 0) + 1
+    return {
+        "requests": len(results),
+        "completed": len(ok),
+        "failed": len(results) - len(ok),
+        "errors": errors,
+        "routes": routes,
+        "elapsed": elapsed,
+        "throughput": len(ok) / elapsed if elapsed else 0.0,
+        "first_token_ms": percentiles([result["first_token"] for result in ok]),
+        "total_ms": percentiles([result["total"] for result in ok]),
+    }
+
+
+def component_stats():
+    components = {}
+    if rag.llm.ready and hasattr(rag.llm.get(), "stats"):
+        components["llm"] = rag.llm.get().stats()
+    if rag.admission.ready and rag.admission.get() is not None:
+        components["admission"] = rag.admission.get().stats()
+    if rag.single_flight.ready and rag.single_flight.get() is not None:
+        components["single_flight"] = rag.single_flight.get().stats()
+    return components
+
+
+def print_report(result):
+    summary = result["summary"]
+    print(f"\n{summary['completed']}/{summary['requests']} completed in {summary['elapsed']:.1f}s "
+          f"with {result['config']['sessions']} sessions: {summary['throughput']:.2f} answers/s")
+    for name in ("first_token_ms", "total_ms"):
+        stats = summary[name]
+        if stats:
+            print(f"  {name:15s} p50 {stats['p50']:8.1f}  p95 {stats['p95']:8.1f}  p99 {stats['p99']:8.1f}  max {stats['max']:8.1f}")
+    if summary["errors"]:
+        print("  failures: " + ", ".join(f"{name} x{count}" for name, count in sorted(summary["errors"].items())))
+    if summary["routes"]:
+        print("  routes:   " + ", ".join(f"{name} x{count}" for name, count in sorted(summary["routes"].items())))
+    llm = result["components"].get("llm")
+    if llm:
+        print("  llm:      " + ", ".join(f"{key} {value}" for key, value in llm.items() if isinstance(value, int)))
+    if result.get("mock"):
+        mock = result["mock"]
+        print(f"  mock:     {mock['requests']} requests, {mock['rate_limited']} rate limited, {mock['errors']} errors, "
+              f"{mock['stream_errors']} cut streams, max {mock['max_in_flight']} in flight")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive concurrent simulated sessions through rag_chain.")
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=60, help="seconds before sessions stop asking")
+    parser.add_argument("--questions-per-session", type=int, default=0, help="stop each session after this many; 0 for no limit")
+    parser.add_argument("--think-time", type=float, default=1.0, help="mean seconds between a session's questions")
+    parser.add_argument("--mode", choices=["stream", "invoke"], default="stream")
+    parser.add_argument("--precheck", action="store_true", help="let the router and answer cache answer first")
+    parser.add_argument("--unique", action="store_true", help="make every question distinct, defeating caching and coalescing")
+    parser.add_argument("--queries", help="file with one question per line")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mock", action="store_true", help="start mock_groq.py and point the LLM client at it")
+    parser.add_argument("--mock-args", default="", help="extra mock_groq.py arguments")
+    parser.add_argument("--output", help=f"results file (default: {RESULTS_DIR}/loadgen-<timestamp>.json)")
+    args = parser.parse_args()
+
+    questions = DEFAULT_QUERIES
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+
+    mock = None
+    if args.mock:
+        port = free_port()
+        mock = start_mock(port, args.mock_args)
+        os.environ["GROQ_BASE_URL"] = f"http://127.0.0.1:{port}"
+        os.environ.setdefault("GROQ_API_KEY", "mock")
+    try:
+        rag.configure_environment()
+        load_started = time.perf_counter()
+        rag.warmup()
+        print(f"Pipeline loaded in {time.perf_counter() - load_started:.1f}s; "
+              f"driving {args.sessions} sessions for up to {args.duration:.0f}s")
+        results, elapsed = asyncio.run(drive(args, questions))
+        result = {
+            "meta": {
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "llm_endpoint": os.getenv("GROQ_BASE_URL") or "groq",
+            },
+            "config": {key: value for key, value in vars(args).items() if key != "output"},
+            "summary": summarize(results, elapsed),
+            "components": component_stats(),
+            "mock": mock_stats(os.environ["GROQ_BASE_URL"]) if mock else None,
+        }
+    finally:
+        if mock is not None:
+            mock.terminate()
+            mock.wait()
+
+    print_report(result)
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, "loadgen-" + datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"Saved {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""Local stand-in for the Groq chat completions API.
+
+Serves /openai/v1/chat/completions in the OpenAI wire format that ChatGroq
+speaks, streamed or not, so the app can be load tested and its tail
+latency reproduced without a Groq key or quota:
+
+- time to first byte is drawn from a fixed, uniform, normal, lognormal or
+  pareto distribution, plus an optional fraction of stalled requests
+- streamed answers come out at a set number of tokens per second
+- a fraction of requests fail with a 5xx, or are cut off mid-stream
+- requests-per-minute and tokens-per-minute limits answer 429 with
+  Retry-After and Groq's x-ratelimit-* headers; 429s can also be injected
+  at random
+
+GET /stats reports request counts, in-flight requests and latency
+percentiles; DELETE /stats resets them.
+
+    python mock_groq.py [--port 8090] [--latency-dist lognormal --latency 0.3 --sigma 0.6]
+                        [--tokens-per-second 200] [--answer-words 80]
+                        [--error-rate 0.02 --error-codes 500,503] [--stream-error-rate 0.01]
+                        [--rpm 300 --tpm 60000] [--rate-limit-rate 0.01]
+                        [--slow-rate 0.05 --slow-latency 20]
+
+    GROQ_BASE_URL=http://127.0.0.1:8090 GROQ_API_KEY=mock streamlit run app.py
+    python loadgen.py --mock   # starts this server and drives rag_chain against it
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+import uuid
+from collections import deque
+
+import tornado.ioloop
+import tornado.web
+
+ANSWER = (
+    "Utsav Soni has hands-on experience building machine learning and retrieval applications in Python. "
+    "Thanks for asking..!"
+)
+
+DISTRIBUTIONS = ["fixed", "uniform", "normal", "lognormal", "pareto"]
+
+
+def sample_latency(options, rng=random):
+    # Seconds before the first byte. --latency is the median (lognormal) or
+    # minimum (pareto), otherwise the mean
+    if rng.random() < options.slow_rate:
+        return options.slow_latency
+    dist = options.latency_dist
+    if dist == "fixed":
+        latency = options.latency
+    elif dist == "uniform":
+        latency = options.latency + rng.uniform(-options.jitter, options.jitter)
+    elif dist == "normal":
+        latency = rng.gauss(options.latency, options.jitter)
+    elif dist == "lognormal":
+        latency = options.latency * math.exp(rng.gauss(0.0, options.sigma))
+    else:
+        latency = options.latency * rng.paretovariate(options.alpha)
+    return max(0.0, latency)
+
+
+def answer_words(options):
+    words = ANSWER.split(" ")
+    if options.answer_words:
+        words = [words[index % len(words)] for index in range(options.answer_words)]
+    return words
+
+
+class RateLimiter:
+    # Sliding one-minute windows of requests and tokens, like Groq's limits
+
+    def __init__(self, rpm=0, tpm=0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests = deque()
+        self.tokens = deque()
+
+    def _trim(self, now):
+        while self.requests and now - self.requests[0] >= 60:
+            self.requests.popleft()
+        while self.tokens and now - self.tokens[0][0] >= 60:
+            self.tokens.popleft()
+
+    def check(self, tokens, now=None):
+        # Returns None when admitted, else (limit type, seconds until it resets)
+        now = time.monotonic() if now is None else now
+        self._trim(now)
+        if self.rpm and len(self.requests) >= self.rpm:
+            return "requests", 60 - (now - self.requests[0])
+        if self.tpm and sum(count for _, count in self.tokens) + tokens > self.tpm:
+            return "tokens", 60 - (now - self.tokens[0][0]) if self.tokens else 60.0
+        self.requests.append(now)
+        self.tokens.append((now, tokens))
+        return None
+
+    def headers(self, now=None):
+        now = time.monotonic() if now is None else now
+        self._trim(now)
+        headers = {}
+        if self.rpm:
+            headers["x-ratelimit-limit-requests"] = str(self.rpm)
+            headers["x-ratelimit-remaining-requests"] = str(max(0, self.rpm - len(self.requests)))
+            headers["x-ratelimit-reset-requests"] = f"{60 - (now - self.requests[0]) if self.requests else 0:.2f}s"
+        if self.tpm:
+            used = sum(count for _, count in self.tokens)
+            headers["x-ratelimit-limit-tokens"] = str(self.tpm)
+            headers["x-ratelimit-remaining-tokens"] = str(max(0, self.tpm - used))
+            headers["x-ratelimit-reset-tokens"] = f"{60 - (now - self.tokens[0][0]) if self.tokens else 0:.2f}s"
+        return headers
+
+
+class Stats:
+    def __init__(self, window=5000):
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        self.counts = {"requests": 0, "streams": 0, "errors": 0, "stream_errors": 0, "rate_limited": 0}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.latencies = deque(maxlen=self.window)
+        self.started = time.monotonic()
+
+    def report(self):
+        latencies = sorted(self.latencies)
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))] if latencies else 0.0
+
+        elapsed = time.monotonic() - self.started
+        return {
+            **self.counts,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "requests_per_second": self.counts["requests"] / elapsed if elapsed else 0.0,
+            "latency_p50": percentile(50),
+            "latency_p95": percentile(95),
+            "latency_p99": percentile(99),
+        }
+
+
+class CompletionsHandler(tornado.web.RequestHandler):
+    def initialize(self, options, stats, limiter):
+        self.options = options
+        self.stats = stats
+        self.limiter = limiter
+
+    def error(self, status, message, kind, code=None):
+        self.set_status(status)
+        self.finish({"error": {"message": message, "type": kind, **({"code": code} if code else {})}})
+
+    async def post(self):
+        options = self.options
+        stats = self.stats
+        body = json.loads(self.request.body or b"{}")
+        model = body.get("model", "mock")
+        stats.counts["requests"] += 1
+
+        words = answer_words(options)
+        prompt_tokens = sum(len(str(message.get("content", ""))) for message in body.get("messages", [])) // 4
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(words), "total_tokens": prompt_tokens + len(words)}
+
+        limited = self.limiter.check(usage["total_tokens"])
+        if limited is None and random.random() < options.rate_limit_rate:
+            limited = "requests", 1.0
+        for name, value in self.limiter.headers().items():
+            self.set_header(name, value)
+        if limited is not None:
+            kind, reset = limited
+            stats.counts["rate_limited"] += 1
+            self.set_header("retry-after", str(max(1, math.ceil(reset))))
+            self.error(429, f"Rate limit reached for model `{model}` on {kind}. Please try again in {reset:.2f}s.",
+                       kind, "rate_limit_exceeded")
+            return
+
+        if random.random() < options.error_rate:
+            stats.counts["errors"] += 1
+            self.error(random.choice(options.error_codes), "Injected upstream error", "internal_server_error")
+            return
+
+        stats.in_flight += 1
+        stats.max_in_flight = max(stats.max_in_flight, stats.in_flight)
+        try:
+            latency = sample_latency(options)
+            stats.latencies.append(latency)
+            await asyncio.sleep(latency)
+            await self.respond(body, model, words, usage)
+        finally:
+            stats.in_flight -= 1
+
+    async def respond(self, body, model, words, usage):
+        options = self.options
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        if not body.get("stream"):
+            self.finish({
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(words)}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+            return
+
+        self.stats.counts["streams"] += 1
+        token_delay = 1.0 / options.tokens_per_second if options.tokens_per_second else options.token_delay
+        # Cut off partway through, the way a dropped upstream connection looks
+        cut_at = random.randrange(1, len(words)) if len(words) > 1 and random.random() < options.stream_error_rate else None
+        self.set_header("Content-Type", "text/event-stream")
+        for position, word in enumerate(words):
+            if position == cut_at:
+                self.stats.counts["stream_errors"] += 1
+                self.request.connection.stream.close()
+                return
+            chunk = {
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": {"content": word if position == 0 else " " + word}, "finish_reason": None}],
+            }
+            self.write(f"data: {json.dumps(chunk)}\n\n")
+            await self.flush()
+            if token_delay:
+                await asyncio.sleep(token_delay)
+        final = {
+            "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            "x_groq": {"id": completion_id, "usage": usage},
+        }
+        self.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n")
+        self.finish()
+
+
+class StatsHandler(tornado.web.RequestHandler):
+    def initialize(self, stats):
+        self.stats = stats
+
+    def get(self):
+        self.finish(self.stats.report())
+
+    def delete(self):
+        self.stats.reset()
+        self.finish(self.stats.report())
+
+
+def make_app(options):
+    stats = Stats()
+    limiter = RateLimiter(options.rpm, options.tpm)
+    return tornado.web.Application([
+        (r"/openai/v1/chat/completions", CompletionsHandler, {"options": options, "stats": stats, "limiter": limiter}),
+        (r"/stats", StatsHandler, {"stats": stats}),
+    ])
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Mock Groq chat completions server.")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency-dist", choices=DISTRIBUTIONS, default="uniform")
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds before the first byte")
+    parser.add_argument("--jitter", type=float, default=0.05, help="uniform half-width or normal standard deviation")
+    parser.add_argument("--sigma", type=float, default=0.5, help="lognormal shape")
+    parser.add_argument("--alpha", type=float, default=3.0, help="pareto shape; lower means a heavier tail")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="seconds between streamed tokens")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="streaming rate; overrides --token-delay")
+    parser.add_argument("--answer-words", type=int, default=0, help="answer length; 0 uses the canned answer as is")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with an error")
+    parser.add_argument("--error-codes", type=lambda value: [int(code) for code in value.split(",")], default=[500])
+    parser.add_argument("--stream-error-rate", type=float, default=0.0, help="fraction of streams cut off midway")
+    parser.add_argument("--rpm", type=int, default=0, help="requests per minute before 429s; 0 for no limit")
+    parser.add_argument("--tpm", type=int, default=0, help="tokens per minute before 429s; 0 for no limit")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of requests answered with a 429")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="fraction of requests that stall")
+    parser.add_argument("--slow-latency", type=float, default=20.0)
+    return parser.parse_args(argv)
+
+
+def main():
+    options = parse_args()
+    make_app(options).listen(options.port, address="127.0.0.1")
+    print(f"Mock Groq listening on http://127.0.0.1:{options.port}")
+    tornado.ioloop.IOLoop.current().start()
+
+
+if __name__ == "__main__":
+    main()
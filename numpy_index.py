@@ -0,0 +1,158 @@
+"""Exact in-process vector search over the chunks stored in ./chroma_db.
+
+The whole collection is small enough to keep as one contiguous matrix, so
+top-k is a single matmul plus argpartition instead of a trip through
+Chroma's SQLite and HNSW layers. Enable it in the app with
+RETRIEVER_BACKEND=numpy (NUMPY_INDEX_DTYPE=float16 halves the memory).
+
+    python numpy_index.py --check [--queries questions.txt] [--k 4]
+"""
+import argparse
+import time
+from typing import Any, List
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+DEFAULT_QUERIES = [
+    "What are his skills?",
+    "Tell me about his experience",
+    "Which programming languages does Utsav know?",
+    "What projects has he worked on?",
+    "Where did he study?",
+    "Does he have machine learning experience?",
+    "What certifications does he have?",
+    "Why should we hire Utsav Soni?",
+]
+
+
+class NumpyIndex:
+    def __init__(self, ids, vectors, documents, metadatas, space="l2", dtype=np.float32):
+        self.ids = list(ids)
+        self.documents = list(documents)
+        self.metadatas = [metadata or {} for metadata in metadatas]
+        self.space = space
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if space == "cosine":
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.where(norms == 0, 1, norms)
+        # ||x||^2 is query independent, so L2 ranking only needs one matmul
+        self.sq_norms = np.einsum("ij,ij->i", vectors, vectors)
+        self.vectors = np.ascontiguousarray(vectors, dtype=dtype)
+
+    @classmethod
+    def from_chroma(cls, vectorstore, dtype=np.float32):
+        collection = vectorstore._collection
+        data = collection.get(include=["embeddings", "documents", "metadatas"])
+        space = (collection.metadata or {}).get("hnsw:space", "l2")
+        vectors = np.asarray(data["embeddings"], dtype=np.float32)
+        if len(vectors) == 0:
+            vectors = vectors.reshape(0, 0)
+        return cls(data["ids"], vectors, data["documents"], data["metadatas"], space=space, dtype=dtype)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, query_vector, k=4):
+        # Returns (row indices, distances) ordered nearest first, using the
+        # same distance as the Chroma collection
+        k = min(k, len(self.ids))
+        if k == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        query = np.asarray(query_vector, dtype=np.float32)
+        if self.space == "cosine":
+            query = query / (np.linalg.norm(query) or 1.0)
+        dots = (self.vectors @ query.astype(self.vectors.dtype)).astype(np.float32)
+        if self.space == "l2":
+            distances = self.sq_norms - 2 * dots + float(query @ query)
+        else:
+            distances = 1.0 - dots
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top], kind="stable")]
+        return top, distances[top]
+
+    def search_documents(self, query_vector, k=4):
+        # The distance goes in the metadata for the query log
+        rows, distances = self.search(query_vector, k)
+        return [
+            Document(id=self.ids[row], page_content=self.documents[row], metadata={**self.metadatas[row], "distance": float(distance)})
+            for row, distance in zip(rows, distances)
+        ]
+
+
+class NumpyRetriever(BaseRetriever):
+    # Drop-in for vectorstore.as_retriever(search_type="similarity")
+    index: Any
+    embeddings: Any
+    k: int = 4
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self.index.search_documents(self.embeddings.embed_query(query), self.k)
+
+
+def _percentile(values, q):
+    return float(np.percentile(values, q)) * 1000 if values else 0.0
+
+
+def check_parity(vectorstore, embeddings, queries, k=4, dtype=np.float32, repeats=20):
+    index = NumpyIndex.from_chroma(vectorstore, dtype=dtype)
+    collection = vectorstore._collection
+    recalls = []
+    chroma_times = []
+    numpy_times = []
+    for query in queries:
+        vector = embeddings.embed_query(query)
+        expected = collection.query(query_embeddings=[vector], n_results=k, include=[])["ids"][0]
+        rows, _ = index.search(vector, k)
+        got = [index.ids[row] for row in rows]
+        recalls.append(len(set(expected) & set(got)) / max(len(expected), 1))
+
+        for _ in range(repeats):
+            started = time.perf_counter()
+            collection.query(query_embeddings=[vector], n_results=k, include=["documents", "metadatas"])
+            chroma_times.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            index.search_documents(vector, k)
+            numpy_times.append(time.perf_counter() - started)
+
+    return {
+        "vectors": len(index),
+        "dtype": np.dtype(dtype).name,
+        "k": k,
+        "recall_at_k": float(np.mean(recalls)) if recalls else 0.0,
+        "chroma_ms": {"p50": _percentile(chroma_times, 50), "p95": _percentile(chroma_times, 95)},
+        "numpy_ms": {"p50": _percentile(numpy_times, 50), "p95": _percentile(numpy_times, 95)},
+    }
+
+
+def main():
+    import rag
+
+    parser = argparse.ArgumentParser(description="Compare the NumPy index against Chroma.")
+    parser.add_argument("--check", action="store_true", help="run recall parity and latency comparison")
+    parser.add_argument("--queries", help="file with one question per line")
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+    args = parser.parse_args()
+    if not args.check:
+        parser.print_help()
+        return
+
+    queries = DEFAULT_QUERIES
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+
+    rag.configure_environment()
+    report = check_parity(rag.get_vectorstore(), rag.get_embeddings(), queries, k=args.k, dtype=np.dtype(args.dtype))
+    print(
+        f"{report['vectors']} vectors ({report['dtype']}), recall@{report['k']} vs Chroma: {report['recall_at_k']:.3f}\n"
+        f"Chroma search p50 {report['chroma_ms']['p50']:.3f} ms, p95 {report['chroma_ms']['p95']:.3f} ms\n"
+        f"NumPy  search p50 {report['numpy_ms']['p50']:.3f} ms, p95 {report['numpy_ms']['p95']:.3f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
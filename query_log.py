@@ -0,0 +1,440 @@
+"""Structured, append-only log of every question, plus an offline report.
+
+Nothing used to record what was asked or how long it took;
+st.session_state.chat_history disappears with the session. Each request
+now leaves one JSON line with:
+
+- the question, session, route and cache outcome, and total latency
+- everything the pipeline put on the request span: queue wait,
+  coalescing, deadline misses, context savings, LLM retries
+- per-stage timings of the rag_chain call (retrieval, context, prompt,
+  LLM first token and total, parsing)
+- retrieved chunk ids, with distances where the retriever reports them
+- prompt and completion token counts
+
+Requests only put the record on a queue. A writer thread appends the
+records in batches and rotates the file once it gets large. If the queue
+is full, records are dropped and counted rather than slowing requests
+down.
+
+    QUERY_LOG=off
+    QUERY_LOG_PATH=query_log.jsonl
+    QUERY_LOG_MAX_MB=100        rotate to query_log.jsonl.<timestamp> past this size
+
+    python query_log.py --report [--since 24] [--bucket 60] [--top 20] [--faq-questions top.txt]
+"""
+import argparse
+import contextlib
+import contextvars
+import glob
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+from datetime import datetime
+
+from langchain_core.callbacks import BaseCallbackHandler
+from opentelemetry import trace
+
+from answer_cache import normalize_question
+
+DEFAULT_PATH = "query_log.jsonl"
+
+# The record of the request running in this context, for the callback handler
+_current = contextvars.ContextVar("query_log_record", default=None)
+
+
+class LoggedSpan(trace.Span):
+    # Stands in for the request span so every set_attribute() call, from any
+    # module, also lands in the log record. Everything else goes to the real span
+
+    def __init__(self, span, attributes):
+        self._span = span
+        self._attributes = attributes
+
+    def set_attribute(self, key, value):
+        self._attributes[key.removeprefix("rag.")] = value
+        self._span.set_attribute(key, value)
+
+    def set_attributes(self, attributes):
+        for key, value in attributes.items():
+            self.set_attribute(key, value)
+
+    def get_span_context(self):
+        return self._span.get_span_context()
+
+    def add_event(self, name, attributes=None, timestamp=None):
+        self._span.add_event(name, attributes, timestamp)
+
+    def update_name(self, name):
+        self._span.update_name(name)
+
+    def is_recording(self):
+        return self._span.is_recording()
+
+    def set_status(self, status, description=None):
+        self._span.set_status(status, description)
+
+    def record_exception(self, exception, attributes=None, timestamp=None, escaped=False):
+        self._span.record_exception(exception, attributes, timestamp, escaped)
+
+    def end(self, end_time=None):
+        self._span.end(end_time)
+
+
+class QueryLog:
+    def __init__(self, path=DEFAULT_PATH, max_bytes=100 * 1024 * 1024, batch_size=200, flush_interval=1.0,
+                 max_queue=10000):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.rotations = 0
+        self._writer = threading.Thread(target=self._run, name="query-log", daemon=True)
+        self._writer.start()
+
+    @contextlib.contextmanager
+    def request(self, question, span, session_id=None):
+        # Yields the span to use for the request; the record is queued on exit
+        record = {"ts": time.time(), "question": question, "session": session_id, "attributes": {}}
+        logged = LoggedSpan(span, record["attributes"])
+        token = _current.set(record)
+        started = time.perf_counter()
+        try:
+            with trace.use_span(logged, end_on_exit=False):
+                yield logged
+        except BaseException as exc:
+            record["error"] = type(exc).__name__
+            raise
+        finally:
+            _current.reset(token)
+            record["total_ms"] = (time.perf_counter() - started) * 1000
+            # The chain behind a degraded answer may still be adding stages
+            self.record({key: dict(value) if isinstance(value, dict) else value for key, value in record.items()})
+
+    def record(self, record):
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception as exc:
+                print(f"Query log write failed: {type(exc).__name__}: {exc}", file=sys.stderr, flush=True)
+                with self._lock:
+                    self.dropped += len(batch)
+
+    def _write(self, batch):
+        # Records are serialized here, off the request thread
+        lines = [json.dumps(record, default=str) + "\n" for record in batch]
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.writelines(lines)
+            size = f.tell()
+        with self._lock:
+            self.written += len(batch)
+            self.batches += 1
+        if size > self.max_bytes:
+            os.replace(self.path, f"{self.path}.{datetime.now().strftime('%Y%m%d-%H%M%S')}")
+            with self._lock:
+                self.rotations += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "path": self.path,
+                "written": self.written,
+                "dropped": self.dropped,
+                "batches": self.batches,
+                "rotations": self.rotations,
+                "queued": self._queue.qsize(),
+            }
+
+
+# Run names from rag.build_rag_chain mapped to stage names
+STAGES = {
+    "format_docs": "context",
+    "assemble_context": "context",
+    "PromptTemplate": "prompt",
+    "StrOutputParser": "parse",
+}
+
+
+class QueryLogHandler(BaseCallbackHandler):
+    # Adds stage timings, retrieved chunks and token counts from a rag_chain
+    # call to the record of the request that made it
+    run_inline = True
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # run id -> (record, stage name, start time)
+        self._runs = {}
+
+    def _start(self, run_id, parent_run_id, stage):
+        with self._lock:
+            if parent_run_id is None:
+                record = _current.get()
+            else:
+                parent = self._runs.get(parent_run_id)
+                record = parent[0] if parent else None
+            if record is not None:
+                self._runs[run_id] = (record, stage, time.perf_counter())
+
+    def _end(self, run_id):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is None or run[1] is None:
+            return None
+        record, stage, started = run
+        record.setdefault("stages", {})[stage] = (time.perf_counter() - started) * 1000
+        return record
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        stage = "chain" if parent_run_id is None else STAGES.get(kwargs.get("name") or "")
+        self._start(run_id, parent_run_id, stage)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_retriever_start(self, serialized, query, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, parent_run_id, "retrieval")
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        record = self._end(run_id)
+        if record is not None:
+            record["chunks"] = [
+                {
+                    "id": doc.id or doc.metadata.get("id"),
+                    **({"distance": doc.metadata["distance"]} if "distance" in doc.metadata else {}),
+                    "chars": len(doc.page_content),
+                }
+                for doc in documents
+            ]
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, parent_run_id, "llm")
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        with self._lock:
+            run = self._runs.get(run_id)
+        if run is not None:
+            run[0].setdefault("stages", {}).setdefault("llm_first_token", (time.perf_counter() - run[2]) * 1000)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        record = self._end(run_id)
+        if record is None:
+            return
+        usage = dict((response.llm_output or {}).get("token_usage") or {})
+        if not usage:
+            # Streaming responses carry usage on the message instead
+            for generations in response.generations:
+                for generation in generations:
+                    metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                    if metadata:
+                        usage = {"prompt_tokens": metadata.get("input_tokens"), "completion_tokens": metadata.get("output_tokens")}
+        if usage:
+            record["tokens"] = {"prompt": usage.get("prompt_tokens"), "completion": usage.get("completion_tokens")}
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id)
+
+
+callback_handler = QueryLogHandler()
+
+
+# Offline report
+
+
+def read_records(path, since_hours=None):
+    cutoff = time.time() - since_hours * 3600 if since_hours else 0
+    # Rotated files first, so records come out roughly in time order
+    paths = sorted(glob.glob(glob.escape(path) + ".*")) + ([path] if os.path.exists(path) else [])
+    records = []
+    for name in paths:
+        with open(name, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn last line from a crashed writer
+                    continue
+                if record.get("ts", 0) >= cutoff:
+                    records.append(record)
+    records.sort(key=lambda record: record["ts"])
+    return records
+
+
+def _percentiles(values):
+    values = sorted(values)
+    if not values:
+        return {"n": 0}
+
+    def at(p):
+        return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+    return {"n": len(values), "p50": at(50), "p95": at(95), "p99": at(99)}
+
+
+def lru_hit_rate(keys, size):
+    # Hit rate an exact-match LRU cache of this many entries would have had
+    cache = OrderedDict()
+    hits = 0
+    for key in keys:
+        if key in cache:
+            hits += 1
+            cache.move_to_end(key)
+        else:
+            cache[key] = True
+            if len(cache) > size:
+                cache.popitem(last=False)
+    return hits / len(keys) if keys else 0.0
+
+
+def build_report(records, bucket_minutes=60, top=20, cache_sizes=(10, 50, 100, 500, 2000)):
+    routes = Counter(record["attributes"].get("route", "error" if record.get("error") else "unknown") for record in records)
+    buckets = defaultdict(list)
+    for record in records:
+        buckets[int(record["ts"] // (bucket_minutes * 60))].append(record)
+    over_time = [
+        {
+            "start": datetime.fromtimestamp(bucket * bucket_minutes * 60).isoformat(timespec="minutes"),
+            "requests": len(items),
+            "total_ms": _percentiles([item["total_ms"] for item in items]),
+            "cache_hit_rate": sum(1 for item in items if item["attributes"].get("cache_hit")) / len(items),
+            "degraded": sum(1 for item in items if item["attributes"].get("degraded")),
+        }
+        for bucket, items in sorted(buckets.items())
+    ]
+    stage_names = sorted({stage for record in records for stage in record.get("stages", {})})
+    stages = {
+        stage: _percentiles([record["stages"][stage] for record in records if stage in record.get("stages", {})])
+        for stage in stage_names
+    }
+
+    keys = [normalize_question(record["question"]) for record in records]
+    counts = Counter(keys)
+    examples = {}
+    for key, record in zip(keys, records):
+        examples.setdefault(key, record["question"])
+    seen = set()
+    repeats = 0
+    for key in keys:
+        repeats += key in seen
+        seen.add(key)
+    ranked = counts.most_common()
+    chain_calls = sum(1 for record in records if "stages" in record)
+    return {
+        "requests": len(records),
+        "first": datetime.fromtimestamp(records[0]["ts"]).isoformat(timespec="seconds") if records else None,
+        "last": datetime.fromtimestamp(records[-1]["ts"]).isoformat(timespec="seconds") if records else None,
+        "routes": dict(routes),
+        "errors": dict(Counter(record["error"] for record in records if record.get("error"))),
+        "total_ms": _percentiles([record["total_ms"] for record in records]),
+        "chain_total_ms": _percentiles([record["total_ms"] for record in records if "stages" in record]),
+        "stages_ms": stages,
+        "over_time": over_time,
+        "tokens": {
+            "prompt": _percentiles([record["tokens"]["prompt"] for record in records if (record.get("tokens") or {}).get("prompt")]),
+            "completion": _percentiles([record["tokens"]["completion"] for record in records if (record.get("tokens") or {}).get("completion")]),
+        },
+        "top_questions": [
+            {"question": examples[key], "count": count, "share": count / len(records)} for key, count in ranked[:top]
+        ],
+        "cache": {
+            "distinct_questions": len(counts),
+            "actual_hit_rate": sum(1 for record in records if record["attributes"].get("cache_hit")) / len(records) if records else 0.0,
+            # Any repeat of an earlier question could have been served from an unbounded exact cache
+            "repeat_rate": repeats / len(records) if records else 0.0,
+            "chain_calls": chain_calls,
+            "lru_hit_rate": {size: lru_hit_rate(keys, size) for size in cache_sizes},
+            # Share of traffic a precomputed FAQ of the top N questions would answer
+            "faq_coverage": {size: sum(count for _, count in ranked[:size]) / len(records) if records else 0.0 for size in cache_sizes},
+        },
+    }
+
+
+def print_report(report):
+    print(f"{report['requests']} requests from {report['first']} to {report['last']}")
+    print("Routes: " + ", ".join(f"{name} {count}" for name, count in Counter(report["routes"]).most_common()))
+    if report["errors"]:
+        print("Errors: " + ", ".join(f"{name} {count}" for name, count in report["errors"].items()))
+
+    def line(label, stats):
+        if stats.get("n"):
+            print(f"  {label:18s} n {stats['n']:6d}  p50 {stats['p50']:9.1f}  p95 {stats['p95']:9.1f}  p99 {stats['p99']:9.1f}")
+
+    print("\nLatency (ms)")
+    line("all requests", report["total_ms"])
+    line("chain calls", report["chain_total_ms"])
+    for stage, stats in report["stages_ms"].items():
+        line(stage, stats)
+    print("\nOver time")
+    for bucket in report["over_time"]:
+        stats = bucket["total_ms"]
+        print(f"  {bucket['start']}  {bucket['requests']:6d} requests  p50 {stats['p50']:8.1f}  p95 {stats['p95']:8.1f}  "
+              f"cache hits {bucket['cache_hit_rate']:.0%}  degraded {bucket['degraded']}")
+    print("\nTop questions")
+    for entry in report["top_questions"]:
+        print(f"  {entry['count']:6d}  {entry['share']:6.1%}  {entry['question']}")
+    cache = report["cache"]
+    print(f"\nCache: {cache['distinct_questions']} distinct questions, actual hit rate {cache['actual_hit_rate']:.1%}, "
+          f"repeats {cache['repeat_rate']:.1%}")
+    for size, rate in cache["lru_hit_rate"].items():
+        print(f"  LRU of {size:5d}: {rate:6.1%} hits   FAQ of top {size:5d}: {cache['faq_coverage'][size]:6.1%} of traffic")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report on the structured query log.")
+    parser.add_argument("--report", action="store_true")
+    parser.add_argument("--path", default=os.getenv("QUERY_LOG_PATH", DEFAULT_PATH))
+    parser.add_argument("--since", type=float, help="only the last N hours")
+    parser.add_argument("--bucket", type=int, default=60, help="minutes per row in the over-time table")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--json", help="also write the report here")
+    parser.add_argument("--faq-questions", help="write the top questions here, for faq_store.py --build --questions")
+    args = parser.parse_args()
+    if not args.report:
+        parser.print_help()
+        return
+
+    records = read_records(args.path, args.since)
+    if not records:
+        print(f"No records in {args.path}")
+        return
+    report = build_report(records, args.bucket, args.top)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.faq_questions:
+        with open(args.faq_questions, "w", encoding="utf-8") as f:
+            f.writelines(entry["question"] + "\n" for entry in report["top_questions"])
+        print(f"Wrote {len(report['top_questions'])} questions to {args.faq_questions}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,770 @@
+"""RAG pipeline shared by app.py and the command line tools.
+
+Importing this module is cheap: ChatGroq, HuggingFaceEmbeddings (torch and
+sentence-transformers) and Chroma are only imported and constructed the
+first time they are needed, or ahead of time by start_warmup() on a
+background thread. Every load is timed for startup_report().
+
+    python rag.py --profile [--json startup.json]
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import contextlib
+import contextvars
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+
+from dotenv import load_dotenv
+
+PERSIST_DIRECTORY = "./chroma_db"
+MODEL_NAME = "llama3-8b-8192"
+
+# Define the RAG prompt template
+template = """Use the following pieces of context to answer.
+You are directly answering to recruiter so don't say anything negative about Utsav Soni and his professional career.
+If question asked you something about Utsav Soni your response must be of 5 line atleast.
+If question is generalised not asking any information about Utsav Soni at that time only, say Thank you for bringing that up! I understand your concern, for more information contact Utsav Soni.
+Read question carefully and answer based on the question asked. Your answer must be related and properly aligned to question.
+If you don't know the answer or negative question asked, just say that Thank you for bringing that up! I understand your concern, for more information contact Utsav Soni.
+Don't make up an answer and lighten up the user about excellent things from Utsav Soni's Professional Career.
+Do not reply to rephrase the question asked, if question is greeting do reply greeting only that's it.
+Keep the answer as concise, positive, polite, professional as possible.
+convince the user.
+If user or recruiter asks a negative question about Utsav Soni, please answer that in a positive way by embracing Utsav Soni's skills according to the question asked.
+Never ever say negative things and negative thoughts about Utsav Soni in your completions.
+Utsav Soni is a very good candidate to hire, keep that in mind. It's very important to hire him. So give smart answers only.
+You are not supposed to rate Utsav Soni for any of his skills or experience for any job role instead answer showcasing Utsav's profile and skill.
+You are not supposed to give reasons and facts why Utsav Soni is not selected for the next round or why he is not the best fit for any of the posts the recruiter will mention.
+If you find the question completely irrelevant like the question is not asking something about Utsav Soni or his resume, please reply I am not trained for this. Thanks!
+Always say "Thanks for asking..!" at the end of the answer.
+Do not repeat greetings in your completion.
+you are not supposed to answer generalised question, you have to answer question related to Utsav Soni only.
+
+{context}
+
+Question: {question}
+
+Smart Answer:"""
+
+_imported_at = time.perf_counter()
+_timings = []
+_timings_lock = threading.Lock()
+
+
+def _record(name, started):
+    finished = time.perf_counter()
+    with _timings_lock:
+        _timings.append({
+            "name": name,
+            "started_at": round(started - _imported_at, 4),
+            "seconds": round(finished - started, 4),
+            "thread": threading.current_thread().name,
+        })
+
+
+class Lazy:
+    # Builds a resource on first use, at most once, from any thread
+
+    def __init__(self, name, factory):
+        self.name = name
+        self.factory = factory
+        self._lock = threading.Lock()
+        self._value = None
+        self._ready = False
+
+    def get(self):
+        if not self._ready:
+            with self._lock:
+                if not self._ready:
+                    started = time.perf_counter()
+                    self._value = self.factory()
+                    _record(self.name, started)
+                    self._ready = True
+        return self._value
+
+    @property
+    def ready(self):
+        return self._ready
+
+
+def configure_environment():
+    load_dotenv()
+    if os.getenv("LANGSMITH_API_KEY"):
+        os.environ["LANGCHAIN_API_KEY"] = os.getenv("LANGSMITH_API_KEY")
+    # LangSmith tracing adds network work to every call, so it is opt-in
+    if os.getenv("LANGSMITH_TRACING", "false").lower() == "true":
+        os.environ["LANGCHAIN_TRACING_V2"] = "true"
+        os.environ["LANGCHAIN_PROJECT"] = "CHATBOT1"
+    # OpenTelemetry spans are exported locally; see tracing.py
+    if os.getenv("OTEL_TRACES_EXPORTER", "none").lower() != "none":
+        import tracing
+        tracing.setup_tracing()
+
+
+def tracing_enabled():
+    tracing = sys.modules.get("tracing")
+    return tracing is not None and tracing.is_enabled()
+
+
+@contextlib.contextmanager
+def request_span(question, session_id=None):
+    # A no-op span unless tracing.setup_tracing() installed a provider. The
+    # request is also written to the query log, with whatever attributes
+    # are set on the span
+    from opentelemetry import trace
+    with trace.get_tracer("resume-qa").start_as_current_span(
+        "rag.request", attributes={"rag.question_chars": len(question)}
+    ) as span:
+        if query_log.get() is None:
+            yield span
+        else:
+            with query_log.get().request(question, span, session_id) as logged:
+                yield logged
+
+
+def format_docs(docs):
+    return "\n\n".join(doc.page_content for doc in docs)
+
+
+def _load_llm():
+    # ChatGroq behind timeouts, retries, hedging and an optional fallback;
+    # see llm_client.py
+    from llm_client import load_llm
+    return load_llm(MODEL_NAME)
+
+
+def _load_embeddings():
+    # EMBEDDING_BACKEND=onnx swaps in the int8 ONNX encoder
+    from embedding_backends import load_embeddings
+    embeddings_backend = load_embeddings()
+    if shared_store.get() is None:
+        return embeddings_backend
+    # Vectors computed by any worker on this host are reused by the others
+    from shared_cache import SharedEmbeddings
+    return SharedEmbeddings(embeddings_backend, shared_store.get(), embedding_namespace())
+
+
+def embedding_namespace():
+    # Vectors from different encoders aren't comparable
+    from embedding_backends import DEFAULT_MODEL_NAME
+    return f"{os.getenv('EMBEDDING_BACKEND', 'hf')}:{DEFAULT_MODEL_NAME}"
+
+
+def _load_shared_store():
+    if os.getenv("SHARED_CACHE", "on").lower() == "off":
+        return None
+    from shared_cache import SharedStore
+    return SharedStore(
+        path=os.getenv("SHARED_CACHE_PATH", "shared_cache.sqlite3"),
+        max_answers=int(os.getenv("SHARED_CACHE_MAX_ANSWERS", "2000")),
+        max_embeddings=int(os.getenv("SHARED_CACHE_MAX_EMBEDDINGS", "50000")),
+        ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+    )
+
+
+def _load_vectorstore():
+    from langchain_community.vectorstores import Chroma
+    return Chroma(persist_directory=PERSIST_DIRECTORY, embedding_function=embeddings.get())
+
+
+def _load_retriever():
+    backend = os.getenv("RETRIEVER_BACKEND", "chroma").lower()
+    # RETRIEVER_BACKEND=hybrid fuses BM25 keyword ranking with vector search
+    if backend == "hybrid":
+        from answer_cache import index_fingerprint
+        from hybrid_retriever import build_hybrid_retriever
+
+        return build_hybrid_retriever(
+            vectorstore.get(), embeddings.get(),
+            fingerprint_fn=lambda: index_fingerprint(PERSIST_DIRECTORY, ""), k=4,
+        )
+    # RETRIEVER_BACKEND=numpy serves top-k from an in-memory copy of the collection
+    if backend == "numpy":
+        import numpy as np
+        from numpy_index import NumpyIndex, NumpyRetriever
+
+        dtype = np.dtype(os.getenv("NUMPY_INDEX_DTYPE", "float32"))
+        index = NumpyIndex.from_chroma(vectorstore.get(), dtype=dtype)
+        if tracing_enabled():
+            from tracing import TracedRetriever
+            return TracedRetriever(embeddings=embeddings.get(), search=lambda vector: index.search_documents(vector, 4), k=4)
+        return NumpyRetriever(index=index, embeddings=embeddings.get(), k=4)
+    # RETRIEVER_BACKEND=mmap searches a shared, read-only snapshot written by
+    # `python snapshot_index.py --export`, without opening Chroma at all
+    if backend == "mmap":
+        from numpy_index import NumpyRetriever
+        from snapshot_index import DEFAULT_PATH, open_snapshot
+
+        index = open_snapshot(os.getenv("INDEX_SNAPSHOT", DEFAULT_PATH))
+        if tracing_enabled():
+            from tracing import TracedRetriever
+            return TracedRetriever(embeddings=embeddings.get(), search=lambda vector: index.search_documents(vector, 4), k=4)
+        return NumpyRetriever(index=index, embeddings=embeddings.get(), k=4)
+    if tracing_enabled():
+        # Same search as the Chroma retriever, with embedding and search timed separately
+        from tracing import TracedRetriever
+        return TracedRetriever(
+            embeddings=embeddings.get(),
+            search=lambda vector: vectorstore.get().similarity_search_by_vector(vector, k=4),
+            k=4,
+        )
+    return vectorstore.get().as_retriever(search_type="similarity", search_kwargs={"k": 4})
+
+
+def build_rag_chain(retriever, llm, context=format_docs):
+    from langchain_core.output_parsers import StrOutputParser
+    from langchain_core.prompts import PromptTemplate
+    from langchain_core.runnables import RunnablePassthrough
+
+    custom_rag_prompt = PromptTemplate.from_template(template)
+    return (
+        {"context": retriever | context, "question": RunnablePassthrough()}
+        | custom_rag_prompt
+        | llm
+        | StrOutputParser()
+    )
+
+
+def _load_context_budgeter():
+    from context_budget import ContextBudgeter
+    return ContextBudgeter(token_budget=int(os.getenv("CONTEXT_TOKEN_BUDGET", "800")))
+
+
+def get_context_formatter():
+    # Dedupe overlapping chunks and cap the context size; CONTEXT_BUDGET=off
+    # restores plain format_docs
+    if os.getenv("CONTEXT_BUDGET", "on").lower() == "off":
+        return format_docs
+    from langchain_core.runnables import RunnableLambda
+    return RunnableLambda(context_budgeter.get(), name="assemble_context")
+
+
+def _load_rag_chain():
+    chain = build_rag_chain(retriever.get(), llm.get(), context=get_context_formatter())
+    callbacks = []
+    if tracing_enabled():
+        from tracing import callback_handler
+        callbacks.append(callback_handler)
+    if query_log.get() is not None:
+        import query_log as query_log_module
+        callbacks.append(query_log_module.callback_handler)
+    if deadlines.get() is not None:
+        import deadline as deadline_module
+        callbacks.append(deadline_module.callback_handler)
+    if callbacks:
+        chain = chain.with_config(callbacks=callbacks)
+    return chain
+
+
+def _load_answer_cache():
+    from answer_cache import SemanticAnswerCache, index_fingerprint
+
+    # Shared by every session and request in this process
+    return SemanticAnswerCache(
+        embed_query=lambda question: embeddings.get().embed_query(question),
+        fingerprint_fn=lambda: index_fingerprint(PERSIST_DIRECTORY, template),
+        max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "256")),
+        ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+        similarity_threshold=float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.92")),
+        store=shared_store.get(),
+    )
+
+
+def _load_router():
+    if os.getenv("ROUTER", "on").lower() == "off":
+        return None
+    from router import IntentRouter, load_exemplars
+
+    exemplars_path = os.getenv("ROUTER_EXEMPLARS")
+    return IntentRouter(
+        embed_documents=embeddings.get().embed_documents,
+        embed_query=embeddings.get().embed_query,
+        exemplars=load_exemplars(exemplars_path) if exemplars_path else None,
+        greeting_threshold=float(os.getenv("ROUTER_GREETING_THRESHOLD", "0.75")),
+        off_topic_threshold=float(os.getenv("ROUTER_OFF_TOPIC_THRESHOLD", "0.55")),
+        margin=float(os.getenv("ROUTER_MARGIN", "0.05")),
+    )
+
+
+def _load_single_flight():
+    if os.getenv("COALESCE", "on").lower() == "off":
+        return None
+    from singleflight import SingleFlight
+    return SingleFlight(timeout=float(os.getenv("COALESCE_TIMEOUT", "60")))
+
+
+def _load_admission():
+    if os.getenv("ADMISSION", "on").lower() == "off":
+        return None
+    from admission import AdmissionController
+    return AdmissionController(
+        max_concurrent=int(os.getenv("ADMISSION_MAX_CONCURRENT", "4")),
+        session_rate=float(os.getenv("ADMISSION_SESSION_RATE", "0.2")),
+        session_burst=int(os.getenv("ADMISSION_SESSION_BURST", "3")),
+        global_rate=float(os.getenv("ADMISSION_GLOBAL_RATE", "0.5")),
+        global_burst=int(os.getenv("ADMISSION_GLOBAL_BURST", "10")),
+        max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "50")),
+        max_wait=float(os.getenv("ADMISSION_MAX_WAIT", "60")),
+    )
+
+
+def faq_versions():
+    import hashlib
+    from answer_cache import index_fingerprint
+    return {
+        "chroma_version": index_fingerprint(PERSIST_DIRECTORY, ""),
+        "template_hash": hashlib.sha256(template.encode("utf-8")).hexdigest(),
+    }
+
+
+def _load_faq():
+    if os.getenv("FAQ", "on").lower() == "off":
+        return None
+    from faq_store import DEFAULT_PATH, FaqStore
+
+    regenerate = os.getenv("FAQ_REGENERATE", "background").lower() == "background"
+    return FaqStore(
+        path=os.getenv("FAQ_PATH", DEFAULT_PATH),
+        embed_documents=lambda texts: embeddings.get().embed_documents(texts),
+        versions_fn=faq_versions,
+        namespace=embedding_namespace(),
+        similarity_threshold=float(os.getenv("FAQ_SIMILARITY", "0.92")),
+        # Goes through admission control and coalescing like any other chain call
+        regenerate_fn=invoke_chain if regenerate else None,
+    )
+
+
+def _load_deadlines():
+    if os.getenv("DEADLINE", "on").lower() == "off":
+        return None
+    from deadline import DeadlinePolicy
+    return DeadlinePolicy(
+        seconds=float(os.getenv("DEADLINE_SECONDS", "8")),
+        reserve=float(os.getenv("DEADLINE_FALLBACK_RESERVE", "1")),
+        max_sentences=int(os.getenv("DEADLINE_SENTENCES", "3")),
+    )
+
+
+def _load_query_log():
+    if os.getenv("QUERY_LOG", "on").lower() == "off":
+        return None
+    from query_log import DEFAULT_PATH, QueryLog
+    return QueryLog(
+        os.getenv("QUERY_LOG_PATH", DEFAULT_PATH),
+        max_bytes=int(float(os.getenv("QUERY_LOG_MAX_MB", "100")) * 1024 * 1024),
+    )
+
+
+def _warm_embeddings():
+    # The first encode pays for lazy kernel and tokenizer setup
+    embeddings.get().embed_query("warmup")
+
+
+llm = Lazy("llm", _load_llm)
+embeddings = Lazy("embeddings", _load_embeddings)
+shared_store = Lazy("shared_store", _load_shared_store)
+vectorstore = Lazy("vectorstore", _load_vectorstore)
+retriever = Lazy("retriever", _load_retriever)
+rag_chain = Lazy("rag_chain", _load_rag_chain)
+answer_cache = Lazy("answer_cache", _load_answer_cache)
+context_budgeter = Lazy("context_budgeter", _load_context_budgeter)
+router = Lazy("router", _load_router)
+faq = Lazy("faq", _load_faq)
+single_flight = Lazy("single_flight", _load_single_flight)
+admission = Lazy("admission", _load_admission)
+deadlines = Lazy("deadlines", _load_deadlines)
+query_log = Lazy("query_log", _load_query_log)
+first_query = Lazy("first_query", _warm_embeddings)
+
+
+def get_llm():
+    return llm.get()
+
+
+def get_embeddings():
+    return embeddings.get()
+
+
+def get_vectorstore():
+    return vectorstore.get()
+
+
+def get_retriever():
+    return retriever.get()
+
+
+def get_rag_chain():
+    return rag_chain.get()
+
+
+def get_answer_cache():
+    return answer_cache.get()
+
+
+def precheck(question):
+    # Everything that can answer without retrieval or the LLM. Returns
+    # (answer or None, source, query vector); source is the router label for
+    # canned replies, "faq" or "cache" for stored answers and None when the
+    # chain must run.
+    # Pass the vector on to answer_cache.put() after running the chain.
+    vector = None
+    if router.get() is not None:
+        canned, label, vector = router.get().route(question)
+        if canned is not None:
+            return canned, label, vector
+    if faq.get() is not None:
+        answer, vector = faq.get().lookup(question, vector)
+        if answer is not None:
+            return answer, "faq", vector
+    answer, vector = answer_cache.get().lookup(question, vector)
+    return answer, "cache" if answer is not None else None, vector
+
+
+# rag_chain calls go through these. A session may be turned away by
+# admission control (admission.Rejected); identical questions asked at the
+# same time, from any session, then share one retrieval and LLM call, which
+# waits for a free slot in the fair queue. on_wait(position, seconds) is
+# called while it waits.
+def _admitted(session_id, on_wait):
+    if admission.get() is None:
+        return contextlib.nullcontext()
+    return admission.get().admit(session_id, on_wait)
+
+
+def _aadmitted(session_id, on_wait):
+    if admission.get() is None:
+        return contextlib.nullcontext()
+    return admission.get().aadmit(session_id, on_wait)
+
+
+def _check_session(session_id):
+    # Callers without a session (batch jobs, tools) only share the global limits
+    if session_id is not None and admission.get() is not None:
+        admission.get().check_session(session_id)
+
+
+def invoke_chain(question, session_id=None, on_wait=None):
+    _check_session(session_id)
+
+    def run():
+        with _admitted(session_id, on_wait):
+            return get_rag_chain().invoke(question)
+
+    if single_flight.get() is None:
+        return run()
+    return single_flight.get().do(question, run)
+
+
+def stream_chain(question, session_id=None, on_wait=None):
+    _check_session(session_id)
+
+    def run():
+        with _admitted(session_id, on_wait):
+            yield from get_rag_chain().stream(question)
+
+    if single_flight.get() is None:
+        return run()
+    return single_flight.get().stream(question, run)
+
+
+async def ainvoke_chain(question, session_id=None):
+    _check_session(session_id)
+
+    async def run():
+        async with _aadmitted(session_id, None):
+            return await get_rag_chain().ainvoke(question)
+
+    if single_flight.get() is None:
+        return await run()
+    return await single_flight.get().ado(question, run)
+
+
+def astream_chain(question, session_id=None):
+    _check_session(session_id)
+
+    async def run():
+        async with _aadmitted(session_id, None):
+            async for chunk in get_rag_chain().astream(question):
+                yield chunk
+
+    if single_flight.get() is None:
+        return run()
+    return single_flight.get().astream(question, run)
+
+
+# Deadline-bounded versions of the above. Each returns, or yields, a degraded
+# extractive answer once the request's deadline passes, and keeps the chain
+# running so its full answer can replace it; see deadline.py. started is the
+# perf_counter() reading when the request arrived.
+_deadline_pool = concurrent.futures.ThreadPoolExecutor(
+    max_workers=int(os.getenv("DEADLINE_WORKERS", "32")), thread_name_prefix="deadline"
+)
+_POLL = 0.25
+
+
+def fallback_answer(question, vector=None, docs=None):
+    # docs are the chunks the chain already retrieved, when it got that far
+    from deadline import extractive_answer
+
+    if not docs:
+        docs = get_retriever().invoke(question)
+    if vector is None:
+        vector = embeddings.get().embed_query(question)
+    return extractive_answer(vector, docs, embeddings.get().embed_documents, deadlines.get().max_sentences)
+
+
+def _serve_fallback(question, vector, docs=None):
+    # The extractive answer once a deadline is missed, or None when there isn't one
+    from opentelemetry import trace
+
+    policy = deadlines.get()
+    policy.record_miss()
+    try:
+        answer = fallback_answer(question, vector, list(docs or ()))
+    except Exception as exc:
+        print(f"Extractive fallback failed: {type(exc).__name__}: {exc}", file=sys.stderr, flush=True)
+        answer = None
+    policy.record_fallback(answer is not None)
+    span = trace.get_current_span()
+    span.set_attribute("rag.deadline_miss", True)
+    span.set_attribute("rag.degraded", answer is not None)
+    return answer
+
+
+def _late_answer(question, vector, deadline, future):
+    # Done callback for the chain call behind a degraded answer (a
+    # concurrent.futures.Future or an asyncio.Task)
+    failed = future.cancelled() or future.exception() is not None
+    deadlines.get().record_late(deadline, failed)
+    if not failed:
+        answer_cache.get().put(question, future.result(), vector)
+
+
+def _wait(future, deadline, relay, on_wait):
+    # Waits until the future is done or the LLM budget is spent, passing
+    # queue updates from the worker thread to on_wait on this one
+    while not future.done():
+        budget = deadline.llm_budget()
+        if budget <= 0:
+            return False
+        concurrent.futures.wait([future], timeout=min(_POLL, budget))
+        if relay and on_wait is not None:
+            on_wait(*relay[-1])
+            relay.clear()
+    return True
+
+
+def invoke_with_deadline(question, vector=None, session_id=None, on_wait=None, started=None):
+    # Returns (answer, degraded, pending); pending is a Future for the full
+    # answer when degraded, else None
+    if deadlines.get() is None:
+        return invoke_chain(question, session_id, on_wait), False, None
+    from deadline import capture_retrieved
+
+    deadline = deadlines.get().start(started)
+    relay = []
+    docs = []
+    future = _deadline_pool.submit(
+        contextvars.copy_context().run, capture_retrieved, docs,
+        invoke_chain, question, session_id, lambda *update: relay.append(update),
+    )
+    if _wait(future, deadline, relay, on_wait):
+        return future.result(), False, None
+    answer = _serve_fallback(question, vector, docs)
+    if answer is None:
+        return future.result(), False, None
+    future.add_done_callback(lambda done: _late_answer(question, vector, deadline, done))
+    return answer, True, future
+
+
+_END = object()
+
+
+def stream_with_deadline(question, vector=None, session_id=None, on_wait=None, started=None):
+    # Yields ("fallback", answer) at most once, if no token came in time,
+    # then ("token", chunk) for the full answer as it streams. The caller
+    # caches the finished stream as usual
+    if deadlines.get() is None:
+        for chunk in stream_chain(question, session_id, on_wait):
+            yield "token", chunk
+        return
+    from deadline import capture_retrieved
+
+    deadline = deadlines.get().start(started)
+    relay = []
+    docs = []
+    chunks = iter(stream_chain(question, session_id, lambda *update: relay.append(update)))
+    first = _deadline_pool.submit(contextvars.copy_context().run, capture_retrieved, docs, next, chunks, _END)
+    degraded = False
+    if not _wait(first, deadline, relay, on_wait):
+        answer = _serve_fallback(question, vector, docs)
+        if answer is not None:
+            degraded = True
+            yield "fallback", answer
+    try:
+        chunk = first.result()
+        if chunk is not _END:
+            yield "token", chunk
+            for chunk in chunks:
+                yield "token", chunk
+    except Exception:
+        if degraded:
+            deadlines.get().record_late(deadline, failed=True)
+        raise
+    if degraded:
+        deadlines.get().record_late(deadline, failed=False)
+
+
+async def ainvoke_with_deadline(question, vector=None, session_id=None, started=None):
+    if deadlines.get() is None:
+        return await ainvoke_chain(question, session_id), False, None
+    from deadline import collecting_retrieved
+
+    deadline = deadlines.get().start(started)
+    docs = []
+    with collecting_retrieved(docs):
+        task = asyncio.ensure_future(ainvoke_chain(question, session_id))
+    await asyncio.wait({task}, timeout=deadline.llm_budget())
+    if task.done():
+        return task.result(), False, None
+    answer = await asyncio.to_thread(_serve_fallback, question, vector, docs)
+    if answer is None:
+        return await task, False, None
+    task.add_done_callback(lambda done: _late_answer(question, vector, deadline, done))
+    return answer, True, task
+
+
+async def astream_with_deadline(question, vector=None, session_id=None, started=None):
+    if deadlines.get() is None:
+        async for chunk in astream_chain(question, session_id):
+            yield "token", chunk
+        return
+    from deadline import collecting_retrieved
+
+    deadline = deadlines.get().start(started)
+    docs = []
+    chunks = astream_chain(question, session_id).__aiter__()
+    with collecting_retrieved(docs):
+        first = asyncio.ensure_future(chunks.__anext__())
+    degraded = False
+    try:
+        await asyncio.wait({first}, timeout=deadline.llm_budget())
+        if not first.done():
+            answer = await asyncio.to_thread(_serve_fallback, question, vector, docs)
+            if answer is not None:
+                degraded = True
+                yield "fallback", answer
+        try:
+            chunk = await first
+        except StopAsyncIteration:
+            pass
+        else:
+            yield "token", chunk
+            async for chunk in chunks:
+                yield "token", chunk
+    except Exception:
+        if degraded:
+            deadlines.get().record_late(deadline, failed=True)
+        raise
+    finally:
+        # The client went away before the first token
+        if not first.done():
+            first.cancel()
+    if degraded:
+        deadlines.get().record_late(deadline, failed=False)
+
+
+def is_ready():
+    return rag_chain.ready and first_query.ready
+
+
+def warmup():
+    get_rag_chain()
+    first_query.get()
+    router.get()
+    faq.get()
+
+
+_warmup_thread = None
+_warmup_lock = threading.Lock()
+
+
+def start_warmup():
+    # Idempotent; RAG_WARMUP=lazy skips the thread and loads on first question
+    global _warmup_thread
+    if os.getenv("RAG_WARMUP", "background").lower() != "background":
+        return None
+    with _warmup_lock:
+        if _warmup_thread is None:
+            _warmup_thread = threading.Thread(target=_run_warmup, name="rag-warmup", daemon=True)
+            _warmup_thread.start()
+    return _warmup_thread
+
+
+def _run_warmup():
+    try:
+        warmup()
+        print(format_startup_report(), file=sys.stderr, flush=True)
+    except Exception as exc:
+        # The request path will retry the load and surface the error to the user
+        print(f"RAG warmup failed: {exc!r}", file=sys.stderr, flush=True)
+
+
+def startup_report():
+    with _timings_lock:
+        return {"since_import": round(time.perf_counter() - _imported_at, 4), "loads": list(_timings)}
+
+
+def format_startup_report(report=None):
+    report = report or startup_report()
+    lines = ["Startup profile (seconds since rag import):"]
+    for entry in report["loads"]:
+        lines.append(f"  {entry['name']:<28} start {entry['started_at']:>8.3f}  took {entry['seconds']:>8.3f}  [{entry['thread']}]")
+    return "\n".join(lines)
+
+
+HEAVY_IMPORTS = [
+    "langchain_core.runnables",
+    "langchain_groq",
+    "langchain_community.vectorstores",
+    "langchain_huggingface",
+    "sentence_transformers",
+    "torch",
+]
+
+
+def profile_startup():
+    # Imports are timed in dependency order; a module's figure excludes
+    # anything an earlier entry already pulled in
+    for module in HEAVY_IMPORTS:
+        started = time.perf_counter()
+        importlib.import_module(module)
+        _record(f"import {module}", started)
+    configure_environment()
+    warmup()
+    return startup_report()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RAG pipeline helpers.")
+    parser.add_argument("--profile", action="store_true", help="time heavy imports and model loads")
+    parser.add_argument("--json", help="write the profile to this file for comparison between runs")
+    args = parser.parse_args()
+    if not args.profile:
+        parser.print_help()
+        return
+
+    report = profile_startup()
+    print(format_startup_report(report))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Local intent routing ahead of the RAG chain.
+
+The prompt tells the model to answer greetings with a greeting and
+unrelated questions with "I am not trained for this. Thanks!", but each of
+those still costs a retrieval and a Groq call. IntentRouter labels a
+question as greeting, closing (thanks, goodbye), off_topic or resume. It
+checks a short list of exact greeting and closing phrases first, then
+embedding similarity against labeled exemplars. All but resume get a canned
+reply without touching the retriever or LLM.
+
+    ROUTER=off                        route everything to the chain
+    ROUTER_GREETING_THRESHOLD=0.75    min similarity to a greeting or closing exemplar
+    ROUTER_OFF_TOPIC_THRESHOLD=0.55   min similarity to an off-topic exemplar
+    ROUTER_MARGIN=0.05                how far it must beat the best resume exemplar
+    ROUTER_EXEMPLARS=path.json        {"greeting": [...], "closing": [...], "off_topic": [...], "resume": [...]}
+"""
+import json
+import threading
+
+import numpy as np
+
+from answer_cache import normalize_question
+
+GREETING = "greeting"
+CLOSING = "closing"
+OFF_TOPIC = "off_topic"
+RESUME = "resume"
+
+CANNED_RESPONSES = {
+    GREETING: "Hello! I'm happy to tell you about Utsav Soni's skills, experience and projects. What would you like to know?",
+    CLOSING: "You're welcome! Feel free to come back with more questions about Utsav Soni.",
+    # Wording taken from the prompt template so routed and model answers match
+    OFF_TOPIC: "I am not trained for this. Thanks!",
+}
+
+GREETING_PHRASES = {
+    "hi", "hii", "hello", "hey", "hey there", "hi there", "hello there", "yo", "greetings",
+    "good morning", "good afternoon", "good evening", "how are you", "how are you doing",
+}
+
+CLOSING_PHRASES = {
+    "thanks", "thank you", "thank you so much", "ok thanks", "thanks a lot", "bye", "goodbye",
+    "thanks bye", "thank you bye",
+}
+
+DEFAULT_EXEMPLARS = {
+    GREETING: [
+        "hello", "hi there, how are you?", "good morning", "hey, nice to meet you",
+        "how is it going?",
+    ],
+    CLOSING: [
+        "thanks a lot", "thank you, bye", "thanks, that's all I needed", "goodbye", "see you later",
+    ],
+    OFF_TOPIC: [
+        "what is the weather today?", "write me a poem", "what is the capital of France?",
+        "tell me a joke", "who won the football match yesterday?", "how do I cook pasta?",
+        "explain quantum physics", "what is the stock price of Apple?", "translate this into Spanish",
+        "solve this math problem for me",
+    ],
+    RESUME: [
+        "what are his skills?", "tell me about his experience", "what projects has Utsav worked on?",
+        "where did he study?", "does he know Python?", "why should we hire Utsav Soni?",
+        "what certifications does he have?", "what was his role at his last company?",
+        "is he a good fit for a data scientist role?", "what are his strengths and weaknesses?",
+        "how many years of experience does he have?", "what technologies has he used?",
+    ],
+}
+
+
+class IntentRouter:
+    def __init__(self, embed_documents, embed_query, exemplars=None, greeting_threshold=0.75,
+                 off_topic_threshold=0.55, margin=0.05):
+        self.embed_query = embed_query
+        self.greeting_threshold = greeting_threshold
+        self.off_topic_threshold = off_topic_threshold
+        self.margin = margin
+
+        exemplars = exemplars or DEFAULT_EXEMPLARS
+        self.labels = []
+        texts = []
+        for label, examples in exemplars.items():
+            self.labels.extend([label] * len(examples))
+            texts.extend(examples)
+        self.labels = np.array(self.labels)
+        self.vectors = self._unit(np.asarray(embed_documents(texts), dtype=np.float32))
+
+        self._lock = threading.Lock()
+        self.counts = {GREETING: 0, CLOSING: 0, OFF_TOPIC: 0, RESUME: 0}
+        self.lexical_hits = 0
+
+    def classify(self, question):
+        # Returns (label, best similarity, query vector or None)
+        normalized = normalize_question(question)
+        for label, phrases in ((GREETING, GREETING_PHRASES), (CLOSING, CLOSING_PHRASES)):
+            if normalized in phrases:
+                with self._lock:
+                    self.lexical_hits += 1
+                return label, 1.0, None
+
+        vector = self._unit(np.asarray(self.embed_query(question), dtype=np.float32)[None, :])[0]
+        scores = self.vectors @ vector
+        best = {label: float(scores[self.labels == label].max(initial=-1.0)) for label in self.counts}
+        label = RESUME
+        social = max((GREETING, CLOSING), key=best.get)
+        if best[social] >= self.greeting_threshold and best[social] - best[RESUME] >= self.margin:
+            label = social
+        elif best[OFF_TOPIC] >= self.off_topic_threshold and best[OFF_TOPIC] - best[RESUME] >= self.margin:
+            label = OFF_TOPIC
+        return label, best[label], vector
+
+    def route(self, question):
+        # Returns (canned answer or None, label, query vector or None)
+        label, _, vector = self.classify(question)
+        with self._lock:
+            self.counts[label] += 1
+        return CANNED_RESPONSES.get(label), label, vector
+
+    def stats(self):
+        with self._lock:
+            total = sum(self.counts.values())
+            short_circuited = total - self.counts[RESUME]
+            return {
+                **self.counts,
+                "lexical_greetings": self.lexical_hits,
+                "short_circuited": short_circuited,
+                "short_circuit_rate": short_circuited / total if total else 0.0,
+            }
+
+    @staticmethod
+    def _unit(vectors):
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+
+def load_exemplars(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
@@ -0,0 +1,355 @@
+"""Host-local answer and embedding cache shared by every worker process.
+
+The in-process caches are per worker, so several Streamlit or API replicas
+on one host each warm up their own copies and miss on questions another
+worker has already answered. SharedStore keeps both caches in one SQLite
+database in WAL mode, so any number of processes can read while one writes.
+
+- answers are keyed on the normalized question and tagged with the index
+  fingerprint, so a rebuilt chroma_db or a new prompt never serves old
+  answers; near-duplicate questions match on embedding similarity
+- query and document embeddings are keyed on backend, model and text, so a
+  question embedded by one worker is free for every other worker
+- both tables are capped and evict least recently used rows; answers also
+  expire after a TTL
+- hit and miss counts are kept per process and, flushed every few
+  seconds, for the whole host. Access times for LRU eviction are written
+  in the same batch rather than on every hit
+- workers reload the answer matrix only when another process changed the
+  answers table, not on every write to the database
+
+    SHARED_CACHE=off                    in-process caches only
+    SHARED_CACHE_PATH=shared_cache.sqlite3
+    SHARED_CACHE_MAX_ANSWERS=2000
+    SHARED_CACHE_MAX_EMBEDDINGS=50000   rows; ~3 KB each for a 768-d model
+
+    python shared_cache.py --stats | --clear
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS answers (
+    key TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (key, fingerprint)
+);
+CREATE INDEX IF NOT EXISTS answers_accessed ON answers (accessed);
+CREATE TABLE IF NOT EXISTS embeddings (
+    key TEXT PRIMARY KEY,
+    vector BLOB NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS embeddings_accessed ON embeddings (accessed);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+COUNTERS = [
+    "answer_hits", "answer_semantic_hits", "answer_misses", "answer_evictions",
+    "embedding_hits", "embedding_misses", "embedding_evictions",
+]
+
+
+def embedding_key(namespace, text):
+    return hashlib.sha256(f"{namespace}\0{text}".encode("utf-8")).hexdigest()
+
+
+class SharedStore:
+    def __init__(self, path="shared_cache.sqlite3", max_answers=2000, max_embeddings=50000, ttl_seconds=3600,
+                 flush_interval=5.0):
+        self.path = path
+        self.max_answers = max_answers
+        self.max_embeddings = max_embeddings
+        self.ttl_seconds = ttl_seconds
+        self.flush_interval = flush_interval
+
+        # One connection per process, serialized by a lock; WAL handles the
+        # other processes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+        self.counts = dict.fromkeys(COUNTERS, 0)
+        self._unflushed = dict.fromkeys(COUNTERS, 0)
+        self._flushed_at = time.monotonic()
+        # Hits not yet written: (key, fingerprint) -> [accessed, hits], key -> accessed
+        self._touched_answers = {}
+        self._touched_embeddings = {}
+        # (data_version, answers_version, fingerprint, keys, answers, matrix)
+        # for semantic lookups
+        self._matrix = None
+
+    def _count(self, name, amount=1):
+        # Caller holds the lock
+        self.counts[name] += amount
+        self._unflushed[name] += amount
+        if time.monotonic() - self._flushed_at >= self.flush_interval:
+            self._flush()
+
+    def _flush(self):
+        # One write per interval: every write bumps data_version for the other
+        # processes, so hits must not write on their own
+        deltas = [(name, value) for name, value in self._unflushed.items() if value]
+        if deltas or self._touched_answers or self._touched_embeddings:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.executemany(
+                    "INSERT INTO counters (name, value) VALUES (?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                    deltas,
+                )
+                self._db.executemany(
+                    "UPDATE answers SET accessed = MAX(accessed, ?), hits = hits + ? WHERE key = ? AND fingerprint = ?",
+                    [(accessed, hits, key, fingerprint) for (key, fingerprint), (accessed, hits) in self._touched_answers.items()],
+                )
+                self._db.executemany(
+                    "UPDATE embeddings SET accessed = MAX(accessed, ?) WHERE key = ?",
+                    [(accessed, key) for key, accessed in self._touched_embeddings.items()],
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        self._unflushed = dict.fromkeys(COUNTERS, 0)
+        self._touched_answers = {}
+        self._touched_embeddings = {}
+        self._flushed_at = time.monotonic()
+
+    def _answers_changed(self):
+        # Caller holds the lock. Marks the answers table as changed for the
+        # other processes' cached matrices
+        self._db.execute(
+            "INSERT OR REPLACE INTO counters (name, value) VALUES ('answers_version', ?)", (time.time_ns(),)
+        )
+        self._matrix = None
+
+    def _answers_version(self):
+        row = self._db.execute("SELECT value FROM counters WHERE name = 'answers_version'").fetchone()
+        return row[0] if row else 0
+
+    # Answers
+
+    def get_answer(self, key, fingerprint):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT answer, vector FROM answers WHERE key = ? AND fingerprint = ? AND created >= ?",
+                (key, fingerprint, time.time() - self.ttl_seconds),
+            ).fetchone()
+            if row is None:
+                return None, None
+            self._touch_answer(key, fingerprint)
+            self._count("answer_hits")
+            return row[0], np.frombuffer(row[1], dtype=np.float32)
+
+    def nearest_answer(self, vector, fingerprint, threshold):
+        # vector must be unit length; returns the answer or None
+        with self._lock:
+            keys, answers, matrix = self._answer_matrix(fingerprint)
+            if matrix is not None:
+                scores = matrix @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= threshold:
+                    self._touch_answer(keys[best], fingerprint)
+                    self._count("answer_hits")
+                    self._count("answer_semantic_hits")
+                    return answers[best]
+            self._count("answer_misses")
+            return None
+
+    def _answer_matrix(self, fingerprint):
+        # Cached until another process changes the answers table. data_version
+        # is a cheap check for any write; counter flushes don't count
+        version = self._db.execute("PRAGMA data_version").fetchone()[0]
+        if self._matrix is not None and self._matrix[2] == fingerprint:
+            if self._matrix[0] == version:
+                return self._matrix[3:]
+            answers_version = self._answers_version()
+            if self._matrix[1] == answers_version:
+                self._matrix = (version,) + self._matrix[1:]
+                return self._matrix[3:]
+        answers_version = self._answers_version()
+        rows = self._db.execute(
+            "SELECT key, answer, vector FROM answers WHERE fingerprint = ? AND created >= ?",
+            (fingerprint, time.time() - self.ttl_seconds),
+        ).fetchall()
+        keys = [row[0] for row in rows]
+        answers = [row[1] for row in rows]
+        matrix = np.stack([np.frombuffer(row[2], dtype=np.float32) for row in rows]) if rows else None
+        self._matrix = (version, answers_version, fingerprint, keys, answers, matrix)
+        return keys, answers, matrix
+
+    def _touch_answer(self, key, fingerprint):
+        touched = self._touched_answers.setdefault((key, fingerprint), [0.0, 0])
+        touched[0] = time.time()
+        touched[1] += 1
+
+    def put_answer(self, key, fingerprint, answer, vector):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO answers (key, fingerprint, answer, vector, created, accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, fingerprint, answer, np.asarray(vector, dtype=np.float32).tobytes(), now, now),
+            )
+            self._evict_answers()
+            # data_version only tracks other connections' writes
+            self._answers_changed()
+
+    def drop_fingerprints_except(self, fingerprint):
+        # Answers built on an older index or prompt can never be served again
+        with self._lock:
+            if self._db.execute("DELETE FROM answers WHERE fingerprint != ?", (fingerprint,)).rowcount:
+                self._answers_changed()
+
+    def _evict_answers(self):
+        expired = self._db.execute("DELETE FROM answers WHERE created < ?", (time.time() - self.ttl_seconds,)).rowcount
+        self._count("answer_evictions", expired + self._evict("answers", self.max_answers))
+
+    def _evict(self, table, limit):
+        # Trims 10% below the limit so eviction doesn't run on every insert
+        count = self._db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        if count <= limit:
+            return 0
+        excess = count - int(limit * 0.9)
+        return self._db.execute(
+            f"DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} ORDER BY accessed LIMIT ?)", (excess,)
+        ).rowcount
+
+    # Embeddings
+
+    def get_embeddings(self, keys):
+        # Returns {key: vector} for the keys that are cached
+        if not keys:
+            return {}
+        with self._lock:
+            found = {}
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                found.update((key, np.frombuffer(vector, dtype=np.float32)) for key, vector in rows)
+            now = time.time()
+            self._touched_embeddings.update((key, now) for key in found)
+            self._count("embedding_hits", len(found))
+            self._count("embedding_misses", len(set(keys)) - len(found))
+            return found
+
+    def put_embeddings(self, items):
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector, accessed) VALUES (?, ?, ?)",
+                    [(key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in items],
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._count("embedding_evictions", self._evict("embeddings", self.max_embeddings))
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM answers")
+            self._db.execute("DELETE FROM embeddings")
+            self._db.execute("DELETE FROM counters")
+            self._touched_answers = {}
+            self._touched_embeddings = {}
+            self._answers_changed()
+
+    def stats(self):
+        with self._lock:
+            self._flush()
+            host = {name: value for name, value in self._db.execute("SELECT name, value FROM counters") if name in COUNTERS}
+            answers = self._db.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+            embeddings = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            process = dict(self.counts)
+        size = sum(os.path.getsize(self.path + suffix) for suffix in ("", "-wal") if os.path.exists(self.path + suffix))
+
+        def rates(counts):
+            answer_lookups = counts.get("answer_hits", 0) + counts.get("answer_misses", 0)
+            embedding_lookups = counts.get("embedding_hits", 0) + counts.get("embedding_misses", 0)
+            return {
+                **counts,
+                "answer_hit_rate": counts.get("answer_hits", 0) / answer_lookups if answer_lookups else 0.0,
+                "embedding_hit_rate": counts.get("embedding_hits", 0) / embedding_lookups if embedding_lookups else 0.0,
+            }
+
+        return {
+            "path": self.path,
+            "size_mb": size / (1024 * 1024),
+            "answers": answers,
+            "embeddings": embeddings,
+            "process": rates(process),
+            "host": rates(host),
+        }
+
+
+class SharedEmbeddings(Embeddings):
+    # Read-through embedding cache in front of the real encoder
+
+    def __init__(self, inner, store, namespace):
+        self.inner = inner
+        self.store = store
+        self.namespace = namespace
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        texts = list(texts)
+        keys = [embedding_key(self.namespace, text) for text in texts]
+        found = self.store.get_embeddings(keys)
+        missing = [index for index, key in enumerate(keys) if key not in found]
+        if missing:
+            vectors = self.inner.embed_documents([texts[index] for index in missing])
+            self.store.put_embeddings([(keys[index], vector) for index, vector in zip(missing, vectors)])
+            found.update((keys[index], vector) for index, vector in zip(missing, vectors))
+        return [np.asarray(found[key], dtype=np.float32).tolist() for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = embedding_key(self.namespace, "query\0" + text)
+        found = self.store.get_embeddings([key])
+        if key in found:
+            return found[key].tolist()
+        vector = self.inner.embed_query(text)
+        self.store.put_embeddings([(key, vector)])
+        return list(vector)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or clear the shared answer and embedding cache.")
+    parser.add_argument("--path", default=os.getenv("SHARED_CACHE_PATH", "shared_cache.sqlite3"))
+    parser.add_argument("--stats", action="store_true")
+    parser.add_argument("--clear", action="store_true")
+    args = parser.parse_args()
+    store = SharedStore(args.path)
+    if args.clear:
+        store.clear()
+        print(f"Cleared {args.path}")
+    elif args.stats:
+        print(json.dumps(store.stats(), indent=2))
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""Process-wide single-flight coalescing of rag_chain calls.
+
+A shared link or a recruiter event sends many sessions the same opening
+question within seconds, and each would run its own retrieval and Groq
+call. SingleFlight keys in-flight calls by the normalized question. The
+first caller (the leader) runs the chain; anyone asking the same thing
+while it is still running waits for that result instead, and streaming
+followers replay the leader's tokens as they arrive. Streaming and plain
+calls share flights: a plain follower of a streaming leader waits for the
+whole answer, and a streaming follower of a plain leader gets it as one
+chunk. A leader's error is raised in every waiting caller, and nothing is
+remembered once a call finishes, so the next request starts a fresh call.
+A follower that waits longer than the timeout gets a TimeoutError while
+the leader carries on.
+
+    COALESCE=off            every request makes its own chain call
+    COALESCE_TIMEOUT=60     seconds a follower waits for the leader
+"""
+import asyncio
+import threading
+import time
+
+from opentelemetry import trace
+
+from answer_cache import normalize_question
+
+
+CANCELLED = "The identical in-flight question was cancelled before it finished"
+
+
+class LeaderCancelled(Exception):
+    # The leader stopped reading its stream before it finished
+    pass
+
+
+class Flight:
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.result = None
+        self.error = None
+        self._condition = threading.Condition()
+
+    def add_chunk(self, chunk):
+        with self._condition:
+            self.chunks.append(chunk)
+            self._condition.notify_all()
+
+    def finish(self, result=None, error=None):
+        with self._condition:
+            self.result = result
+            self.error = error
+            self.done = True
+            self._condition.notify_all()
+
+    def wait(self, seen, deadline):
+        # Returns (chunks after the first `seen`, done) once there is something new
+        with self._condition:
+            while len(self.chunks) <= seen and not self.done:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError
+                self._condition.wait(remaining)
+            return self.chunks[seen:], self.done
+
+    def wait_done(self, deadline):
+        # A streaming leader adds chunks long before it finishes
+        with self._condition:
+            while not self.done:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError
+                self._condition.wait(remaining)
+
+
+class AsyncFlight(Flight):
+    # Same state as Flight, but waiters are coroutines on one event loop
+
+    def __init__(self):
+        super().__init__()
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def add_chunk(self, chunk):
+        self.chunks.append(chunk)
+        self._notify()
+
+    def finish(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.done = True
+        self._notify()
+
+    async def wait(self, seen, deadline):
+        while len(self.chunks) <= seen and not self.done:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError
+            try:
+                await asyncio.wait_for(self._changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                raise TimeoutError from None
+        return self.chunks[seen:], self.done
+
+    async def wait_done(self, deadline):
+        seen = 0
+        while not self.done:
+            chunks, _ = await self.wait(seen, deadline)
+            seen += len(chunks)
+
+
+class SingleFlight:
+    def __init__(self, timeout=60.0, key_fn=normalize_question):
+        self.timeout = timeout
+        self.key_fn = key_fn
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._async_flights = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.timeouts = 0
+
+    def _join(self, question, flights, flight_type):
+        # Returns (key, flight, True if this caller leads the call)
+        key = self.key_fn(question)
+        with self._lock:
+            flight = flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = flights[key] = flight_type()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+        trace.get_current_span().set_attribute("rag.coalesced", not leader)
+        return key, flight, leader
+
+    def _finish(self, flights, key, flight, result=None, error=None):
+        with self._lock:
+            # Later callers start a fresh call rather than reuse this result
+            flights.pop(key, None)
+            if error is not None:
+                self.errors += 1
+        flight.finish(result, error)
+
+    def _timed_out(self):
+        with self._lock:
+            self.timeouts += 1
+        return TimeoutError(f"Gave up after {self.timeout:g}s waiting for an identical in-flight question")
+
+    def do(self, question, fn):
+        # Returns fn()'s result, shared with every identical call made while it runs
+        key, flight, leader = self._join(question, self._flights, Flight)
+        if leader:
+            try:
+                result = fn()
+            except BaseException as exc:
+                self._finish(self._flights, key, flight, error=exc if isinstance(exc, Exception) else LeaderCancelled(CANCELLED))
+                raise
+            self._finish(self._flights, key, flight, result=result)
+            return result
+
+        try:
+            flight.wait_done(time.monotonic() + self.timeout)
+        except TimeoutError:
+            raise self._timed_out() from None
+        if isinstance(flight.error, LeaderCancelled):
+            return self.do(question, fn)
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def stream(self, question, fn):
+        # fn() returns an iterator of string chunks; followers get the same chunks
+        key, flight, leader = self._join(question, self._flights, Flight)
+        if leader:
+            try:
+                for chunk in fn():
+                    flight.add_chunk(chunk)
+                    yield chunk
+            except BaseException as exc:
+                # GeneratorExit too: the leader's session stopped reading
+                self._finish(self._flights, key, flight, error=exc if isinstance(exc, Exception) else LeaderCancelled(CANCELLED))
+                raise
+            self._finish(self._flights, key, flight, result="".join(flight.chunks))
+            return
+
+        seen = 0
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                chunks, done = flight.wait(seen, deadline)
+            except TimeoutError:
+                raise self._timed_out() from None
+            for chunk in chunks:
+                yield chunk
+            seen += len(chunks)
+            if done:
+                break
+        if isinstance(flight.error, LeaderCancelled) and not seen:
+            # Nothing was shown yet, so this caller can simply start over
+            yield from self.stream(question, fn)
+        elif flight.error is not None:
+            raise flight.error
+        elif not seen and flight.result:
+            # The leader was a do() call, which has no chunks to replay
+            yield flight.result
+
+    async def ado(self, question, fn):
+        # Async do(); fn() returns an awaitable
+        key, flight, leader = self._join(question, self._async_flights, AsyncFlight)
+        if leader:
+            try:
+                result = await fn()
+            except BaseException as exc:
+                self._finish(self._async_flights, key, flight, error=exc if isinstance(exc, Exception) else LeaderCancelled(CANCELLED))
+                raise
+            self._finish(self._async_flights, key, flight, result=result)
+            return result
+
+        try:
+            await flight.wait_done(time.monotonic() + self.timeout)
+        except TimeoutError:
+            raise self._timed_out() from None
+        if isinstance(flight.error, LeaderCancelled):
+            return await self.ado(question, fn)
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    async def astream(self, question, fn):
+        # Async stream(); fn() returns an async iterator of string chunks
+        key, flight, leader = self._join(question, self._async_flights, AsyncFlight)
+        if leader:
+            try:
+                async for chunk in fn():
+                    flight.add_chunk(chunk)
+                    yield chunk
+            except BaseException as exc:
+                self._finish(self._async_flights, key, flight, error=exc if isinstance(exc, Exception) else LeaderCancelled(CANCELLED))
+                raise
+            self._finish(self._async_flights, key, flight, result="".join(flight.chunks))
+            return
+
+        seen = 0
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                chunks, done = await flight.wait(seen, deadline)
+            except TimeoutError:
+                raise self._timed_out() from None
+            for chunk in chunks:
+                yield chunk
+            seen += len(chunks)
+            if done:
+                break
+        if isinstance(flight.error, LeaderCancelled) and not seen:
+            async for chunk in self.astream(question, fn):
+                yield chunk
+        elif flight.error is not None:
+            raise flight.error
+        elif not seen and flight.result:
+            yield flight.result
+
+    def stats(self):
+        with self._lock:
+            calls = self.leaders + self.coalesced
+            return {
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "coalesced_rate": self.coalesced / calls if calls else 0.0,
+                "errors": self.errors,
+                "timeouts": self.timeouts,
+                "in_flight": len(self._flights) + len(self._async_flights),
+            }
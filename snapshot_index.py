@@ -0,0 +1,304 @@
+"""Read-only, memory-mapped snapshot of the chunks in ./chroma_db.
+
+Opening ./chroma_db (or building a NumpyIndex from it) copies every vector
+into each worker's heap and is slow at startup. An export writes the
+collection once into a compact, versioned file:
+
+    header     magic, format version and a JSON description (count, dim,
+               dtype, distance space, source fingerprint, section offsets)
+    vectors    float16, or int8 with one float32 scale per row
+    sq_norms   float32, for L2 ranking
+    ids, texts, metadatas
+               uint64 offsets tables plus UTF-8 blobs (metadata as JSON)
+
+MmapIndex opens the file with mmap and views each section with
+np.frombuffer, so nothing is copied: every worker on the host shares the
+same page-cache pages and opening takes milliseconds. Texts are decoded
+only for the rows a search returns. Enable it with RETRIEVER_BACKEND=mmap.
+
+    python snapshot_index.py --export [--dtype float16|int8] [--output index.snapshot]
+    python snapshot_index.py --verify [--queries questions.txt] [--k 4]
+    python snapshot_index.py --info
+
+Exports are written to a temporary file and renamed into place, so workers
+that already mapped the previous snapshot keep reading it until they
+restart.
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+from langchain_core.documents import Document
+
+MAGIC = b"RQSNAP\x00\x00"
+FORMAT_VERSION = 1
+DEFAULT_PATH = "index.snapshot"
+ALIGNMENT = 64
+# Rows dequantized at a time during search; bounds the float32 scratch memory
+BLOCK_ROWS = 4096
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _blob(strings):
+    # Returns (uint64 offsets with a trailing end offset, UTF-8 bytes)
+    encoded = [value.encode("utf-8") for value in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return offsets, b"".join(encoded)
+
+
+def quantize(vectors, dtype):
+    # Returns (stored vectors, per-row scales or None)
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    if dtype == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+    raise ValueError(f"Unsupported snapshot dtype {dtype!r}")
+
+
+def write_snapshot(path, ids, vectors, documents, metadatas, space="l2", dtype="float16", source_fingerprint=None):
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if space == "cosine":
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+    stored, scales = quantize(vectors, dtype)
+    # Norms of the vectors as stored, so L2 ranking matches what search computes
+    restored = stored.astype(np.float32) * (scales[:, None] if scales is not None else 1.0)
+    sections = {
+        "vectors": stored,
+        "sq_norms": np.einsum("ij,ij->i", restored, restored).astype(np.float32),
+    }
+    if scales is not None:
+        sections["scales"] = scales
+    for name, strings in (
+        ("ids", ids),
+        ("texts", documents),
+        ("metadatas", [json.dumps(metadata or {}, ensure_ascii=False) for metadata in metadatas]),
+    ):
+        offsets, data = _blob(strings)
+        sections[f"{name}_offsets"] = offsets
+        sections[f"{name}_data"] = np.frombuffer(data, dtype=np.uint8)
+
+    header = {
+        "format_version": FORMAT_VERSION,
+        "count": int(vectors.shape[0]),
+        "dim": int(vectors.shape[1]) if vectors.ndim == 2 else 0,
+        "dtype": dtype,
+        "space": space,
+        "source_fingerprint": source_fingerprint,
+        "created": datetime.now(timezone.utc).isoformat(),
+        "sections": {},
+    }
+    # The header's size depends on the offsets it records, so reserve room
+    # generously and lay out the sections after it
+    header_room = _align(len(json.dumps({**header, "sections": {name: [0, 0] for name in sections}})) + 1024)
+    offset = _align(len(MAGIC) + 8 + header_room)
+    for name, array in sections.items():
+        header["sections"][name] = [offset, int(array.nbytes)]
+        offset = _align(offset + array.nbytes)
+    encoded_header = json.dumps(header).encode("utf-8")
+    assert len(encoded_header) <= header_room
+
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<II", FORMAT_VERSION, len(encoded_header)))
+        f.write(encoded_header)
+        for name, array in sections.items():
+            f.seek(header["sections"][name][0])
+            f.write(np.ascontiguousarray(array).tobytes())
+        f.truncate(offset)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return header
+
+
+class MmapIndex:
+    # Same search interface as numpy_index.NumpyIndex, backed by a snapshot file
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not an index snapshot")
+        version, header_length = struct.unpack_from("<II", self._mmap, len(MAGIC))
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{path} has snapshot format {version}; this code reads format {FORMAT_VERSION}")
+        start = len(MAGIC) + 8
+        self.header = json.loads(self._mmap[start:start + header_length])
+        self.space = self.header["space"]
+        count, dim = self.header["count"], self.header["dim"]
+
+        self.vectors = self._section("vectors", np.float16 if self.header["dtype"] == "float16" else np.int8)
+        self.vectors = self.vectors.reshape(count, dim)
+        self.scales = self._section("scales", np.float32) if "scales" in self.header["sections"] else None
+        self.sq_norms = self._section("sq_norms", np.float32)
+        self._strings = {
+            name: (self._section(f"{name}_offsets", np.uint64), self._section(f"{name}_data", np.uint8))
+            for name in ("ids", "texts", "metadatas")
+        }
+        # Ids are small and needed for verification and hybrid fusion
+        self.ids = [self._string("ids", row) for row in range(count)]
+
+    def _section(self, name, dtype):
+        offset, length = self.header["sections"][name]
+        return np.frombuffer(self._mmap, dtype=dtype, count=length // np.dtype(dtype).itemsize, offset=offset)
+
+    def _string(self, name, row):
+        offsets, data = self._strings[name]
+        return data[int(offsets[row]):int(offsets[row + 1])].tobytes().decode("utf-8")
+
+    def __len__(self):
+        return self.header["count"]
+
+    def document(self, row):
+        return Document(page_content=self._string("texts", row), metadata=json.loads(self._string("metadatas", row)))
+
+    def search(self, query_vector, k=4):
+        # Returns (row indices, distances) nearest first, like NumpyIndex.search
+        k = min(k, len(self))
+        if k == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        query = np.asarray(query_vector, dtype=np.float32)
+        if self.space == "cosine":
+            query = query / (np.linalg.norm(query) or 1.0)
+        dots = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), BLOCK_ROWS):
+            block = self.vectors[start:start + BLOCK_ROWS].astype(np.float32)
+            dots[start:start + len(block)] = block @ query
+        if self.scales is not None:
+            dots *= self.scales
+        if self.space == "l2":
+            distances = self.sq_norms - 2 * dots + float(query @ query)
+        else:
+            distances = 1.0 - dots
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top], kind="stable")]
+        return top, distances[top]
+
+    def search_documents(self, query_vector, k=4):
+        rows, distances = self.search(query_vector, k)
+        documents = []
+        for row, distance in zip(rows, distances):
+            document = self.document(row)
+            document.id = self.ids[row]
+            document.metadata["distance"] = float(distance)
+            documents.append(document)
+        return documents
+
+
+def export(vectorstore, path=DEFAULT_PATH, dtype="float16", source_fingerprint=None):
+    collection = vectorstore._collection
+    data = collection.get(include=["embeddings", "documents", "metadatas"])
+    space = (collection.metadata or {}).get("hnsw:space", "l2")
+    vectors = np.asarray(data["embeddings"], dtype=np.float32)
+    if len(vectors) == 0:
+        vectors = vectors.reshape(0, 0)
+    return write_snapshot(
+        path, data["ids"], vectors, data["documents"], data["metadatas"],
+        space=space, dtype=dtype, source_fingerprint=source_fingerprint,
+    )
+
+
+def verify(vectorstore, embeddings, path, queries, k=4, repeats=20):
+    started = time.perf_counter()
+    index = MmapIndex(path)
+    open_ms = (time.perf_counter() - started) * 1000
+    collection = vectorstore._collection
+    recalls = []
+    exact = 0
+    chroma_times = []
+    snapshot_times = []
+    for query in queries:
+        vector = embeddings.embed_query(query)
+        expected = collection.query(query_embeddings=[vector], n_results=k, include=[])["ids"][0]
+        rows, _ = index.search(vector, k)
+        got = [index.ids[row] for row in rows]
+        recalls.append(len(set(expected) & set(got)) / max(len(expected), 1))
+        exact += got == expected
+
+        for _ in range(repeats):
+            started = time.perf_counter()
+            collection.query(query_embeddings=[vector], n_results=k, include=["documents", "metadatas"])
+            chroma_times.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            index.search_documents(vector, k)
+            snapshot_times.append(time.perf_counter() - started)
+
+    return {
+        "path": path,
+        "vectors": len(index),
+        "dtype": index.header["dtype"],
+        "file_mb": os.path.getsize(path) / (1024 * 1024),
+        "open_ms": open_ms,
+        "stale": index.header["source_fingerprint"] != _source_fingerprint(),
+        "k": k,
+        "recall_at_k": float(np.mean(recalls)) if recalls else 0.0,
+        "same_order": exact / len(queries) if queries else 0.0,
+        "chroma_ms": {"p50": float(np.percentile(chroma_times, 50)) * 1000, "p95": float(np.percentile(chroma_times, 95)) * 1000},
+        "snapshot_ms": {"p50": float(np.percentile(snapshot_times, 50)) * 1000, "p95": float(np.percentile(snapshot_times, 95)) * 1000},
+    }
+
+
+def _source_fingerprint():
+    import rag
+    from answer_cache import index_fingerprint
+    return index_fingerprint(rag.PERSIST_DIRECTORY, "")
+
+
+def open_snapshot(path=DEFAULT_PATH):
+    index = MmapIndex(path)
+    if index.header["source_fingerprint"] != _source_fingerprint():
+        print(f"Warning: {path} was exported from an older ./chroma_db; "
+              "re-run `python snapshot_index.py --export`", file=sys.stderr)
+    return index
+
+
+def main():
+    import rag
+    from numpy_index import DEFAULT_QUERIES
+
+    parser = argparse.ArgumentParser(description="Export, inspect or verify the memory-mapped index snapshot.")
+    parser.add_argument("--export", action="store_true")
+    parser.add_argument("--verify", action="store_true", help="compare snapshot search results against Chroma")
+    parser.add_argument("--info", action="store_true")
+    parser.add_argument("--output", "--path", dest="path", default=os.getenv("INDEX_SNAPSHOT", DEFAULT_PATH))
+    parser.add_argument("--dtype", choices=["float16", "int8"], default="float16")
+    parser.add_argument("--queries", help="file with one question per line")
+    parser.add_argument("--k", type=int, default=4)
+    args = parser.parse_args()
+
+    if args.export:
+        rag.configure_environment()
+        header = export(rag.get_vectorstore(), args.path, args.dtype, source_fingerprint=_source_fingerprint())
+        print(f"Wrote {header['count']} vectors ({header['dtype']}, dim {header['dim']}) to {args.path}, "
+              f"{os.path.getsize(args.path) / (1024 * 1024):.2f} MB")
+    elif args.verify:
+        queries = DEFAULT_QUERIES
+        if args.queries:
+            with open(args.queries, encoding="utf-8") as f:
+                queries = [line.strip() for line in f if line.strip()]
+        rag.configure_environment()
+        print(json.dumps(verify(rag.get_vectorstore(), rag.get_embeddings(), args.path, queries, k=args.k), indent=2))
+    elif args.info:
+        index = MmapIndex(args.path)
+        print(json.dumps({key: value for key, value in index.header.items() if key != "sections"}, indent=2))
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""OpenTelemetry spans for the RAG pipeline.
+
+Configured from the standard OTel environment variables:
+
+    OTEL_TRACES_EXPORTER     none (default) | file | otlp | console
+    OTEL_TRACES_FILE         JSON-lines output for the file exporter (traces.jsonl)
+    OTEL_TRACES_SAMPLER_ARG  fraction of requests to trace (1.0)
+    OTEL_EXPORTER_OTLP_ENDPOINT  collector address for the otlp exporter
+
+Spans are exported by a BatchSpanProcessor on its own thread. With the
+exporter set to none only the no-op OTel API is loaded.
+
+A request span (rag.request_span) wraps each rag_chain call, with child
+spans for embedding, search, context assembly, prompt rendering, the LLM call
+and output parsing. Attributes record k, context size, token counts and
+the cache outcome.
+"""
+import json
+import os
+import threading
+from typing import Any, Callable, List
+
+from langchain_core.callbacks import BaseCallbackHandler, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from opentelemetry import context, trace
+
+TRACER_NAME = "resume-qa"
+tracer = trace.get_tracer(TRACER_NAME)
+
+_setup_lock = threading.Lock()
+_enabled = None
+
+
+def setup_tracing():
+    # Idempotent; returns True when spans are actually exported
+    global _enabled
+    with _setup_lock:
+        if _enabled is not None:
+            return _enabled
+        exporter_name = os.getenv("OTEL_TRACES_EXPORTER", "none").lower()
+        if exporter_name == "none":
+            _enabled = False
+            return _enabled
+
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+        from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+
+        if exporter_name == "file":
+            exporter = JsonLinesSpanExporter(os.getenv("OTEL_TRACES_FILE", "traces.jsonl"))
+        elif exporter_name == "otlp":
+            from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+            exporter = OTLPSpanExporter()
+        elif exporter_name == "console":
+            exporter = ConsoleSpanExporter()
+        else:
+            raise ValueError(f"Unknown OTEL_TRACES_EXPORTER {exporter_name!r}")
+
+        ratio = float(os.getenv("OTEL_TRACES_SAMPLER_ARG", "1.0"))
+        provider = TracerProvider(
+            resource=Resource.create({"service.name": os.getenv("OTEL_SERVICE_NAME", "resume-qa")}),
+            sampler=ParentBased(TraceIdRatioBased(ratio)),
+        )
+        provider.add_span_processor(BatchSpanProcessor(exporter))
+        trace.set_tracer_provider(provider)
+        _enabled = True
+        return _enabled
+
+
+def is_enabled():
+    return bool(_enabled)
+
+
+class JsonLinesSpanExporter:
+    # One finished span per line; good enough for local inspection with jq
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        from opentelemetry.sdk.trace.export import SpanExportResult
+
+        lines = [json.dumps(json.loads(span.to_json(indent=None))) + "\n" for span in spans]
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.writelines(lines)
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        pass
+
+    def force_flush(self, timeout_millis=30000):
+        return True
+
+
+# Run names from rag.build_rag_chain mapped to span names
+STAGE_NAMES = {
+    "format_docs": "rag.format_docs",
+    "assemble_context": "rag.context",
+    "PromptTemplate": "rag.prompt",
+    "StrOutputParser": "rag.parse",
+}
+
+
+class SpanCallbackHandler(BaseCallbackHandler):
+    # Turns LangChain run callbacks into spans. Parents are tracked by run id
+    # rather than the ambient context, so spans nest correctly under invoke,
+    # stream and the async variants alike.
+    run_inline = True
+
+    def __init__(self):
+        self._spans = {}
+        self._streaming = set()
+        self._lock = threading.Lock()
+
+    def span_for(self, run_id):
+        with self._lock:
+            return self._spans.get(run_id)
+
+    def _start(self, name, run_id, parent_run_id, **attributes):
+        parent = self.span_for(parent_run_id) if parent_run_id else None
+        parent_context = trace.set_span_in_context(parent) if parent else context.get_current()
+        span = tracer.start_span(name, context=parent_context, attributes=attributes)
+        with self._lock:
+            self._spans[run_id] = span
+        return span
+
+    def _end(self, run_id, error=None, **attributes):
+        with self._lock:
+            span = self._spans.pop(run_id, None)
+            self._streaming.discard(run_id)
+        if span is None:
+            return
+        for key, value in attributes.items():
+            if value is not None:
+                span.set_attribute(key, value)
+        if error is not None:
+            span.record_exception(error)
+            span.set_status(trace.Status(trace.StatusCode.ERROR, str(error)))
+        span.end()
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        name = kwargs.get("name") or ""
+        if parent_run_id is None:
+            self._start("rag.chain", run_id, None)
+        else:
+            self._start(STAGE_NAMES.get(name, f"langchain.{name or 'chain'}"), run_id, parent_run_id)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        attributes = {}
+        if isinstance(outputs, str):
+            attributes["rag.output_chars"] = len(outputs)
+        elif hasattr(outputs, "to_string"):
+            attributes["rag.prompt_chars"] = len(outputs.to_string())
+        self._end(run_id, **attributes)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=error)
+
+    def on_retriever_start(self, serialized, query, *, run_id, parent_run_id=None, **kwargs):
+        self._start("rag.retrieval", run_id, parent_run_id)
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        self._end(run_id, **{
+            "rag.documents": len(documents),
+            "rag.context_chars": sum(len(doc.page_content) for doc in documents),
+        })
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=error)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        model = (kwargs.get("invocation_params") or {}).get("model") or (kwargs.get("metadata") or {}).get("ls_model_name")
+        self._start("rag.llm", run_id, parent_run_id, **({"llm.model": model} if model else {}))
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        with self._lock:
+            span = self._spans.get(run_id)
+            first = run_id not in self._streaming
+            self._streaming.add(run_id)
+        if span is not None and first:
+            span.add_event("first_token")
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        usage = dict((response.llm_output or {}).get("token_usage") or {})
+        if not usage:
+            # Streaming responses carry usage on the message instead
+            for generations in response.generations:
+                for generation in generations:
+                    metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                    usage = {
+                        "prompt_tokens": metadata.get("input_tokens"),
+                        "completion_tokens": metadata.get("output_tokens"),
+                        "total_tokens": metadata.get("total_tokens"),
+                    }
+        self._end(run_id, **{
+            "llm.prompt_tokens": usage.get("prompt_tokens"),
+            "llm.completion_tokens": usage.get("completion_tokens"),
+            "llm.total_tokens": usage.get("total_tokens"),
+        })
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=error)
+
+
+callback_handler = SpanCallbackHandler()
+
+
+class TracedRetriever(BaseRetriever):
+    # Splits retrieval into embedding and search spans under the retriever span
+    embeddings: Any
+    search: Callable[[List[float]], List[Document]]
+    k: int = 4
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        parent = callback_handler.span_for(run_manager.run_id)
+        parent_context = trace.set_span_in_context(parent) if parent else context.get_current()
+        with tracer.start_as_current_span("rag.embedding", context=parent_context) as span:
+            vector = self.embeddings.embed_query(query)
+            span.set_attribute("rag.embedding_dim", len(vector))
+        with tracer.start_as_current_span("rag.search", context=parent_context) as span:
+            span.set_attribute("rag.k", self.k)
+            docs = self.search(vector)
+            span.set_attribute("rag.documents", len(docs))
+        return docs
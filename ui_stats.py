@@ -0,0 +1,95 @@
+"""Server and client cost of each Streamlit interaction.
+
+Every widget interaction used to rerun all of app.py and redraw the whole
+page. To check what the chat fragments save:
+
+- RunStats.measure(kind) records wall and CPU time on the script thread
+  for the outermost run: "page" for a full rerun, otherwise the name of
+  the fragment that reran on its own
+- CLIENT_PROBE is a tiny component that watches the page's DOM from its
+  iframe. It reports how long each burst of re-rendering took and how
+  many mutations it made. Streamed answers keep the page busy until the
+  last token, so compare with STREAM_ANSWERS=false or with cached
+  questions
+
+    CHAT_RENDER_STATS=true   show both under the chat
+    CHAT_FRAGMENTS=off       rerun the whole script as before, for comparison
+"""
+import contextlib
+import threading
+import time
+from collections import defaultdict, deque
+
+
+class RunStats:
+    def __init__(self, window=200):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.samples = defaultdict(lambda: deque(maxlen=window))
+
+    @contextlib.contextmanager
+    def measure(self, kind):
+        # Nested measurements (a fragment drawn during a full rerun) are
+        # part of the outer one
+        if getattr(self._local, "active", False):
+            yield
+            return
+        self._local.active = True
+        wall_started = time.perf_counter()
+        cpu_started = time.thread_time()
+        try:
+            yield
+        finally:
+            self._local.active = False
+            sample = (time.perf_counter() - wall_started, time.thread_time() - cpu_started)
+            with self._lock:
+                self.samples[kind].append(sample)
+
+    def stats(self):
+        with self._lock:
+            samples = {kind: list(values) for kind, values in self.samples.items()}
+
+        def percentile(values, p):
+            values = sorted(values)
+            return values[min(len(values) - 1, int(len(values) * p / 100))] * 1000
+
+        return {
+            kind: {
+                "runs": len(values),
+                "wall_ms_p50": percentile([wall for wall, _ in values], 50),
+                "wall_ms_p95": percentile([wall for wall, _ in values], 95),
+                "cpu_ms_p50": percentile([cpu for _, cpu in values], 50),
+                "cpu_ms_p95": percentile([cpu for _, cpu in values], 95),
+            }
+            for kind, values in samples.items() if values
+        }
+
+
+run_stats = RunStats()
+
+# A render burst ends after QUIET ms without DOM changes
+CLIENT_PROBE = """
+<div id="out" style="font: 12px sans-serif; color: #888"></div>
+<script>
+const QUIET = 150;
+const out = document.getElementById("out");
+const durations = [];
+let first = null, last = null, mutations = 0, timer = null;
+new MutationObserver((records) => {
+  last = performance.now();
+  if (first === null) first = last;
+  mutations += records.length;
+  clearTimeout(timer);
+  timer = setTimeout(() => {
+    const ms = last - first;
+    durations.push(ms);
+    const sorted = [...durations].sort((a, b) => a - b);
+    const median = sorted[Math.floor(sorted.length / 2)];
+    out.textContent = `Client re-render ${ms.toFixed(0)} ms, ${mutations} DOM mutations `
+      + `(median ${median.toFixed(0)} ms over ${durations.length})`;
+    console.log("render", {ms, mutations});
+    first = null; mutations = 0;
+  }, QUIET);
+}).observe(window.parent.document.body, {childList: true, subtree: true, characterData: true});
+</script>
+"""